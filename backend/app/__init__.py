@@ -42,6 +42,9 @@ def create_app(config_name=None):
     # Configurar SocketIO con Redis para escalabilidad
     redis_url = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
     
+    # Serializador de paquetes (orjson si está instalado, acepta fragmentos pre-codificados)
+    from app.utils.serialization import SocketIOJSON
+    
     try:
         import socketio as sio
         
@@ -62,7 +65,8 @@ def create_app(config_name=None):
                               ping_timeout=20,        # Más agresivo para detectar desconexiones
                               ping_interval=10,       # Heartbeat más frecuente
                               max_http_buffer_size=4096,  # 4KB límite de mensaje
-                              compression=True)       # Comprimir mensajes automáticamente
+                              compression=True,       # Comprimir mensajes automáticamente
+                              json=SocketIOJSON)
             app.logger.info(f"✅ Socket.IO optimizado con Redis en {redis_host}:{redis_port}")
         else:
             raise Exception("Redis URL no válida")
@@ -78,7 +82,8 @@ def create_app(config_name=None):
                           ping_timeout=30,
                           ping_interval=15,
                           max_http_buffer_size=4096,
-                          compression=True)
+                          compression=True,
+                          json=SocketIOJSON)
         app.logger.info("✅ Socket.IO optimizado en modo memoria")
     
     # Registrar blueprints
@@ -7,6 +7,14 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+def _limit_from_env(name, default):
+    """(intentos, segundos) desde una variable 'intentos/segundos'"""
+    value = os.environ.get(name)
+    if not value:
+        return default
+    attempts, seconds = value.split('/', 1)
+    return (int(attempts), int(seconds))
+
 class Config:
     """Configuración base"""
     # Flask
@@ -26,6 +34,11 @@ class Config:
     GOOGLE_CLIENT_ID = os.environ.get('GOOGLE_CLIENT_ID')
     GOOGLE_CLIENT_SECRET = os.environ.get('GOOGLE_CLIENT_SECRET')
     GOOGLE_DISCOVERY_URL = "https://accounts.google.com/.well-known/openid-configuration"
+    # Google sign-in verification (URLs overridable for a local stand-in key server)
+    GOOGLE_CERTS_URL = os.environ.get('GOOGLE_CERTS_URL', 'https://www.googleapis.com/oauth2/v3/certs')
+    GOOGLE_USERINFO_URL = os.environ.get('GOOGLE_USERINFO_URL', 'https://www.googleapis.com/oauth2/v1/userinfo')
+    GOOGLE_HTTP_TIMEOUT = float(os.environ.get('GOOGLE_HTTP_TIMEOUT', '3'))
+    GOOGLE_TOKEN_MEMO_TTL = 60
     
     # JWT (security-first configuration)
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY') or SECRET_KEY
@@ -61,6 +74,55 @@ class Config:
     # Pagination
     ITEMS_PER_PAGE = 20
     
+    # Message retention (flask message-retention)
+    MESSAGE_SOFT_DELETE_GRACE_DAYS = int(os.environ.get('MESSAGE_SOFT_DELETE_GRACE_DAYS', '30'))
+    MESSAGE_ARCHIVE_AFTER_DAYS = int(os.environ.get('MESSAGE_ARCHIVE_AFTER_DAYS', '365'))
+    MESSAGE_RETENTION_BATCH_SIZE = 500
+    MESSAGE_ARCHIVE_FOLDER = os.environ.get('MESSAGE_ARCHIVE_FOLDER', 'archive/messages')
+    # Durable archive: S3 / S3-compatible bucket, or a local folder on a persistent volume.
+    # Without one, old messages are not archived (hot rows are never deleted)
+    MESSAGE_ARCHIVE_BUCKET = os.environ.get('MESSAGE_ARCHIVE_BUCKET')
+    MESSAGE_ARCHIVE_PREFIX = os.environ.get('MESSAGE_ARCHIVE_PREFIX', 'messages')
+    MESSAGE_ARCHIVE_ENDPOINT_URL = os.environ.get('MESSAGE_ARCHIVE_ENDPOINT_URL')
+    MESSAGE_ARCHIVE_LOCAL_DURABLE = os.environ.get('MESSAGE_ARCHIVE_LOCAL_DURABLE', 'false').lower() == 'true'
+    
+    # Delta sync
+    SYNC_MAX_MESSAGES = int(os.environ.get('SYNC_MAX_MESSAGES', '500'))
+    SYNC_MAX_READS = int(os.environ.get('SYNC_MAX_READS', '1000'))
+    SYNC_MAX_CONVERSATIONS = int(os.environ.get('SYNC_MAX_CONVERSATIONS', '1000'))
+    SYNC_SAFETY_WINDOW_MS = 5000  # Re-send recent messages committed after their ULID was generated
+    
+    # Realtime: binary Socket.IO frames for clients that opt in (auth {'binary': true})
+    REALTIME_BINARY_FRAMES = os.environ.get('REALTIME_BINARY_FRAMES', 'false').lower() == 'true'
+    
+    # Realtime dispatch: 'direct' emits from the request thread, 'dispatcher'
+    # only appends to the events:realtime stream and `flask realtime-dispatcher` emits
+    REALTIME_DISPATCH_MODE = os.environ.get('REALTIME_DISPATCH_MODE', 'direct')
+    REALTIME_DISPATCH_BATCH_SIZE = 200
+    
+    # Durable event streams (approximate per-stream length cap)
+    EVENT_STREAM_MAXLEN = int(os.environ.get('EVENT_STREAM_MAXLEN', '100000'))
+    
+    # Notifications: `flask notification-worker` writes rows in bulk and sends
+    # push in batches per provider through PUSH_FCM_URL (unset: push skipped;
+    # scripts/fake_push_server.py for local tests). Failed sends are retried
+    # with exponential backoff up to NOTIFICATION_MAX_ATTEMPTS
+    PUSH_FCM_URL = os.environ.get('PUSH_FCM_URL')
+    PUSH_BATCH_SIZE = 500
+    PUSH_TIMEOUT = float(os.environ.get('PUSH_TIMEOUT', '5'))
+    NOTIFICATION_MAX_ATTEMPTS = 5
+    NOTIFICATION_RETRY_BASE_SECONDS = 30
+    NOTIFICATION_RETRY_MAX_SECONDS = 3600
+    NOTIFICATION_STALE_PENDING_SECONDS = 120  # Pendientes sin enviar (worker caído): las retoma retry_due
+    
+    # WebSocket admission control: (attempts, per seconds) token buckets per
+    # worker, synced to Redis every WS_ADMISSION_SYNC_INTERVAL seconds
+    # (env override, e.g. WS_CONNECT_IP_LIMIT=5000/60 for scripts/load_test_chat.py)
+    WS_CONNECT_IP_LIMIT = _limit_from_env('WS_CONNECT_IP_LIMIT', (20, 60))
+    WS_CONNECT_USER_LIMIT = _limit_from_env('WS_CONNECT_USER_LIMIT', (10, 60))
+    WS_MAX_SOCKETS_PER_WORKER = int(os.environ.get('WS_MAX_SOCKETS_PER_WORKER', '5000'))
+    WS_ADMISSION_SYNC_INTERVAL = 5
+    
     # Match scoring weights
     MATCH_WEIGHTS = {
         'schedule_overlap': 0.3,
@@ -82,6 +144,10 @@ class DevelopmentConfig(Config):
     STRICT_JWT_VALIDATION = False
     ENABLE_TOKEN_BLACKLIST = False
     REQUIRE_HTTPS = False
+    
+    # DEV: Permissive admission (hot reloads reconnect constantly)
+    WS_CONNECT_IP_LIMIT = _limit_from_env('WS_CONNECT_IP_LIMIT', (100, 60))
+    WS_CONNECT_USER_LIMIT = _limit_from_env('WS_CONNECT_USER_LIMIT', (100, 60))
 
 class ProductionConfig(Config):
     """Configuración de producción"""
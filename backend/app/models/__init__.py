@@ -6,8 +6,8 @@ from app.models.dog import Dog
 from app.models.park import Park
 from app.models.visit import Visit
 from app.models.match import Match
-from app.models.message import Message, Conversation, MessageRead, UserBlock
-from app.models.notification import Notification, NotificationPreference
+from app.models.message import Message, Conversation, ConversationTombstone, MessageRead, UserBlock
+from app.models.notification import Notification, NotificationPreference, NotificationDelivery
 
 __all__ = [
     'User',
@@ -19,8 +19,10 @@ __all__ = [
     'Match',
     'Message',
     'Conversation',
+    'ConversationTombstone',
     'MessageRead',
     'UserBlock',
     'Notification',
-    'NotificationPreference'
+    'NotificationPreference',
+    'NotificationDelivery'
 ]
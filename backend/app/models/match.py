@@ -73,4 +73,10 @@ class Match(db.Model):
         db.session.add(match)
         db.session.commit()
         
+        if match.is_mutual:
+            from app.utils.presence_fanout import presence_audience
+            from app.utils.conversation_list_cache import conversation_list_cache
+            presence_audience.invalidate(user_id, matched_user_id)
+            conversation_list_cache.bump(user_id, matched_user_id)
+        
         return match, match.is_mutual, conversation
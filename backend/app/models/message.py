@@ -2,6 +2,7 @@
 Modelo de Mensaje entre usuarios con ULID y optimizaciones
 """
 from datetime import datetime
+from sqlalchemy import DDL, event
 from app import db
 from app.utils.message_ids import generate_message_id
 
@@ -47,8 +48,8 @@ class Message(db.Model):
     is_deleted = db.Column(db.Boolean, default=False, nullable=False, index=True)
     deleted_at = db.Column(db.DateTime)
     
-    # Client temp ID for idempotency
-    client_temp_id = db.Column(db.String(36), unique=True, nullable=True, index=True)
+    # Client temp ID for idempotency (unique per sender, see __table_args__)
+    client_temp_id = db.Column(db.String(36), nullable=True)
     
     # Database indexes for optimized queries
     __table_args__ = (
@@ -67,6 +68,9 @@ class Message(db.Model):
         
         # Active messages index
         db.Index('ix_messages_active', 'is_deleted', 'created_at'),
+        
+        # Idempotency backstop: temp ids are only unique per sender
+        db.UniqueConstraint('sender_id', 'client_temp_id', name='uq_messages_sender_temp_id'),
     )
     
     def to_dict(self):
@@ -87,15 +91,61 @@ class Message(db.Model):
     
     def to_dict_minimal(self):
         """Minimal dictionary for performance-critical operations"""
+        created_at = self.created_at.isoformat() if self.created_at else None
         return {
             'id': self.id,
             'sender_id': self.sender_id,
             'text': self.text,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'time': self.created_at.strftime('%H:%M') if self.created_at else None,
+            'created_at': created_at,
+            'time': created_at[11:16] if created_at else None,  # HH:MM without strftime
             'is_read': self.is_read
         }
     
+    def to_json_minimal(self):
+        """
+        to_dict_minimal encoded once (RawJSON), reused by every emit,
+        publish and cache entry of this message instance
+        """
+        from app.utils.serialization import RawJSON, dumps
+        
+        cache_key = (self.text, self.is_read)
+        cached = getattr(self, '_encoded_minimal', None)
+        if cached is None or cached[0] != cache_key:
+            cached = (cache_key, RawJSON(dumps(self.to_dict_minimal())))
+            self._encoded_minimal = cached
+        return cached[1]
+    
+    def to_archive_dict(self):
+        """Full record for cold storage (message archive segments)"""
+        return {
+            'id': self.id,
+            'conversation_id': self.conversation_id,
+            'sender_id': self.sender_id,
+            'receiver_id': self.receiver_id,
+            'text': self.text,
+            'ciphertext': self.ciphertext,
+            'nonce': self.nonce,
+            'tag': self.tag,
+            'key_version': self.key_version,
+            'algorithm': self.algorithm,
+            'metadata_json': self.metadata_json,
+            'message_type': self.message_type,
+            'is_read': self.is_read,
+            'read_at': self.read_at.isoformat() if self.read_at else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'client_temp_id': self.client_temp_id
+        }
+    
+    @classmethod
+    def from_archive(cls, record):
+        """Transient (never persisted) message rebuilt from an archive record"""
+        data = dict(record)
+        for field in ('read_at', 'created_at', 'updated_at'):
+            if data.get(field):
+                data[field] = datetime.fromisoformat(data[field])
+        return cls(is_deleted=False, **data)
+    
     def mark_as_read(self):
         """Mark message as read"""
         if not self.is_read:
@@ -110,9 +160,11 @@ class Message(db.Model):
         self.deleted_at = datetime.utcnow()
     
     @classmethod
-    def get_conversation_messages(cls, conversation_id=None, user1_id=None, user2_id=None, limit=50, before_id=None):
+    def get_conversation_messages(cls, conversation_id=None, user1_id=None, user2_id=None, limit=50, before_id=None,
+                                  has_archive=False):
         """
-        Get conversation messages - supports both new conversation_id and legacy user IDs
+        Get conversation messages - supports both new conversation_id and legacy user IDs.
+        has_archive (Conversation.has_archive): continue into the message archive past the hot rows
         """
         if conversation_id:
             # New schema - direct conversation query
@@ -133,7 +185,21 @@ class Message(db.Model):
         if before_id:
             query = query.filter(cls.id < before_id)
         
-        return query.order_by(cls.id.desc()).limit(limit).all()
+        messages = query.order_by(cls.id.desc()).limit(limit).all()
+        
+        # Past the hot window: continue with archived history (cold segments)
+        if conversation_id and has_archive and len(messages) < limit:
+            from app.utils.message_archive import message_archive
+            
+            archive_cursor = messages[-1].id if messages else before_id
+            archived = message_archive.read_page(
+                conversation_id,
+                before_id=archive_cursor,
+                limit=limit - len(messages)
+            )
+            messages.extend(cls.from_archive(record) for record in archived)
+        
+        return messages
     
     @classmethod
     def get_unread_count(cls, receiver_id, sender_id=None):
@@ -164,6 +230,35 @@ class Message(db.Model):
         
         return updated_count
 
+# Full-text search index, maintained by the database on insert/update.
+# PostgreSQL: tsvector column + GIN index filled by a trigger.
+# SQLite (TestingConfig): external-content FTS5 shadow table synced by triggers.
+# Existing PostgreSQL databases: migrations/add_message_search_index.sql
+MESSAGE_SEARCH_DDL = {
+    'postgresql': [
+        "ALTER TABLE messages ADD COLUMN IF NOT EXISTS search_vector tsvector",
+        "CREATE INDEX IF NOT EXISTS ix_messages_search_vector ON messages USING GIN (search_vector)",
+        "DROP TRIGGER IF EXISTS messages_search_vector_update ON messages",
+        "CREATE TRIGGER messages_search_vector_update BEFORE INSERT OR UPDATE OF text ON messages "
+        "FOR EACH ROW EXECUTE FUNCTION tsvector_update_trigger(search_vector, 'pg_catalog.simple', text)",
+    ],
+    'sqlite': [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+        "text, content='messages', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2')",
+        "CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages BEGIN "
+        "INSERT INTO messages_fts(rowid, text) VALUES (new.rowid, new.text); END",
+        "CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages BEGIN "
+        "INSERT INTO messages_fts(messages_fts, rowid, text) VALUES ('delete', old.rowid, old.text); END",
+        "CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE OF text ON messages BEGIN "
+        "INSERT INTO messages_fts(messages_fts, rowid, text) VALUES ('delete', old.rowid, old.text); "
+        "INSERT INTO messages_fts(rowid, text) VALUES (new.rowid, new.text); END",
+    ],
+}
+
+for _dialect, _statements in MESSAGE_SEARCH_DDL.items():
+    for _statement in _statements:
+        event.listen(Message.__table__, 'after_create', DDL(_statement).execute_if(dialect=_dialect))
+
 class Conversation(db.Model):
     """Modelo de conversación 1:1 entre usuarios con match"""
     __tablename__ = 'conversations'
@@ -186,6 +281,9 @@ class Conversation(db.Model):
     is_deleted = db.Column(db.Boolean, default=False, nullable=False, index=True)
     deleted_at = db.Column(db.DateTime)
     
+    # Set by retention once older history lives in the message archive
+    has_archive = db.Column(db.Boolean, default=False, server_default=db.false(), nullable=False)
+    
     # Database indexes and constraints for 1:1 conversations
     __table_args__ = (
         # Ensure 1:1 uniqueness with expression-based unique constraint
@@ -225,9 +323,17 @@ class Conversation(db.Model):
         self.updated_at = datetime.utcnow()
     
     def soft_delete(self):
-        """Soft delete conversation"""
+        """Soft delete conversation (caches are invalidated when the caller commits)"""
+        from app.utils.after_commit import after_commit
+        from app.utils.conversation_cache import conversation_cache
+        from app.utils.presence_fanout import presence_audience
+        from app.utils.conversation_list_cache import conversation_list_cache
+        
         self.is_deleted = True
         self.deleted_at = datetime.utcnow()
+        after_commit(conversation_cache.invalidate, self.id)
+        after_commit(presence_audience.invalidate, self.user1_id, self.user2_id)
+        after_commit(conversation_list_cache.bump, self.user1_id, self.user2_id)
     
     @classmethod
     def get_or_create_conversation(cls, user1_id, user2_id):
@@ -289,15 +395,16 @@ class MessageRead(db.Model):
     
     @classmethod
     def update_read_watermark(cls, conversation_id, user_id, message_id):
-        """Update or create read watermark for user in conversation"""
+        """Update or create read watermark for user in conversation (never moves backwards)"""
         read_record = cls.query.filter(
             cls.conversation_id == conversation_id,
             cls.user_id == user_id
         ).first()
         
         if read_record:
-            read_record.up_to_message_id = message_id
-            read_record.updated_at = datetime.utcnow()
+            if message_id > read_record.up_to_message_id:  # ULID comparison
+                read_record.up_to_message_id = message_id
+                read_record.updated_at = datetime.utcnow()
         else:
             read_record = cls(
                 conversation_id=conversation_id,
@@ -308,6 +415,47 @@ class MessageRead(db.Model):
         
         return read_record
     
+    @classmethod
+    def upsert_watermarks(cls, watermarks):
+        """
+        Batched monotonic upsert of read watermarks.
+        watermarks: list of {'conversation_id', 'user_id', 'up_to_message_id'}
+        Rows only move forward: an older up_to_message_id is ignored.
+        Returns: set of (conversation_id, user_id) whose watermark was written
+        """
+        if not watermarks:
+            return set()
+        
+        dialect = db.engine.dialect.name
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        elif dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            written = set()
+            for watermark in watermarks:
+                read_record = cls.update_read_watermark(
+                    watermark['conversation_id'], watermark['user_id'], watermark['up_to_message_id']
+                )
+                if read_record.up_to_message_id == watermark['up_to_message_id']:
+                    written.add((watermark['conversation_id'], watermark['user_id']))
+            return written
+        
+        now = datetime.utcnow()
+        stmt = insert(cls.__table__).values([
+            dict(watermark, updated_at=now) for watermark in watermarks
+        ])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['conversation_id', 'user_id'],
+            set_={
+                'up_to_message_id': stmt.excluded.up_to_message_id,
+                'updated_at': stmt.excluded.updated_at
+            },
+            where=cls.__table__.c.up_to_message_id < stmt.excluded.up_to_message_id
+        ).returning(cls.__table__.c.conversation_id, cls.__table__.c.user_id)
+        # Rows rejected by the WHERE are not returned
+        return set(tuple(row) for row in db.session.execute(stmt))
+    
     @classmethod
     def get_unread_count(cls, conversation_id, user_id):
         """Get count of unread messages for user in conversation"""
@@ -379,4 +527,32 @@ class UserBlock(db.Model):
             reason=reason
         )
         db.session.add(block)
+        
+        from app.utils.after_commit import after_commit
+        from app.utils.presence_fanout import presence_audience
+        from app.utils.conversation_list_cache import conversation_list_cache
+        after_commit(presence_audience.invalidate, blocker_id, blocked_id)
+        after_commit(conversation_list_cache.bump, blocker_id, blocked_id)
         return block, True
+
+
+class ConversationTombstone(db.Model):
+    """Conversación borrada físicamente (unmatch): /sync la informa como eliminada"""
+    __tablename__ = 'conversation_tombstones'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    # Sin FK: la conversación (y quizás los usuarios) ya no existen
+    conversation_id = db.Column(db.Integer, nullable=False)
+    user1_id = db.Column(db.Integer, nullable=False, index=True)
+    user2_id = db.Column(db.Integer, nullable=False, index=True)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    
+    @classmethod
+    def record(cls, conversation):
+        """Registrar el borrado en la misma transacción que el delete"""
+        db.session.add(cls(
+            conversation_id=conversation.id,
+            user1_id=conversation.user1_id,
+            user2_id=conversation.user2_id,
+            deleted_at=datetime.utcnow()
+        ))
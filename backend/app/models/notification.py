@@ -19,8 +19,15 @@ class Notification(db.Model):
     is_read = db.Column(db.Boolean, default=False)
     read_at = db.Column(db.DateTime)
     
+    # Entrada del stream que la originó ("<stream>:<entry id>"), para no duplicar al reprocesar
+    source = db.Column(db.String(64))
+    
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        db.UniqueConstraint('source', 'user_id', 'type', name='uq_notifications_source'),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -55,4 +62,42 @@ class NotificationPreference(db.Model):
     quiet_hours_end = db.Column(db.Time)
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
\ No newline at end of file
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class NotificationDelivery(db.Model):
+    """Entrega de una notificación por un canal (seguimiento y reintentos)"""
+    __tablename__ = 'notification_deliveries'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    notification_id = db.Column(db.Integer, db.ForeignKey('notifications.id', ondelete='CASCADE'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    
+    channel = db.Column(db.String(20), nullable=False)   # push, email, sms
+    provider = db.Column(db.String(20), nullable=False)  # fcm, email, sms
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, retrying, sent, failed, skipped
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime)
+    last_error = db.Column(db.String(200))
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    delivered_at = db.Column(db.DateTime)
+    
+    notification = db.relationship('Notification', backref=db.backref('deliveries', lazy='dynamic'))
+    
+    __table_args__ = (
+        # Vencidas: status IN ('pending', 'retrying') AND next_attempt_at <= now
+        db.Index('ix_notification_deliveries_due', 'status', 'next_attempt_at'),
+    )
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'notification_id': self.notification_id,
+            'channel': self.channel,
+            'provider': self.provider,
+            'status': self.status,
+            'attempts': self.attempts,
+            'last_error': self.last_error,
+            'next_attempt_at': self.next_attempt_at.isoformat() if self.next_attempt_at else None,
+            'delivered_at': self.delivered_at.isoformat() if self.delivered_at else None
+        }
@@ -78,6 +78,7 @@ class User(db.Model):
     # Relaciones
     dog = db.relationship('Dog', backref='owner', uselist=False, cascade='all, delete-orphan')
     visits = db.relationship('Visit', backref='user', lazy='dynamic', cascade='all, delete-orphan')
+    preferences = db.relationship('UserPreference', uselist=False, cascade='all, delete-orphan')
     
     def to_dict(self, include_private=False):
         data = {
@@ -1,10 +1,12 @@
 """
 Rutas de administración con panel completo
 """
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from app import db
 from app.models import User, Park, Visit, Match, UserRole
 from app.utils.auth import admin_required
+from app.utils.auth_cache import user_status_cache
+from app.utils.conversation_list_cache import conversation_list_cache
 from sqlalchemy import func, desc
 from datetime import datetime, timedelta
 
@@ -193,9 +195,12 @@ def ban_user(user_id):
             message = f'User {user.email} has been unbanned'
         
         db.session.commit()
+        user_status_cache.invalidate(user_id)
+        # Un usuario baneado deja de aparecer en la lista de sus contactos
+        conversation_list_cache.bump(*conversation_list_cache.partner_ids(user_id))
         
         # Log action
-        current_app.logger.info(f"Admin action: {message} by admin {request.current_user.email}")
+        current_app.logger.info(f"Admin action: {message} by admin {request.current_user_id}")
         
         return jsonify({
             'message': message,
@@ -369,4 +374,26 @@ def get_reports():
         
     except Exception as e:
         current_app.logger.error(f"Get reports error: {str(e)}")
-        return jsonify({'error': 'Internal server error'}), 500
\ No newline at end of file
+        return jsonify({'error': 'Internal server error'}), 500
+
+@admin_bp.route('/realtime/stats', methods=['GET'])
+@admin_required
+def get_realtime_stats():
+    """Obtener contadores de fan-out de eventos en tiempo real"""
+    from app.utils.realtime_delivery import realtime_delivery
+    from app.utils.typing_engine import typing_engine
+    from app.utils.read_receipts import read_receipts
+    from app.utils.presence import presence
+    from app.utils.presence_fanout import presence_fanout
+    from app.utils.admission import admission
+    from app.utils.room_registry import room_registry
+    
+    return jsonify({
+        'fanout': realtime_delivery.get_stats(),
+        'typing': typing_engine.get_stats(),
+        'read_receipts': read_receipts.get_stats(),
+        'presence': presence.get_stats(),
+        'presence_fanout': presence_fanout.get_stats(),
+        'admission': admission.get_stats(),
+        'rooms': room_registry.get_stats()
+    }), 200
@@ -5,6 +5,7 @@ from flask import Blueprint, request, jsonify, current_app
 from app import db
 from app.models import User
 from app.utils.auth import verify_google_token, generate_tokens, login_required
+from app.utils.current_user import load_current_user
 from datetime import datetime
 
 auth_bp = Blueprint('auth', __name__)
@@ -81,7 +82,7 @@ def google_login():
 def get_current_user():
     """Obtener usuario actual"""
     try:
-        user = User.query.get(request.current_user_id)
+        user = load_current_user()
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
@@ -147,7 +148,7 @@ def refresh_token():
 def logout():
     """Cerrar sesión"""
     try:
-        user = User.query.get(request.current_user_id)
+        user = load_current_user()
         if user:
             user.is_online = False
             db.session.commit()
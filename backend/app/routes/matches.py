@@ -6,8 +6,12 @@ from sqlalchemy import and_, or_
 from app import db
 from app.models import Match, User
 from app.utils.auth import login_required
+from app.utils.current_user import load_current_user
 from app.services.match_service import MatchService
 from app.services.notification_service import NotificationService
+from app.utils.conversation_cache import conversation_cache
+from app.utils.presence_fanout import presence_audience
+from app.utils.conversation_list_cache import conversation_list_cache
 from datetime import datetime
 
 matches_bp = Blueprint('matches', __name__)
@@ -18,7 +22,7 @@ def get_match_suggestions():
     """Obtener sugerencias de match"""
     try:
         # Verificar que el usuario permite matching
-        user = User.query.get(request.current_user_id)
+        user = load_current_user()
         if not user or not user.allow_matching:
             return jsonify({'error': 'Matching is disabled for your account'}), 403
         
@@ -172,6 +176,7 @@ def unmatch(match_id):
             return jsonify({'error': 'Match not found'}), 404
         
         # Si era mutuo, también eliminar el match inverso
+        conversation = None
         if match.is_mutual:
             reverse_match = Match.query.filter_by(
                 user_id=match.matched_user_id,
@@ -182,7 +187,7 @@ def unmatch(match_id):
                 db.session.delete(reverse_match)
             
             # También eliminar la conversación si existe
-            from app.models import Conversation
+            from app.models import Conversation, ConversationTombstone
             conversation = Conversation.query.filter(
                 or_(
                     and_(Conversation.user1_id == request.current_user_id,
@@ -193,11 +198,18 @@ def unmatch(match_id):
             ).first()
             
             if conversation:
+                # /sync informa el borrado a los clientes que reconectan
+                ConversationTombstone.record(conversation)
                 db.session.delete(conversation)
         
         db.session.delete(match)
         db.session.commit()
         
+        if conversation:
+            conversation_cache.invalidate(conversation.id)
+        presence_audience.invalidate(request.current_user_id, match.matched_user_id)
+        conversation_list_cache.bump(request.current_user_id, match.matched_user_id)
+        
         return jsonify({'message': 'Unmatched successfully'}), 200
         
     except Exception as e:
@@ -2,14 +2,18 @@
 Rutas de mensajes y chat
 """
 import os
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, Response
 from app import db, socketio
 from app.models import Message, Conversation, Match, User, MessageRead, UserBlock
 from app.utils.auth import login_required
-from app.services.notification_service import NotificationService
-from flask_socketio import emit, join_room, leave_room
+from app.utils.current_user import load_current_user
+from app.services.notification_events import NotificationEvents
+from app.services.message_search import MessageSearchService
+from app.services.message_sync import MessageSyncService
+from flask_socketio import emit
 from datetime import datetime
 from sqlalchemy import or_, and_
+from sqlalchemy.exc import IntegrityError
 
 # Import new security and performance utilities
 from app.utils.redis_client import redis_client
@@ -20,9 +24,23 @@ from app.utils.rate_limiter import (
     check_typing_rate_limit,
     check_websocket_event_rate_limit
 )
-from app.utils.sanitizer import sanitizer, validate_message_data
+from app.utils.sanitizer import sanitizer, validate_message_data, validate_temp_id
 from app.utils.message_ids import generate_message_id
 from app.utils.logger import structured_logger, log_route_errors, log_websocket_errors
+from app.utils.realtime_delivery import realtime_delivery, user_room, conversation_room
+from app.utils.idempotency import message_idempotency, build_message_ack, socket_ack
+from app.utils.conversation_cache import conversation_cache
+from app.utils.typing_engine import typing_engine, START as TYPING_START
+from app.utils.background import PeriodicTask
+from app.utils.read_receipts import read_receipts
+from app.utils.presence import presence
+from app.utils.presence_fanout import presence_fanout
+from app.utils.conversation_list_cache import conversation_list_cache
+from app.utils.admission import admission
+from app.utils.socket_identity import socket_login_required, remember_socket_user, get_socket_identity
+from app.utils.auth_cache import user_status_cache
+from app.utils.jwt_validator import validate_websocket_token
+from app.utils import serialization
 
 messages_bp = Blueprint('messages', __name__)
 
@@ -33,78 +51,26 @@ messages_bp = Blueprint('messages', __name__)
 def get_conversations():
     """Obtener lista de conversaciones del usuario - solo con matches"""
     try:
-        # Verificar que el usuario existe
-        current_user = User.query.get(request.current_user_id)
-        if not current_user:
-            return jsonify({'error': 'User not found'}), 404
-        
-        # Obtener conversaciones del usuario
-        conversations = Conversation.get_user_conversations(request.current_user_id)
-        
-        conv_list = []
-        
-        # Batch query for users to reduce database hits
-        user_ids = []
-        for conv in conversations:
-            other_user_id = conv.user2_id if conv.user1_id == request.current_user_id else conv.user1_id
-            user_ids.append(other_user_id)
-        
-        # Get all users in one query
-        users_dict = {}
-        if user_ids:
-            users = User.query.filter(User.id.in_(user_ids), User.is_active == True).all()
-            users_dict = {user.id: user for user in users}
-        
-        # Build conversation list efficiently
-        for conv in conversations:
-            other_user_id = conv.user2_id if conv.user1_id == request.current_user_id else conv.user1_id
-            other_user = users_dict.get(other_user_id)
+        # Versioned cache: between changes a request is one Redis MGET
+        version, etag, body = conversation_list_cache.lookup(request.current_user_id)
+        
+        if body is None:
+            # Verificar que el usuario existe
+            current_user = load_current_user()
+            if not current_user:
+                return jsonify({'error': 'User not found'}), 404
             
-            if not other_user:
-                continue
-            
-            # Check online status from Redis (faster than DB)
-            is_online = redis_client.is_user_online(other_user_id)
-            
-            # Get last message text efficiently
-            last_message = None
-            if conv.last_message_id:
-                last_msg = Message.query.get(conv.last_message_id)
-                if last_msg and not last_msg.is_deleted:
-                    last_message = last_msg.text[:50] + '...' if len(last_msg.text) > 50 else last_msg.text
-            
-            # Use new watermark-based unread count
-            unread_count = MessageRead.get_unread_count(conv.id, request.current_user_id)
-            
-            # Verificar si hay match activo (requerimiento DM)
-            has_match = Match.query.filter(
-                Match.user_id == request.current_user_id,
-                Match.matched_user_id == other_user_id,
-                Match.is_mutual == True
-            ).first() is not None
-            
-            # Solo incluir conversaciones con match mutuo activo
-            if not has_match:
-                continue
-            
-            conv_data = {
-                'chat_id': conv.id,
-                'user': {
-                    'id': other_user.id,
-                    'nickname': other_user.nickname,
-                    'avatar': other_user.avatar_url,
-                    'is_online': is_online  # From Redis cache
-                },
-                'last_message': last_message,
-                'last_message_time': conv.last_message_at.isoformat() if conv.last_message_at else None,
-                'unread': unread_count
-            }
-            conv_list.append(conv_data)
+            body = serialization.dumps(_build_conversation_list(request.current_user_id))
+            etag = conversation_list_cache.store(request.current_user_id, version, body)
         
-        return jsonify({
-            'conversations': conv_list,
-            'total': len(conv_list)
-        }), 200
+        if request.if_none_match and request.if_none_match.contains(etag.strip('"')):
+            response = Response(status=304)
+        else:
+            response = Response(body, status=200, mimetype='application/json')
+        
+        response.headers['ETag'] = etag
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
         
     except Exception as e:
         error_id = structured_logger.log_error(
@@ -129,6 +95,78 @@ def get_conversations():
                 'error_id': error_id
             }), 500
 
+def _build_conversation_list(user_id):
+    """Construir la respuesta de la lista de conversaciones (sin cache)"""
+    # Obtener conversaciones del usuario
+    conversations = Conversation.get_user_conversations(user_id)
+    
+    conv_list = []
+    
+    # Batch query for users to reduce database hits
+    user_ids = []
+    for conv in conversations:
+        other_user_id = conv.user2_id if conv.user1_id == user_id else conv.user1_id
+        user_ids.append(other_user_id)
+    
+    # Get all users in one query
+    users_dict = {}
+    if user_ids:
+        users = User.query.filter(User.id.in_(user_ids), User.is_active == True).all()
+        users_dict = {user.id: user for user in users}
+    
+    # Presence for every conversation in one Redis round trip
+    online_status = presence.are_online(user_ids)
+    
+    # Build conversation list efficiently
+    for conv in conversations:
+        other_user_id = conv.user2_id if conv.user1_id == user_id else conv.user1_id
+        other_user = users_dict.get(other_user_id)
+        
+        if not other_user:
+            continue
+        
+        is_online = online_status.get(other_user_id, False)
+        
+        # Get last message text efficiently
+        last_message = None
+        if conv.last_message_id:
+            last_msg = Message.query.get(conv.last_message_id)
+            if last_msg and not last_msg.is_deleted:
+                last_message = last_msg.text[:50] + '...' if len(last_msg.text) > 50 else last_msg.text
+        
+        # Use new watermark-based unread count
+        unread_count = MessageRead.get_unread_count(conv.id, user_id)
+        
+        # Verificar si hay match activo (requerimiento DM)
+        has_match = Match.query.filter(
+            Match.user_id == user_id,
+            Match.matched_user_id == other_user_id,
+            Match.is_mutual == True
+        ).first() is not None
+        
+        # Solo incluir conversaciones con match mutuo activo
+        if not has_match:
+            continue
+        
+        conv_data = {
+            'chat_id': conv.id,
+            'user': {
+                'id': other_user.id,
+                'nickname': other_user.nickname,
+                'avatar': other_user.avatar_url,
+                'is_online': is_online  # From Redis cache
+            },
+            'last_message': last_message,
+            'last_message_time': conv.last_message_at.isoformat() if conv.last_message_at else None,
+            'unread': unread_count
+        }
+        conv_list.append(conv_data)
+    
+    return {
+        'conversations': conv_list,
+        'total': len(conv_list)
+    }
+
 @messages_bp.route('/chats/<int:chat_id>/messages', methods=['GET'])
 @login_required
 @rate_limit_api
@@ -169,7 +207,8 @@ def get_chat_messages(chat_id):
         messages = Message.get_conversation_messages(
             conversation_id=chat_id,
             limit=limit,
-            before_id=before_id
+            before_id=before_id,
+            has_archive=conversation.has_archive
         )
         
         # Marcar mensajes como leídos usando watermark
@@ -178,13 +217,14 @@ def get_chat_messages(chat_id):
             latest_message = messages[0]  # messages are ordered by newest first
             MessageRead.update_read_watermark(chat_id, request.current_user_id, latest_message.id)
             db.session.commit()
+            conversation_list_cache.bump(request.current_user_id)
             
-            # Notify via Redis Pub/Sub for real-time updates
-            redis_client.publish('messages_read', {
+            # Real-time read notification (published or emitted per dispatch mode)
+            realtime_delivery.dispatch('messages_read', 'messages_read', {
                 'chat_id': chat_id,
                 'reader_id': request.current_user_id,
-                'other_user_id': other_user_id
-            })
+                'timestamp': datetime.utcnow().isoformat()
+            }, [user_room(other_user_id)])
         
         # Use minimal dict for better performance
         messages_data = [msg.to_dict_minimal() for msg in reversed(messages)]
@@ -210,6 +250,54 @@ def get_chat_messages(chat_id):
         else:
             return jsonify({'error': 'Internal server error'}), 500
 
+@messages_bp.route('/search', methods=['GET'])
+@login_required
+@rate_limit_api
+@log_route_errors
+def search_messages():
+    """Buscar en el historial de las conversaciones del usuario"""
+    cursor = None
+    if request.args.get('cursor'):
+        cursor = MessageSearchService.parse_cursor(request.args['cursor'])  # (rank, id) cursor
+        if cursor is None:
+            return jsonify({'error': 'Invalid cursor'}), 400
+    limit = min(request.args.get('limit', 20, type=int), 50)
+    
+    results, pagination = MessageSearchService.search(
+        request.current_user_id,
+        request.args.get('q', ''),
+        cursor=cursor,
+        limit=limit
+    )
+    
+    if results is None:
+        return jsonify({'error': 'Search query must be at least 2 characters'}), 400
+    
+    return jsonify({
+        'results': results,
+        'pagination': pagination
+    }), 200
+
+@messages_bp.route('/sync', methods=['GET'])
+@login_required
+@rate_limit_api
+@log_route_errors
+def sync_messages():
+    """Cambios desde un cursor ULID en todas las conversaciones (respuesta streameada)"""
+    since = MessageSyncService.parse_cursor(request.args.get('since'))
+    if not since:
+        return jsonify({'error': 'Valid since cursor required'}), 400
+    
+    limit = request.args.get('limit', type=int)
+    if limit is not None and limit < 1:
+        return jsonify({'error': 'Invalid limit'}), 400
+    
+    # Las partes se arman antes de responder: un error no deja un 200 truncado
+    return Response(
+        MessageSyncService.stream(request.current_user_id, since, limit),
+        mimetype='application/json'
+    )
+
 @messages_bp.route('/chats/<int:chat_id>/messages', methods=['POST'])
 @login_required
 @rate_limit_messages
@@ -221,31 +309,6 @@ def send_message(chat_id):
         if not check_message_rate_limit(request.current_user_id):
             return jsonify({'error': 'Rate limit exceeded'}), 429
         
-        # Verificar que el usuario es parte de la conversación
-        conversation = Conversation.query.get(chat_id)
-        if not conversation or conversation.is_deleted:
-            return jsonify({'error': 'Chat not found'}), 404
-        
-        if not conversation.has_user(request.current_user_id):
-            return jsonify({'error': 'Unauthorized'}), 403
-        
-        # Determinar el otro usuario
-        other_user_id = conversation.get_other_user_id(request.current_user_id)
-        
-        # Verificar match mutuo activo - REQUERIDO para DM
-        has_match = Match.query.filter(
-            Match.user_id == request.current_user_id,
-            Match.matched_user_id == other_user_id,
-            Match.is_mutual == True
-        ).first() is not None
-        
-        if not has_match:
-            return jsonify({'error': 'No mutual match exists - DM requires active match'}), 403
-        
-        # Verificar que no hay bloqueos
-        if UserBlock.is_blocked(request.current_user_id, other_user_id):
-            return jsonify({'error': 'Cannot send message - user is blocked'}), 403
-        
         # Validar y sanitizar datos de entrada
         data = request.get_json()
         if not data:
@@ -260,68 +323,125 @@ def send_message(chat_id):
         if warnings and os.environ.get('FLASK_ENV', 'development') == 'development':
             current_app.logger.warning(f"Message validation warnings: {warnings}")
         
-        # Generate ULID for message
-        message_id = generate_message_id()
+        # Idempotencia: un reintento cuesta una sola operación en Redis
+        temp_id = validated_data.get('temp_id')
+        if temp_id:
+            claimed, cached_ack = message_idempotency.claim(request.current_user_id, temp_id)
+            if not claimed:
+                if cached_ack:
+                    return jsonify({'message': cached_ack['message'], 'warnings': []}), 200
+                return jsonify({'error': 'Message already being sent'}), 409
+        
+        # Escrituras en Redis (ack, bumps, publish) en un solo round trip
+        delivered = False
+        with redis_client.batch():
+            try:
+                response = _create_http_message(chat_id, validated_data, warnings)
+                delivered = response[1] in (200, 201)
+                return response
+            finally:
+                if temp_id and not delivered:
+                    message_idempotency.release(request.current_user_id, temp_id)
         
-        # Crear mensaje con nueva estructura de conversación
-        message = Message(
-            id=message_id,
-            conversation_id=chat_id,
-            sender_id=request.current_user_id,
-            receiver_id=other_user_id,  # Para compatibilidad con código existente
-            text=validated_data['text'],
-            message_type=validated_data.get('message_type', 'text'),
-            client_temp_id=validated_data.get('temp_id'),  # Para idempotencia
-            created_at=datetime.utcnow()
-        )
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Send message error: {str(e)}")
+        
+        # TODO: PRODUCTION - More specific error handling
+        if os.environ.get('FLASK_ENV', 'development') == 'development':
+            return jsonify({'error': 'Internal server error', 'debug': str(e)}), 500
+        else:
+            return jsonify({'error': 'Internal server error'}), 500
+
+def _create_http_message(chat_id, validated_data, warnings):
+    """Validar acceso y crear el mensaje. Returns (response, status)"""
+    # Verificar que el usuario es parte de la conversación
+    conversation = Conversation.query.get(chat_id)
+    if not conversation or conversation.is_deleted:
+        return jsonify({'error': 'Chat not found'}), 404
+    
+    if not conversation.has_user(request.current_user_id):
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    # Determinar el otro usuario
+    other_user_id = conversation.get_other_user_id(request.current_user_id)
+    
+    # Verificar match mutuo activo - REQUERIDO para DM
+    has_match = Match.query.filter(
+        Match.user_id == request.current_user_id,
+        Match.matched_user_id == other_user_id,
+        Match.is_mutual == True
+    ).first() is not None
+    
+    if not has_match:
+        return jsonify({'error': 'No mutual match exists - DM requires active match'}), 403
+    
+    # Verificar que no hay bloqueos
+    if UserBlock.is_blocked(request.current_user_id, other_user_id):
+        return jsonify({'error': 'Cannot send message - user is blocked'}), 403
+    
+    temp_id = validated_data.get('temp_id')
+    
+    # Generate ULID for message
+    message_id = generate_message_id()
+    
+    # Crear mensaje con nueva estructura de conversación
+    message = Message(
+        id=message_id,
+        conversation_id=chat_id,
+        sender_id=request.current_user_id,
+        receiver_id=other_user_id,  # Para compatibilidad con código existente
+        text=validated_data['text'],
+        message_type=validated_data.get('message_type', 'text'),
+        client_temp_id=temp_id,  # Para idempotencia
+        created_at=datetime.utcnow()
+    )
+    
+    try:
         db.session.add(message)
         
-        # Commit message first to ensure it exists in database
+        # Flush first so the conversation can reference the message
         db.session.flush()
         
-        # Actualizar conversación after message is committed
+        # Actualizar conversación after message is flushed
         conversation.update_last_message(message)
         
         # Commit transaction
         db.session.commit()
         
-        # Publish to Redis Pub/Sub for scalability
-        message_data = message.to_dict_minimal()
-        redis_client.publish('new_message', {
-            'message': message_data,
-            'chat_id': chat_id,
-            'sender_id': request.current_user_id,
-            'receiver_id': other_user_id
-        })
-        
-        # TODO: PRODUCTION - Use Redis pub/sub instead of direct socketio emit
-        # Direct WebSocket emit for development (fallback)
-        socketio.emit('new_message', {
-            'message': message_data,
-            'chat_id': chat_id
-        }, room=f'user_{other_user_id}')
-        
-        # Notificar al receptor (asíncrono)
-        try:
-            NotificationService.notify_new_message(request.current_user_id, other_user_id, message)
-        except Exception as notification_error:
-            current_app.logger.error(f"Notification failed: {notification_error}")
-            # Continue - notification failure shouldn't break message sending
-        
-        return jsonify({
-            'message': message_data,
-            'warnings': warnings if os.environ.get('FLASK_ENV') == 'development' else []
-        }), 201
-        
-    except Exception as e:
+    except IntegrityError:
+        # Reintento sin entrada en cache: lo detectó el índice único
         db.session.rollback()
-        current_app.logger.error(f"Send message error: {str(e)}")
+        existing = _existing_message_for_temp_id(request.current_user_id, temp_id) if temp_id else None
+        if not existing:
+            raise
         
-        # TODO: PRODUCTION - More specific error handling
-        if os.environ.get('FLASK_ENV', 'development') == 'development':
-            return jsonify({'error': 'Internal server error', 'debug': str(e)}), 500
-        else:
-            return jsonify({'error': 'Internal server error'}), 500
+        ack = build_message_ack(existing, existing.to_dict_minimal())
+        message_idempotency.remember(request.current_user_id, temp_id, ack)
+        return jsonify({'message': ack['message'], 'warnings': []}), 200
+    
+    conversation_list_cache.bump(request.current_user_id, other_user_id)
+    
+    message_data = message.to_dict_minimal()
+    message_json = message.to_json_minimal()  # Encoded once for cache, publish and emit
+    if temp_id:
+        message_idempotency.remember(
+            request.current_user_id, temp_id, build_message_ack(message, message_json)
+        )
+    
+    # Emitted directly, or published for the realtime dispatcher
+    realtime_delivery.dispatch('new_message', 'new_message', {
+        'message': message_json,
+        'chat_id': chat_id
+    }, [user_room(other_user_id)])
+    
+    # Notificar al receptor (evento durable, lo procesa el worker de notificaciones)
+    NotificationEvents.message_created(message, other_user_id)
+    
+    return jsonify({
+        'message': message_data,
+        'warnings': warnings if os.environ.get('FLASK_ENV') == 'development' else []
+    }), 201
 
 # TODO: Re-enable WebSocket middleware for production
 # Import WebSocket middleware
@@ -336,113 +456,53 @@ def send_message(chat_id):
 @socketio.on('connect')
 @log_websocket_errors
 def handle_connect(auth):
-    """WebSocket connection with enhanced security."""
-    try:
-        # Rate limit connections
-        client_ip = request.environ.get('REMOTE_ADDR', 'unknown')
-        connection_key = f"ws_connect:{client_ip}"
-        
-        if not redis_client.check_rate_limit(connection_key, 10, 60):  # 10 connections per minute
-            current_app.logger.warning(f"Connection rate limit exceeded for IP: {client_ip}")
-            if os.environ.get('FLASK_ENV', 'development') != 'development':
-                return False  # TODO: PRODUCTION - Reject in production
-        
-        # Verificar token de autenticación realtime (modo desarrollo más permisivo)
-        token = auth.get('token') if auth else None
-        
-        # En desarrollo, permitir conexiones sin token para debuggear
-        if not token and current_app.debug:
-            current_app.logger.warning("WebSocket connection without token in development mode")
-            # Crear payload temporal para desarrollo
-            payload = {'user_id': 7}  # Usuario de prueba por defecto
-        elif not token:
-            structured_logger.log_error(
-                current_app.logger,
-                ValueError("No realtime token provided for WebSocket connection"),
-                context={
-                    'client_ip': client_ip,
-                    'auth_data': auth,
-                    'connection_attempt': 'websocket_connect'
-                }
-            )
-            return False
-        else:
-            # Use strict WebSocket token validation (expects aud=realtime)
-            from app.utils.jwt_validator import validate_websocket_token
-            
-            payload = validate_websocket_token(token)
-            if not payload:
-                # En desarrollo, intentar validación más relajada
-                if current_app.debug:
-                    current_app.logger.warning("Strict token validation failed, trying relaxed validation in dev mode")
-                    try:
-                        from app.utils.jwt_validator import decode_token
-                        payload = decode_token(token, 'access')  # Permitir access tokens en dev
-                        current_app.logger.info(f"Accepted access token for WebSocket in dev mode: user {payload.get('user_id')}")
-                    except:
-                        current_app.logger.error("All token validation failed")
-                        return False
-                else:
-                    structured_logger.log_error(
-                        current_app.logger,
-                        ValueError("WebSocket realtime token validation failed"),
-                        context={
-                            'client_ip': client_ip,
-                            'token_preview': token[:20] + '...' if token else None,
-                            'connection_attempt': 'websocket_token_validation'
-                        }
-                    )
-                    return False
-        
-        user_id = payload['user_id']
-        
-        # Verificar que el usuario existe y está activo
-        user = User.query.get(user_id)
-        if not user or not user.is_active:
-            current_app.logger.error(f"User not found or inactive for WebSocket connection: {user_id}")
-            return False
-        
-        # Guardar user_id asociado al socket_id para la sesión
-        socket_id = request.sid
-        # Usamos Redis para almacenar la relación socket_id -> user_id
-        redis_client.set_socket_user(socket_id, user_id)
-        
-        # Join user room for targeted messaging
-        join_room(f'user_{user_id}')
-        
-        # Update presence in Redis (more efficient than DB)
-        socket_id = request.sid
-        redis_client.set_user_online(user_id, socket_id)
-        
-        # Also update DB for consistency (TODO: PRODUCTION - Could be async)
-        user.is_online = True
-        db.session.commit()
-        
-        current_app.logger.info(f"User {user_id} connected via WebSocket from {client_ip}")
-        emit('connected', {
-            'user_id': user_id,
-            'server_time': datetime.utcnow().isoformat()
-        })
-        
-        # Publish user online event via Redis Pub/Sub
-        redis_client.publish('user_presence', {
-            'user_id': user_id,
-            'status': 'online',
-            'socket_id': socket_id,
-            'timestamp': datetime.utcnow().isoformat()
-        })
-        
-        # TODO: PRODUCTION - Use Redis pub/sub instead of direct broadcast
-        socketio.emit('user_online', {
-            'user_id': user_id,
-            'timestamp': datetime.utcnow().isoformat()
-        }, skip_sid=request.sid)
-        
-        return True
-        
-    except Exception as e:
-        current_app.logger.error(f"WebSocket connection error: {str(e)}")
+    """
+    Handshake WebSocket en un solo camino: admisión local, JWT realtime
+    verificado una vez (cache), estado del usuario cacheado, presencia en
+    un script de Redis y escritura de is_online diferida por lotes.
+    """
+    socket_id = request.sid
+    client_ip = request.environ.get('REMOTE_ADDR', 'unknown')
+    
+    # Admission control: per-IP bucket and worker socket cap (rejects with retry_after)
+    admission.admit_ip(client_ip)
+    
+    token = auth.get('token') if auth else None
+    if not token:
+        current_app.logger.warning(f"WebSocket connection rejected - no realtime token (IP: {client_ip})")
         return False
+    
+    payload = validate_websocket_token(token)
+    if not payload:
+        current_app.logger.warning(f"WebSocket connection rejected - invalid realtime token (IP: {client_ip})")
+        return False
+    
+    user_id = payload['user_id']
+    admission.admit_user(user_id)
+    
+    # Cached active/role status instead of a users query per connection
+    status = user_status_cache.get(user_id)
+    if not status or not status['is_active']:
+        current_app.logger.warning(f"WebSocket connection rejected - user {user_id} not found or inactive")
+        return False
+    
+    # Identity for the event handlers, kept in this socket's session
+    remember_socket_user(user_id, status['is_active'], status['role'])
+    
+    # Join user room for targeted messaging (binary variant if the client opted in)
+    realtime_delivery.register_socket(socket_id, bool(auth.get('binary')))
+    realtime_delivery.join(user_room(user_id))
+    
+    # Presence and socket map in one script; the online fan-out writes
+    # (list bumps, publish) share one batch. users.is_online is written
+    # by the presence flush task
+    with redis_client.batch():
+        if presence.connect(user_id, socket_id):
+            presence_fanout.user_online(user_id, skip_sid=socket_id)
+    
+    admission.socket_opened(socket_id)
+    current_app.logger.debug(f"User {user_id} connected via WebSocket (socket {socket_id}, IP {client_ip})")
+    return True
 
 @socketio.on('disconnect')
 @log_websocket_errors
@@ -450,85 +510,56 @@ def handle_disconnect():
     """Manejar desconexión WebSocket con limpieza mejorada"""
     try:
         socket_id = request.sid
-        user_id = redis_client.get_socket_user(socket_id)
+        identity = get_socket_identity()
+        user_id = identity['user_id'] if identity else None
+        admission.socket_closed(socket_id)
+        # Drops the socket from the node-local room index
+        realtime_delivery.unregister_socket(socket_id)
         
         if user_id:
-            leave_room(f'user_{user_id}')
-            
-            # Remove from Redis presence
-            redis_client.set_user_offline(user_id)
-            
-            # Clean up socket-user mapping
-            redis_client.remove_socket_user(socket_id)
-            
-            # Update DB status (TODO: PRODUCTION - Could be async/batched)
-            user = User.query.get(user_id)
-            if user:
-                user.is_online = False
-                db.session.commit()
-            
             current_app.logger.info(f"User {user_id} disconnected from WebSocket")
             
-            # Publish offline event via Redis Pub/Sub
-            redis_client.publish('user_presence', {
-                'user_id': user_id,
-                'status': 'offline',
-                'timestamp': datetime.utcnow().isoformat()
-            })
-            
-            # TODO: PRODUCTION - Use Redis pub/sub instead of direct broadcast
-            socketio.emit('user_offline', {
-                'user_id': user_id,
-                'timestamp': datetime.utcnow().isoformat()
-            }, skip_sid=request.sid)
+            # Drops the socket-user mapping; offline only when the last device disconnects
+            if presence.disconnect(user_id, socket_id):
+                presence_fanout.user_offline(user_id)
             
     except Exception as e:
         current_app.logger.error(f"WebSocket disconnection error: {str(e)}")
 
 @socketio.on('typing')
+@socket_login_required
 def handle_typing(data):
-    """Typing indicator with rate limiting and validation."""
-    socket_id = request.sid
-    user_id = redis_client.get_socket_user(socket_id)
+    """Typing indicator (legacy event), coalesced by the typing engine."""
+    user_id = request.current_user_id
     
-    # Extract and validate IDs (middleware already validated presence)
     try:
         chat_id = int(data['chat_id'])
-        other_user_id = int(data['other_user_id'])
-    except (ValueError, TypeError):
+    except (KeyError, ValueError, TypeError):
         current_app.logger.error(f"Invalid ID format in typing event")
         return
     
-    # Verify user is part of the conversation (security check)
-    conversation = Conversation.query.get(chat_id)
-    if not conversation or conversation.is_deleted:
-        current_app.logger.warning(f"Typing event for non-existent chat {chat_id}")
-        return
-    
-    if not (conversation.user1_id == user_id or conversation.user2_id == user_id):
+    # Authorize from the membership cache; the receiver is derived
+    # server-side, the client-supplied other_user_id is ignored
+    other_user_id = conversation_cache.get_other_user(chat_id, user_id)
+    if other_user_id is None:
         current_app.logger.warning(f"Unauthorized typing event from user {user_id} for chat {chat_id}")
         return
     
-    # Publish typing event via Redis Pub/Sub
-    redis_client.publish('typing_events', {
-        'chat_id': chat_id,
-        'user_id': user_id,
-        'other_user_id': other_user_id,
-        'timestamp': datetime.utcnow().isoformat()
-    })
+    typing_sweeper.ensure_started()
+    if typing_engine.update(chat_id, user_id, other_user_id, True, kind='legacy') != TYPING_START:
+        return
     
-    # TODO: harden for production - Use Redis pub/sub instead of direct emit
-    emit('user_typing', {
+    realtime_delivery.dispatch('typing_events', 'user_typing', {
         'chat_id': chat_id,
         'user_id': user_id,
         'timestamp': datetime.utcnow().isoformat()
-    }, room=f'user_{other_user_id}')
+    }, [user_room(other_user_id)])
 
 @socketio.on('mark_read')
+@socket_login_required
 def handle_mark_read(data):
     """Mark messages as read with optimizations and validation."""
-    socket_id = request.sid
-    user_id = redis_client.get_socket_user(socket_id)
+    user_id = request.current_user_id
     
     # Extract and validate ID (middleware already validated presence)
     try:
@@ -557,23 +588,14 @@ def handle_mark_read(data):
         
         if updated_count > 0:
             db.session.commit()
+            conversation_list_cache.bump(user_id)
             
-            # Publish read event via Redis Pub/Sub  
-            redis_client.publish('messages_read', {
+            realtime_delivery.dispatch('messages_read', 'messages_read', {
                 'chat_id': chat_id,
                 'reader_id': user_id,
-                'other_user_id': other_user_id,
                 'count': updated_count,
                 'timestamp': datetime.utcnow().isoformat()
-            })
-            
-            # TODO: harden for production - Use Redis pub/sub instead of direct emit
-            emit('messages_read', {
-                'chat_id': chat_id,
-                'reader_id': user_id,
-                'count': updated_count,
-                'timestamp': datetime.utcnow().isoformat()
-            }, room=f'user_{other_user_id}')
+            }, [user_room(other_user_id)])
             
             current_app.logger.debug(f"Marked {updated_count} messages as read for user {user_id} in chat {chat_id}")
     
@@ -584,68 +606,12 @@ def handle_mark_read(data):
 
 # New DM Socket.IO handlers based on specification
 
-@socketio.on('connect')
-def handle_connect(auth):
-    """Handle WebSocket connection and authenticate user"""
-    from app.utils.jwt_validator import validate_websocket_token
-    from app.utils.logger import structured_logger
-    
-    socket_id = request.sid
-    client_ip = request.environ.get('REMOTE_ADDR', 'unknown')
-    user_agent = request.environ.get('HTTP_USER_AGENT', 'unknown')
-    
-    current_app.logger.info(f"🔌 WebSocket connection attempt - Socket: {socket_id}, IP: {client_ip}, Agent: {user_agent[:100]}")
-    
-    # Process authentication token
-    token = auth.get('token') if auth else None
-    
-    current_app.logger.info(f"🔑 Auth data received - Has token: {bool(token)}, Token length: {len(token) if token else 0}")
-    
-    if not token:
-        current_app.logger.error(f"❌ WebSocket connection rejected - No auth token provided. Socket: {socket_id}")
-        structured_logger.log_error(
-            current_app.logger,
-            ValueError("No realtime token provided for WebSocket connection"),
-            context={'client_ip': client_ip, 'socket_id': socket_id}
-        )
-        return False
-    
-    # Validate WebSocket token
-    current_app.logger.info(f"🔍 Validating WebSocket token for socket {socket_id}")
-    payload = validate_websocket_token(token)
-    if not payload:
-        current_app.logger.error(f"❌ WebSocket token validation failed for socket {socket_id}")
-        structured_logger.log_error(
-            current_app.logger,
-            ValueError("WebSocket realtime token validation failed"),
-            context={'client_ip': client_ip, 'socket_id': socket_id}
-        )
-        return False
-    
-    user_id = payload.get('user_id')
-    if not user_id:
-        structured_logger.log_error(
-            current_app.logger,
-            ValueError("No user_id in WebSocket token payload"),
-            context={'client_ip': client_ip, 'socket_id': socket_id, 'payload': payload}
-        )
-        return False
-    
-    # Store user_id for this socket in Redis
-    redis_client.set_socket_user(socket_id, user_id)
-    
-    # Join user to individual room for messaging
-    join_room(f'user_{user_id}')
-    current_app.logger.info(f"✅ User {user_id} authenticated and joined room user_{user_id} (Socket: {socket_id}, IP: {client_ip})")
-    
-    return True
-
 @socketio.on('dm:join')
 @log_websocket_errors
+@socket_login_required
 def handle_dm_join(data):
     """Join a conversation for DM - with match validation"""
-    socket_id = request.sid
-    user_id = redis_client.get_socket_user(socket_id)
+    user_id = request.current_user_id
     
     try:
         conversation_id = int(data['conversationId'])
@@ -681,20 +647,19 @@ def handle_dm_join(data):
         return
     
     # Join conversation and individual user rooms
-    conversation_room = f'conversation_{conversation_id}'
-    user_room = f'user_{user_id}'
-    
-    join_room(conversation_room)
-    join_room(user_room)
+    rooms = [conversation_room(conversation_id), user_room(user_id)]
+    for room in rooms:
+        realtime_delivery.join(room)
     
     # Usuario unido a salas de conversación
     
-    current_app.logger.info(f"User {user_id} joined rooms: {conversation_room}, {user_room}")
+    current_app.logger.info(f"User {user_id} joined rooms: {', '.join(rooms)}")
     
     # Get recent messages
     messages = Message.get_conversation_messages(
         conversation_id=conversation_id,
-        limit=50
+        limit=50,
+        has_archive=conversation.has_archive
     )
     
     messages_data = [msg.to_dict_minimal() for msg in reversed(messages)]
@@ -716,14 +681,13 @@ def handle_dm_join(data):
 
 @socketio.on('dm:send')
 @log_websocket_errors
+@socket_login_required
 def handle_dm_send(data):
     """Send DM message with full validation"""
-    socket_id = request.sid
-    user_id = redis_client.get_socket_user(socket_id)
+    user_id = request.current_user_id
     
     try:
         conversation_id = int(data['conversationId'])
-        temp_id = data['tempId']
         text = data.get('text', '').strip()
         
         # Validate message content
@@ -731,19 +695,45 @@ def handle_dm_send(data):
             emit('error', {'code': 'INVALID_MESSAGE', 'message': 'Message text invalid or too long'})
             return
             
-    except (ValueError, TypeError) as e:
+    except (KeyError, ValueError, TypeError, AttributeError) as e:
         emit('error', {'code': 'INVALID_DATA', 'message': 'Invalid message data'})
         return
     
+    # Same format as the HTTP endpoint: it is the idempotency key (Redis and DB)
+    temp_id = validate_temp_id(data.get('tempId'))
+    if not temp_id:
+        emit('dm:error', {'code': 'INVALID_TEMP_ID', 'message': 'tempId missing or invalid'})
+        return
+    
+    # Idempotency: one Redis op per retry, no DB round trip
+    claimed, cached_ack = message_idempotency.claim(user_id, temp_id)
+    if not claimed:
+        if cached_ack:
+            emit('dm:ack', socket_ack(cached_ack))
+        # Otherwise the original send is still in flight and will ack
+        return
+    
+    # Ack cache, list bumps and publish go out in one Redis round trip
+    delivered = False
+    with redis_client.batch():
+        try:
+            delivered = _send_dm(data, user_id, conversation_id, temp_id, text)
+        finally:
+            if not delivered:
+                # Let the client retry after a rejected or failed send
+                message_idempotency.release(user_id, temp_id)
+
+def _send_dm(data, user_id, conversation_id, temp_id, text):
+    """Validar y crear el mensaje DM. Returns True si quedó entregado"""
     # Verify conversation and access
     conversation = Conversation.query.get(conversation_id)
     if not conversation or conversation.is_deleted:
         emit('error', {'code': 'CONVERSATION_NOT_FOUND', 'message': 'Conversation not found'})
-        return
+        return False
     
     if not conversation.has_user(user_id):
         emit('error', {'code': 'UNAUTHORIZED', 'message': 'Not authorized for this conversation'})
-        return
+        return False
     
     # Verify mutual match (critical for DM)
     other_user_id = conversation.get_other_user_id(user_id)
@@ -755,23 +745,12 @@ def handle_dm_send(data):
     
     if not has_match:
         emit('error', {'code': 'NO_MATCH', 'message': 'No mutual match exists'})
-        return
+        return False
     
     # Check for blocks
     if UserBlock.is_blocked(user_id, other_user_id):
         emit('error', {'code': 'BLOCKED', 'message': 'User is blocked'})
-        return
-    
-    # Check for duplicate temp_id (idempotency)
-    existing = Message.query.filter_by(client_temp_id=temp_id).first()
-    if existing:
-        # Return existing message
-        emit('dm:ack', {
-            'tempId': temp_id,
-            'serverId': existing.id,
-            'timestamp': existing.created_at.isoformat()
-        })
-        return
+        return False
     
     # Create message
     message_id = generate_message_id()
@@ -791,142 +770,136 @@ def handle_dm_send(data):
         metadata_json=data.get('metadata')
     )
     
-    db.session.add(message)
-    
-    # Commit message first to ensure it exists in database
-    db.session.flush()
-    
-    # Update conversation last message after message is committed
-    conversation.update_last_message(message)
-    
     try:
+        db.session.add(message)
+        
+        # Flush first so the conversation can reference the message
+        db.session.flush()
+        
+        # Update conversation last message after message is flushed
+        conversation.update_last_message(message)
+        
         db.session.commit()
         
-        # Send acknowledgment to sender
-        emit('dm:ack', {
-            'tempId': temp_id,
-            'serverId': message.id,
-            'timestamp': message.created_at.isoformat()
-        })
-        
-        # Broadcast to all conversation participants
-        message_data = message.to_dict_minimal()
-        
-        # Debug logging for message broadcasting
-        conversation_room = f'conversation_{conversation_id}'
-        sender_room = f'user_{user_id}'
-        receiver_room = f'user_{other_user_id}'
-        
-        # Broadcasting mensaje a salas relevantes
-        
-        # Emit to conversation room
-        socketio.emit('dm:new', {
-            'message': message_data,
-            'conversationId': conversation_id
-        }, room=conversation_room)
-        # Emitido a sala de conversación
-        
-        # Also emit to individual user rooms
-        socketio.emit('dm:new', {
-            'message': message_data,
-            'conversationId': conversation_id
-        }, room=sender_room)
-        # Emitido a sala del emisor
-        
-        socketio.emit('dm:new', {
-            'message': message_data,
-            'conversationId': conversation_id
-        }, room=receiver_room)
-        # Emitido a sala del receptor
-        
-        # Publish for scaling/notifications
-        redis_client.publish('dm_new_message', {
-            'message': message_data,
-            'conversationId': conversation_id,
-            'senderId': user_id,
-            'receiverId': other_user_id
-        })
-        
-        current_app.logger.info(f"DM message sent: {user_id} -> {other_user_id} in conversation {conversation_id}")
+    except IntegrityError:
+        # Cache miss (expired or lost claim): the unique index caught the retry
+        db.session.rollback()
+        existing = _existing_message_for_temp_id(user_id, temp_id)
+        if not existing:
+            emit('error', {'code': 'MESSAGE_FAILED', 'message': 'Failed to send message'})
+            return False
+        
+        ack = build_message_ack(existing, existing.to_dict_minimal())
+        message_idempotency.remember(user_id, temp_id, ack)
+        emit('dm:ack', socket_ack(ack))
+        return True
         
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f"DM send error: {str(e)}")
         emit('error', {'code': 'MESSAGE_FAILED', 'message': 'Failed to send message'})
+        return False
+    
+    conversation_list_cache.bump(user_id, other_user_id)
+    
+    # Encoded once, reused by the ack cache, the fan-out and the publish
+    message_json = message.to_json_minimal()
+    ack = build_message_ack(message, message_json)
+    message_idempotency.remember(user_id, temp_id, ack)
+    
+    # Send acknowledgment to sender
+    emit('dm:ack', socket_ack(ack))
+    
+    # Broadcast to all conversation participants: one emit to the union of
+    # the conversation room and both user rooms, so sockets in several of
+    # them get a single copy (published instead in dispatcher mode)
+    realtime_delivery.dispatch_message('dm_new_message', 'dm:new', {
+        'message': message_json,
+        'conversationId': conversation_id
+    }, conversation_id, user_id, other_user_id)
+    
+    # Notificación al receptor vía el stream durable
+    NotificationEvents.message_created(message, other_user_id)
+    
+    current_app.logger.info(f"DM message sent: {user_id} -> {other_user_id} in conversation {conversation_id}")
+    return True
+
+def _existing_message_for_temp_id(sender_id, temp_id):
+    """Mensaje ya creado para un temp id del emisor (fallback a la restricción única)"""
+    return Message.query.filter_by(client_temp_id=temp_id, sender_id=sender_id).first()
 
 @socketio.on('dm:read')
+@socket_login_required
 def handle_dm_read(data):
-    """Mark messages as read using watermark approach"""
-    socket_id = request.sid
-    user_id = redis_client.get_socket_user(socket_id)
+    """Mark messages as read using watermark approach (coalesced, flushed in batches)"""
+    user_id = request.current_user_id
     
     try:
         conversation_id = int(data['conversationId'])
         up_to_message_id = data['upToMessageId']
-    except (ValueError, TypeError):
+    except (KeyError, ValueError, TypeError):
         emit('error', {'code': 'INVALID_DATA', 'message': 'Invalid read data'})
         return
     
-    # Verify conversation and access
-    conversation = Conversation.query.get(conversation_id)
-    if not conversation or conversation.is_deleted:
+    # Verify access from the membership cache
+    other_user_id = conversation_cache.get_other_user(conversation_id, user_id)
+    if other_user_id is None:
         emit('error', {'code': 'CONVERSATION_NOT_FOUND', 'message': 'Conversation not found'})
         return
     
-    if not conversation.has_user(user_id):
-        emit('error', {'code': 'UNAUTHORIZED', 'message': 'Not authorized for this conversation'})
-        return
-    
-    # Update read watermark
-    MessageRead.update_read_watermark(conversation_id, user_id, up_to_message_id)
-    db.session.commit()
-    
-    # Get other user for read receipt
-    other_user_id = conversation.get_other_user_id(user_id)
-    
-    # Send read receipt to other user
-    emit('dm:read-receipt', {
-        'conversationId': conversation_id,
-        'userId': user_id,
-        'upToMessageId': up_to_message_id,
-        'timestamp': datetime.utcnow().isoformat()
-    }, room=f'user_{other_user_id}')
-    
-    current_app.logger.debug(f"Read watermark updated: user {user_id}, conversation {conversation_id}, up to {up_to_message_id}")
+    # Monotonic max per (conversation, user); the flush writes message_reads
+    # and sends a single dm:read-receipt to the other user
+    if not read_receipts.record(conversation_id, user_id, other_user_id, up_to_message_id):
+        emit('error', {'code': 'INVALID_DATA', 'message': 'Invalid read data'})
 
 @socketio.on('dm:typing')
+@socket_login_required
 def handle_dm_typing(data):
-    """Handle typing indicators for DM"""
-    socket_id = request.sid
-    user_id = redis_client.get_socket_user(socket_id)
+    """Handle typing indicators for DM (only start/stop transitions are emitted)"""
+    user_id = request.current_user_id
     
     try:
         conversation_id = int(data['conversationId'])
         is_typing = bool(data['isTyping'])
-    except (ValueError, TypeError):
+    except (KeyError, ValueError, TypeError):
         emit('error', {'code': 'INVALID_DATA', 'message': 'Invalid typing data'})
         return
     
-    # Verify conversation and access
-    conversation = Conversation.query.get(conversation_id)
-    if not conversation or conversation.is_deleted or not conversation.has_user(user_id):
+    # Verify access from the membership cache
+    other_user_id = conversation_cache.get_other_user(conversation_id, user_id)
+    if other_user_id is None:
         return  # Silently ignore invalid typing events
     
-    # Send typing indicator to other user
-    other_user_id = conversation.get_other_user_id(user_id)
+    typing_sweeper.ensure_started()
+    transition = typing_engine.update(conversation_id, user_id, other_user_id, is_typing)
+    if transition is None:
+        return  # Duplicate inside the window
     
-    emit('dm:typing', {
+    _emit_dm_typing(conversation_id, user_id, other_user_id, transition == TYPING_START)
+
+def _emit_dm_typing(conversation_id, user_id, other_user_id, is_typing):
+    """Send typing indicator to the other user"""
+    realtime_delivery.dispatch('typing_events', 'dm:typing', {
         'conversationId': conversation_id,
         'userId': user_id,
         'isTyping': is_typing,
         'timestamp': datetime.utcnow().isoformat()
-    }, room=f'user_{other_user_id}')
+    }, [user_room(other_user_id)])
+
+def _expire_typing():
+    """Emit stop for typing states that were not refreshed within the TTL"""
+    for state in typing_engine.expire():
+        # Legacy clients clear user_typing on their own
+        if state.kind == 'dm':
+            _emit_dm_typing(state.conversation_id, state.user_id, state.other_user_id, False)
+
+typing_sweeper = PeriodicTask('typing-expiry', 1.0, _expire_typing)
 
 @socketio.on('dm:leave')
+@socket_login_required
 def handle_dm_leave(data):
     """Handle user leaving conversation - trigger push notifications"""
-    socket_id = request.sid
-    user_id = redis_client.get_socket_user(socket_id)
+    user_id = request.current_user_id
     
     try:
         conversation_id = int(data['conversationId'])
@@ -940,8 +913,8 @@ def handle_dm_leave(data):
         return
     
     # Leave conversation room
-    leave_room(f'conversation_{conversation_id}')
-    leave_room(f'user_{user_id}')
+    realtime_delivery.leave(conversation_room(conversation_id))
+    realtime_delivery.leave(user_room(user_id))
     
     current_app.logger.info(f"User {user_id} left conversation {conversation_id}")
     
@@ -949,18 +922,13 @@ def handle_dm_leave(data):
     # When user leaves chat, any new messages should trigger push notifications
     # until they return to the conversation
     
-    # Mark user as "away from conversation" in Redis
-    redis_client.publish('user_left_conversation', {
-        'user_id': user_id,
-        'conversation_id': conversation_id,
-        'timestamp': datetime.utcnow().isoformat(),
-        'should_push_notify': True  # Flag for push notification service
-    })
+    # Mark user as "away from conversation" for the notification worker
+    NotificationEvents.conversation_left(user_id, conversation_id)
     
     # Notify other user that this user left (for UI updates)
     other_user_id = conversation.get_other_user_id(user_id)
-    emit('dm:user-left', {
+    realtime_delivery.dispatch('connection_events', 'dm:user-left', {
         'conversationId': conversation_id,
         'userId': user_id,
         'timestamp': datetime.utcnow().isoformat()
-    }, room=f'user_{other_user_id}')
+    }, [user_room(other_user_id)])
@@ -6,6 +6,7 @@ from flask import Blueprint, request, jsonify, current_app
 from app import db
 from app.models import User, Dog, UserPreference, UserRole
 from app.utils.auth import login_required
+from app.utils.current_user import load_current_user
 from app.utils.validators import (
     validate_nickname, validate_age, validate_dog_age,
     validate_dog_name, sanitize_text, validate_interests
@@ -113,7 +114,7 @@ def save_step():
     """
     try:
         user_id = request.current_user_id
-        user = User.query.get(user_id)
+        user = load_current_user()
         if not user:
             return jsonify({'error': 'Usuario no encontrado'}), 404
 
@@ -325,7 +326,7 @@ def complete_onboarding():
     """
     try:
         user_id = request.current_user_id
-        user = User.query.get(user_id)
+        user = load_current_user()
         if not user:
             return jsonify({'error': 'Usuario no encontrado'}), 404
 
@@ -431,7 +432,7 @@ def get_onboarding_progress():
     """
     try:
         user_id = request.current_user_id
-        user = User.query.get(user_id)
+        user = load_current_user()
         if not user:
             return jsonify({'error': 'Usuario no encontrado'}), 404
 
@@ -464,7 +465,7 @@ def skip_onboarding():
         if current_app.config.get('FLASK_ENV') != 'development':
             return jsonify({'error': 'No permitido en producción'}), 403
 
-        user = User.query.get(request.current_user_id)
+        user = load_current_user()
         if not user:
             return jsonify({'error': 'Usuario no encontrado'}), 404
 
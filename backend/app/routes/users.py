@@ -5,6 +5,8 @@ from flask import Blueprint, request, jsonify, current_app
 from app import db
 from app.models import User, Dog, UserPreference
 from app.utils.auth import login_required, admin_required
+from app.utils.current_user import load_current_user
+from app.utils.conversation_list_cache import conversation_list_cache
 from app.utils.validators import validate_nickname, validate_age
 from app.utils.upload import save_base64_image, delete_file
 from datetime import datetime
@@ -16,12 +18,12 @@ users_bp = Blueprint('users', __name__)
 def get_current_user():
     """Obtener perfil completo del usuario actual"""
     try:
-        user = User.query.get(request.current_user_id)
+        user = load_current_user()
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
-        # Incluir preferencias
-        preferences = UserPreference.query.filter_by(user_id=user.id).first()
+        # Incluir preferencias (cargadas junto con el usuario)
+        preferences = user.preferences
         
         return jsonify({
             'id': user.id,
@@ -97,6 +99,9 @@ def update_user(user_id):
         user.updated_at = datetime.utcnow()
         db.session.commit()
         
+        # Nickname y avatar aparecen en la lista de conversaciones de sus contactos
+        conversation_list_cache.bump(*conversation_list_cache.partner_ids(user.id))
+        
         return jsonify({'message': 'Profile updated successfully'}), 200
         
     except Exception as e:
@@ -125,8 +130,10 @@ def delete_user(user_id):
             delete_file(user.dog.photo_url)
         
         # Eliminar usuario (cascade eliminará relaciones)
+        partner_ids = conversation_list_cache.partner_ids(user.id)
         db.session.delete(user)
         db.session.commit()
+        conversation_list_cache.bump(*partner_ids)
         
         return jsonify({'message': 'Account deleted successfully'}), 200
         
@@ -275,8 +282,10 @@ def admin_update_user_role(user_id):
             return jsonify({'error': 'Cannot remove admin role from yourself'}), 400
         
         from app.models import UserRole
+        from app.utils.auth_cache import user_status_cache
         user.role = UserRole(new_role)
         db.session.commit()
+        user_status_cache.invalidate(user_id)
         
         return jsonify({'message': 'Role updated successfully'}), 200
         
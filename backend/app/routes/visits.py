@@ -5,6 +5,7 @@ from flask import Blueprint, request, jsonify, current_app
 from app import db
 from app.models import Visit, Park, User
 from app.utils.auth import login_required
+from app.utils.current_user import load_current_user
 from app.utils.validators import validate_time_slot
 from datetime import datetime, date, time
 from sqlalchemy import and_, or_
@@ -175,7 +176,7 @@ def checkin_visit(visit_id):
         # Actualizar ubicación del usuario si se proporciona
         data = request.get_json()
         if data.get('latitude') and data.get('longitude'):
-            user = User.query.get(request.current_user_id)
+            user = load_current_user()
             user.last_latitude = data['latitude']
             user.last_longitude = data['longitude']
             user.last_location_update = now
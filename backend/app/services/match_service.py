@@ -3,8 +3,10 @@ Servicio de matching entre usuarios
 """
 from datetime import datetime, timedelta
 from sqlalchemy import and_, or_, func
+from sqlalchemy.orm import joinedload
 from app import db
-from app.models import User, Visit, Match, UserPreference
+from app.models import User, Visit, Match
+from app.utils.current_user import load_user
 from flask import current_app
 import math
 
@@ -13,8 +15,8 @@ class MatchService:
     def calculate_compatibility(user1_id, user2_id):
         """Calcular compatibilidad entre dos usuarios"""
         try:
-            user1 = User.query.get(user1_id)
-            user2 = User.query.get(user2_id)
+            user1 = load_user(user1_id)
+            user2 = load_user(user2_id)
             
             if not user1 or not user2:
                 return 0
@@ -85,8 +87,8 @@ class MatchService:
     @staticmethod
     def _calculate_shared_interests(user1_id, user2_id):
         """Calcular intereses compartidos"""
-        pref1 = UserPreference.query.filter_by(user_id=user1_id).first()
-        pref2 = UserPreference.query.filter_by(user_id=user2_id).first()
+        pref1 = load_user(user1_id).preferences
+        pref2 = load_user(user2_id).preferences
         
         if not pref1 or not pref2:
             return 0.5
@@ -154,7 +156,7 @@ class MatchService:
     @staticmethod
     def get_suggestions(user_id, limit=10):
         """Obtener sugerencias de match para un usuario"""
-        user = User.query.get(user_id)
+        user = load_user(user_id)
         if not user or not user.allow_matching:
             return []
         
@@ -163,7 +165,10 @@ class MatchService:
             user_id=user_id
         ).subquery()
         
-        candidates = User.query.filter(
+        candidates = User.query.options(
+            joinedload(User.dog),
+            joinedload(User.preferences)
+        ).filter(
             User.id != user_id,
             User.is_active == True,
             User.allow_matching == True,
@@ -177,8 +182,8 @@ class MatchService:
             
             if score >= 50:  # Umbral mínimo de compatibilidad
                 # Obtener intereses compartidos
-                pref1 = UserPreference.query.filter_by(user_id=user_id).first()
-                pref2 = UserPreference.query.filter_by(user_id=candidate.id).first()
+                pref1 = user.preferences
+                pref2 = candidate.preferences
                 
                 shared_interests = []
                 if pref1 and pref2:
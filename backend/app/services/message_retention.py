@@ -0,0 +1,116 @@
+"""
+Servicio de retención de mensajes: purga de borrados y archivo en frío
+"""
+from datetime import datetime, timedelta
+from flask import current_app
+from app import db
+from app.models import Message, Conversation
+from app.utils.message_archive import message_archive
+
+
+class MessageRetentionService:
+    @staticmethod
+    def _protected_ids():
+        """IDs referenciados por conversations.last_message_id (FK, no se pueden borrar)"""
+        return db.select(Conversation.last_message_id).where(
+            Conversation.last_message_id.isnot(None)
+        )
+
+    @staticmethod
+    def purge_soft_deleted(grace_days=None, batch_size=None, progress=None):
+        """
+        Borrar definitivamente mensajes soft-deleted con más de grace_days,
+        en lotes pequeños (un commit por lote) para no bloquear la tabla.
+        Returns: cantidad de mensajes purgados
+        """
+        grace_days = grace_days if grace_days is not None else current_app.config['MESSAGE_SOFT_DELETE_GRACE_DAYS']
+        batch_size = batch_size or current_app.config['MESSAGE_RETENTION_BATCH_SIZE']
+        cutoff = datetime.utcnow() - timedelta(days=grace_days)
+
+        total = 0
+        while True:
+            ids = [row.id for row in db.session.query(Message.id).filter(
+                Message.is_deleted == True,
+                Message.deleted_at < cutoff,
+                ~Message.id.in_(MessageRetentionService._protected_ids())
+            ).order_by(Message.id).limit(batch_size).all()]
+
+            if not ids:
+                break
+
+            Message.query.filter(Message.id.in_(ids)).delete(synchronize_session=False)
+            db.session.commit()
+
+            total += len(ids)
+            if progress:
+                progress('purged', total)
+
+        return total
+
+    @staticmethod
+    def archive_old_messages(archive_after_days=None, batch_size=None, progress=None):
+        """
+        Mover mensajes más viejos que archive_after_days a segmentos
+        comprimidos por conversación. Cada lote se escribe y se verifica
+        (segmento + manifest leídos del store) antes de borrar las filas
+        calientes. Sin store durable no se archiva nada (RuntimeError).
+        Returns: cantidad de mensajes archivados
+        """
+        if not message_archive.store.durable:
+            raise RuntimeError(
+                "Message archive store is not durable: set MESSAGE_ARCHIVE_BUCKET "
+                "(or MESSAGE_ARCHIVE_LOCAL_DURABLE=true on a persistent volume)"
+            )
+
+        archive_after_days = archive_after_days if archive_after_days is not None else current_app.config['MESSAGE_ARCHIVE_AFTER_DAYS']
+        batch_size = batch_size or current_app.config['MESSAGE_RETENTION_BATCH_SIZE']
+        cutoff = datetime.utcnow() - timedelta(days=archive_after_days)
+
+        conversation_ids = [row.conversation_id for row in db.session.query(Message.conversation_id).filter(
+            Message.is_deleted == False,
+            Message.created_at < cutoff
+        ).distinct().all()]
+
+        total = 0
+        for conversation_id in conversation_ids:
+            while True:
+                messages = Message.query.filter(
+                    Message.conversation_id == conversation_id,
+                    Message.is_deleted == False,
+                    Message.created_at < cutoff,
+                    ~Message.id.in_(MessageRetentionService._protected_ids())
+                ).order_by(Message.id).limit(batch_size).all()
+
+                if not messages:
+                    break
+
+                message_archive.write_segment(
+                    conversation_id,
+                    [message.to_archive_dict() for message in messages]
+                )
+
+                Message.query.filter(
+                    Message.id.in_([message.id for message in messages])
+                ).delete(synchronize_session=False)
+                # Readers only open the archive of flagged conversations
+                Conversation.query.filter(Conversation.id == conversation_id).update(
+                    {'has_archive': True}, synchronize_session=False
+                )
+                db.session.commit()
+
+                total += len(messages)
+                if progress:
+                    progress('archived', total)
+
+                if len(messages) < batch_size:
+                    break
+
+        return total
+
+    @staticmethod
+    def run(grace_days=None, archive_after_days=None, batch_size=None, progress=None):
+        """Ejecutar el job completo de retención (el archivo requiere un store durable)"""
+        return {
+            'purged': MessageRetentionService.purge_soft_deleted(grace_days, batch_size, progress),
+            'archived': MessageRetentionService.archive_old_messages(archive_after_days, batch_size, progress)
+        }
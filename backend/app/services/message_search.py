@@ -0,0 +1,220 @@
+"""
+Servicio de búsqueda full-text sobre el historial de mensajes
+"""
+import re
+import math
+from sqlalchemy import text
+from app import db
+from app.models import Message
+
+# Query length limits
+MIN_QUERY_LENGTH = 2
+MAX_QUERY_LENGTH = 100
+
+# Ordered by relevance in SQL, keyset cursor (rank, id).
+# The rank is a double in both dialects so it round-trips exactly through the cursor.
+# Same access rules as get_chat_messages: mutual match with the other
+# participant and no block in either direction.
+_SEARCH_SQL = {
+    # Inverted index: GIN over messages.search_vector
+    'postgresql': """
+        SELECT id, rank FROM (
+            SELECT m.id AS id, ts_rank(m.search_vector, query)::float8 AS rank
+            FROM messages m
+            JOIN conversations c ON c.id = m.conversation_id,
+                 plainto_tsquery('pg_catalog.simple', :q) AS query
+            WHERE m.search_vector @@ query
+              AND m.is_deleted = false
+              AND c.is_deleted = false
+              AND (c.user1_id = :user_id OR c.user2_id = :user_id)
+              AND EXISTS (
+                  SELECT 1 FROM matches mt
+                  WHERE mt.user_id = :user_id
+                    AND mt.matched_user_id = CASE WHEN c.user1_id = :user_id THEN c.user2_id ELSE c.user1_id END
+                    AND mt.is_mutual = true
+              )
+              AND NOT EXISTS (
+                  SELECT 1 FROM user_blocks ub
+                  WHERE (ub.blocker_id = c.user1_id AND ub.blocked_id = c.user2_id)
+                     OR (ub.blocker_id = c.user2_id AND ub.blocked_id = c.user1_id)
+              )
+        ) ranked
+        {cursor}
+        ORDER BY rank DESC, id DESC
+        LIMIT :limit
+    """,
+    # Inverted index: FTS5 shadow table messages_fts
+    'sqlite': """
+        SELECT id, rank FROM (
+            SELECT m.id AS id, -bm25(messages_fts) AS rank
+            FROM messages_fts
+            JOIN messages m ON m.rowid = messages_fts.rowid
+            JOIN conversations c ON c.id = m.conversation_id
+            WHERE messages_fts MATCH :q
+              AND m.is_deleted = 0
+              AND c.is_deleted = 0
+              AND (c.user1_id = :user_id OR c.user2_id = :user_id)
+              AND EXISTS (
+                  SELECT 1 FROM matches mt
+                  WHERE mt.user_id = :user_id
+                    AND mt.matched_user_id = CASE WHEN c.user1_id = :user_id THEN c.user2_id ELSE c.user1_id END
+                    AND mt.is_mutual = 1
+              )
+              AND NOT EXISTS (
+                  SELECT 1 FROM user_blocks ub
+                  WHERE (ub.blocker_id = c.user1_id AND ub.blocked_id = c.user2_id)
+                     OR (ub.blocker_id = c.user2_id AND ub.blocked_id = c.user1_id)
+              )
+        ) ranked
+        {cursor}
+        ORDER BY rank DESC, id DESC
+        LIMIT :limit
+    """,
+}
+
+_CURSOR_CLAUSE = "WHERE rank < :cursor_rank OR (rank = :cursor_rank AND id < :cursor_id)"
+
+
+class MessageSearchService:
+    @staticmethod
+    def normalize_query(raw_query):
+        """Normalizar la consulta del usuario; None si no es válida"""
+        if not raw_query or not isinstance(raw_query, str):
+            return None
+
+        query = ' '.join(raw_query.split())[:MAX_QUERY_LENGTH]
+        if len(query) < MIN_QUERY_LENGTH:
+            return None
+
+        return query
+
+    @staticmethod
+    def _dialect():
+        return db.engine.dialect.name
+
+    @staticmethod
+    def _to_fts5_query(query):
+        """Convertir texto libre en términos FTS5 entre comillas (AND implícito)"""
+        terms = [term for term in re.split(r'\s+', query) if term]
+        return ' '.join('"{}"'.format(term.replace('"', '""')) for term in terms)
+
+    @staticmethod
+    def encode_cursor(rank, message_id):
+        """Cursor 'rank:id' del último resultado de una página"""
+        return f"{rank!r}:{message_id}"
+
+    @staticmethod
+    def parse_cursor(cursor):
+        """(rank, id) de un cursor; None si es inválido"""
+        try:
+            rank, message_id = cursor.split(':', 1)
+            rank = float(rank)
+        except (AttributeError, ValueError):
+            return None
+        if not message_id or not math.isfinite(rank):
+            return None
+        return rank, message_id
+
+    @staticmethod
+    def search(user_id, raw_query, cursor=None, limit=20):
+        """
+        Buscar mensajes en las conversaciones activas del usuario (con match
+        mutuo y sin bloqueo, igual que get_chat_messages).
+        Orden por relevancia (más nuevos primero en empates), paginación por
+        cursor (rank, id) ya parseado con parse_cursor.
+        Returns: (results, pagination) o (None, None) si la consulta es inválida
+        """
+        query = MessageSearchService.normalize_query(raw_query)
+        if not query:
+            return None, None
+
+        dialect = MessageSearchService._dialect()
+        if dialect not in _SEARCH_SQL:
+            raise RuntimeError(f"Message search not supported for dialect: {dialect}")
+
+        params = {
+            'q': MessageSearchService._to_fts5_query(query) if dialect == 'sqlite' else query,
+            'user_id': user_id,
+            'limit': limit + 1,  # One extra row to know if there is another page
+        }
+        cursor_clause = ''
+        if cursor:
+            cursor_clause = _CURSOR_CLAUSE
+            params['cursor_rank'], params['cursor_id'] = cursor
+
+        rows = db.session.execute(
+            text(_SEARCH_SQL[dialect].format(cursor=cursor_clause)),
+            params
+        ).all()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        messages = {}
+        if rows:
+            messages = {
+                message.id: message
+                for message in Message.query.filter(Message.id.in_([row.id for row in rows])).all()
+            }
+
+        # Rows already come most relevant first, newest first on ties
+        results = []
+        for row in rows:
+            message = messages.get(row.id)
+            if message is None:
+                continue
+            result = message.to_dict_minimal()
+            result['conversation_id'] = message.conversation_id
+            result['rank'] = row.rank
+            results.append(result)
+
+        pagination = {
+            'has_more': has_more,
+            'next_cursor': MessageSearchService.encode_cursor(rows[-1].rank, rows[-1].id) if has_more else None,
+            'count': len(results)
+        }
+        return results, pagination
+
+    @staticmethod
+    def backfill(batch_size=1000, progress=None):
+        """
+        Indexar mensajes existentes en lotes.
+        PostgreSQL: completa search_vector donde sea NULL, un commit por lote.
+        SQLite: reconstruye la tabla FTS5 (solo testing).
+        Returns: cantidad de mensajes indexados
+        """
+        dialect = MessageSearchService._dialect()
+
+        if dialect == 'sqlite':
+            db.session.execute(text("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')"))
+            db.session.commit()
+            return db.session.execute(text("SELECT count(*) FROM messages")).scalar()
+
+        if dialect != 'postgresql':
+            raise RuntimeError(f"Message search not supported for dialect: {dialect}")
+
+        total = 0
+        last_id = ''
+        while True:
+            indexed_ids = db.session.execute(text("""
+                UPDATE messages
+                SET search_vector = to_tsvector('pg_catalog.simple', coalesce(text, ''))
+                WHERE id IN (
+                    SELECT id FROM messages
+                    WHERE search_vector IS NULL AND id > :last_id
+                    ORDER BY id
+                    LIMIT :batch_size
+                )
+                RETURNING id
+            """), {'last_id': last_id, 'batch_size': batch_size}).scalars().all()
+            db.session.commit()
+
+            if not indexed_ids:
+                break
+
+            total += len(indexed_ids)
+            last_id = max(indexed_ids)
+            if progress:
+                progress(total)
+
+        return total
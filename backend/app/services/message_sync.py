@@ -0,0 +1,149 @@
+"""
+Servicio de sincronización incremental para clientes que reconectan
+"""
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from app import db
+from app.models import Message, Conversation, ConversationTombstone, MessageRead
+from app.utils.message_ids import message_id_floor, message_id_timestamp, validate_message_id
+from app.utils.serialization import dumps
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _timestamp_ms(value):
+    return (value - _EPOCH) // timedelta(milliseconds=1)
+
+
+class MessageSyncService:
+    @staticmethod
+    def parse_cursor(since):
+        """Validar el cursor ULID; None si no es válido"""
+        if not since or not isinstance(since, str) or not validate_message_id(since):
+            return None
+        return since
+
+    @staticmethod
+    def _participant_filter(user_id):
+        return db.or_(Conversation.user1_id == user_id, Conversation.user2_id == user_id)
+
+    @staticmethod
+    def stream(user_id, since, limit=None):
+        """
+        Respuesta JSON por partes con todo lo que cambió desde el cursor:
+        mensajes nuevos (ULID > since), watermarks de lectura y conversaciones
+        borradas (soft delete y unmatch). Mensajes y watermarks se cortan en
+        `limit`/SYNC_MAX_READS (has_more, next_cursor continúa desde ahí); la
+        lista de conversaciones activas se corta en SYNC_MAX_CONVERSATIONS, las
+        más recientes primero (conversations_truncated).
+        Las consultas y la serialización corren antes de devolver las partes:
+        un error es un 500 normal, nunca un 200 cortado a la mitad.
+        """
+        max_messages = current_app.config['SYNC_MAX_MESSAGES']
+        limit = min(limit or max_messages, max_messages)
+        max_reads = current_app.config['SYNC_MAX_READS']
+        max_conversations = current_app.config['SYNC_MAX_CONVERSATIONS']
+
+        # Start of the sync window, taken before any query runs
+        started_ms = int(time.time() * 1000)
+        since_ms = message_id_timestamp(since)
+        since_at = datetime.utcfromtimestamp(since_ms / 1000)
+        participant = MessageSyncService._participant_filter(user_id)
+
+        active_ids = [row.id for row in db.session.query(Conversation.id).filter(
+            participant,
+            Conversation.is_deleted == False
+        ).order_by(
+            Conversation.last_message_at.desc().nullslast(), Conversation.id.desc()
+        ).limit(max_conversations + 1).all()]
+        conversations_truncated = len(active_ids) > max_conversations
+
+        deleted = db.session.query(Conversation.id, Conversation.deleted_at).filter(
+            participant,
+            Conversation.is_deleted == True,
+            Conversation.deleted_at > since_at
+        ).all()
+        # Unmatch borra la conversación: queda su tombstone
+        deleted += db.session.query(
+            ConversationTombstone.conversation_id.label('id'), ConversationTombstone.deleted_at
+        ).filter(
+            db.or_(ConversationTombstone.user1_id == user_id, ConversationTombstone.user2_id == user_id),
+            ConversationTombstone.deleted_at > since_at
+        ).all()
+
+        # Both watermarks: the peer's read receipts and the user's reads on other devices
+        reads = MessageRead.query.join(
+            Conversation, Conversation.id == MessageRead.conversation_id
+        ).filter(
+            participant,
+            Conversation.is_deleted == False,
+            MessageRead.updated_at > since_at
+        ).order_by(
+            MessageRead.updated_at.asc(), MessageRead.conversation_id.asc(), MessageRead.user_id.asc()
+        ).limit(max_reads + 1).all()
+
+        reads_cursor = None
+        if len(reads) > max_reads:
+            reads = reads[:max_reads]
+            # Continue from the millisecond of the last watermark sent (clients dedupe);
+            # only a page of watermarks sharing one millisecond skips the rest of it
+            last_ms = _timestamp_ms(reads[-1].updated_at)
+            reads_cursor = message_id_floor(last_ms if last_ms > since_ms else since_ms + 1)
+
+        messages = Message.query.join(
+            Conversation, Conversation.id == Message.conversation_id
+        ).filter(
+            participant,
+            Conversation.is_deleted == False,
+            Message.is_deleted == False,
+            Message.id > since
+        )
+        if reads_cursor:
+            # The next page starts at reads_cursor: stop there
+            messages = messages.filter(Message.id < reads_cursor)
+        messages = messages.order_by(Message.id.asc()).limit(limit + 1).all()
+
+        has_more = len(messages) > limit
+        messages = messages[:limit]
+        count = len(messages)
+
+        message_chunks = []
+        for message in messages:
+            message_data = message.to_dict_minimal()
+            message_data['conversation_id'] = message.conversation_id
+            message_chunks.append(dumps(message_data))
+
+        if has_more:
+            next_cursor = messages[-1].id
+        elif reads_cursor:
+            has_more = True
+            next_cursor = reads_cursor
+        else:
+            # Step back a little so messages whose ULID was generated before
+            # the sync but committed after it are not skipped (clients dedupe by id)
+            next_cursor = max(
+                since,
+                message_id_floor(started_ms - current_app.config['SYNC_SAFETY_WINDOW_MS'])
+            )
+
+        return [
+            '{"since":' + dumps(since),
+            ',"conversations":' + dumps(active_ids[:max_conversations]),
+            ',"conversations_truncated":' + dumps(conversations_truncated),
+            ',"deleted_conversations":' + dumps([
+                {'chat_id': row.id, 'deleted_at': row.deleted_at.isoformat()} for row in deleted
+            ]),
+            ',"reads":' + dumps([{
+                'chat_id': read.conversation_id,
+                'user_id': read.user_id,
+                'up_to_message_id': read.up_to_message_id,
+                'updated_at': read.updated_at.isoformat()
+            } for read in reads]),
+            ',"messages":[',
+            *(chunk if i == 0 else ',' + chunk for i, chunk in enumerate(message_chunks)),
+            ']',
+            ',"count":' + dumps(count),
+            ',"has_more":' + dumps(has_more),
+            ',"next_cursor":' + dumps(next_cursor) + '}'
+        ]
@@ -0,0 +1,134 @@
+"""
+Eventos de notificación sobre los streams durables events:messages y
+events:notifications. El request solo agrega un evento compacto (ids);
+`flask notification-worker` lo consume con el grupo 'notifications' y
+NotificationPipeline arma, guarda y envía las notificaciones por lote.
+Sin Redis los eventos van a una cola en proceso que drena una tarea de fondo.
+"""
+from collections import deque
+from datetime import datetime
+from flask import current_app
+from app import db
+from app.services.notification_pipeline import get_notification_pipeline
+from app.utils.background import PeriodicTask
+from app.utils.event_stream import event_stream, StreamConsumer
+
+MESSAGES_STREAM = 'messages'
+NOTIFICATIONS_STREAM = 'notifications'
+NOTIFICATIONS_GROUP = 'notifications'
+
+
+class NotificationEvents:
+    # Fallback sin Redis (un solo proceso)
+    _local_queue = deque()
+    _local_task = None
+
+    @staticmethod
+    def _enqueue(name, event):
+        """Agregar al stream; sin Redis a la cola en proceso"""
+        if event_stream.append(name, event):
+            return
+
+        NotificationEvents._local_queue.append((name, event))
+        if NotificationEvents._local_task is None:
+            NotificationEvents._local_task = PeriodicTask('notifications-local', 1, NotificationEvents.drain_local)
+        NotificationEvents._local_task.ensure_started()
+
+    @staticmethod
+    def message_created(message, receiver_id):
+        """Registrar un mensaje nuevo (push si el receptor no está online)"""
+        NotificationEvents._enqueue(MESSAGES_STREAM, {
+            'type': 'message.created',
+            'message_id': message.id,
+            'conversation_id': message.conversation_id,
+            'sender_id': message.sender_id,
+            'receiver_id': receiver_id
+        })
+
+    @staticmethod
+    def conversation_left(user_id, conversation_id):
+        """El usuario salió del chat: los mensajes nuevos deben ir por push"""
+        NotificationEvents._enqueue(MESSAGES_STREAM, {
+            'type': 'conversation.left',
+            'user_id': user_id,
+            'conversation_id': conversation_id,
+            'timestamp': datetime.utcnow().isoformat(),
+            'should_push_notify': True
+        })
+
+    @staticmethod
+    def match_created(user1_id, user2_id):
+        """Match mutuo: notificar a ambos usuarios"""
+        NotificationEvents._enqueue(NOTIFICATIONS_STREAM, {
+            'type': 'match.created',
+            'user_ids': [user1_id, user2_id]
+        })
+
+    @staticmethod
+    def visit_reminder(user_id, visit_id):
+        """Recordatorio de visita próxima"""
+        NotificationEvents._enqueue(NOTIFICATIONS_STREAM, {
+            'type': 'visit.reminder',
+            'user_id': user_id,
+            'visit_id': visit_id
+        })
+
+    @staticmethod
+    def notification_requested(user_id, notification_type, data, channels=None):
+        """Notificación con contenido propio ({title, body, extra_data})"""
+        NotificationEvents._enqueue(NOTIFICATIONS_STREAM, {
+            'type': 'notification.requested',
+            'user_id': user_id,
+            'notification_type': notification_type,
+            'title': data.get('title'),
+            'body': data.get('body'),
+            'data': data.get('extra_data', {}),
+            'channels': channels
+        })
+
+    @staticmethod
+    def handle(name, events):
+        """Handler del consumer group: un lote de eventos del stream"""
+        pipeline = get_notification_pipeline()
+        try:
+            # source: identifica la entrada si el lote se reclama y se procesa de nuevo
+            pipeline.process(pipeline.intents_from_events([
+                dict(event, source=f"{name}:{entry_id}") if entry_id else event
+                for entry_id, event in events
+            ]))
+        except Exception:
+            # El lote queda pendiente en el stream y se reclama después
+            db.session.rollback()
+            raise
+
+    @staticmethod
+    def drain_local():
+        """Procesar la cola en proceso (fallback sin Redis) y los reintentos vencidos"""
+        batches = {}
+        while NotificationEvents._local_queue:
+            name, event = NotificationEvents._local_queue.popleft()
+            batches.setdefault(name, []).append((None, event))
+
+        for name, events in batches.items():
+            try:
+                NotificationEvents.handle(name, events)
+            except Exception as e:
+                current_app.logger.error(f"Notification batch failed: {e}")
+
+        NotificationEvents.retry_due()
+
+    @staticmethod
+    def retry_due():
+        """Reenviar entregas con reintento vencido"""
+        try:
+            return get_notification_pipeline().retry_due()
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"Notification retries failed: {e}")
+            return 0
+
+    @staticmethod
+    def consumer(**kwargs):
+        """Consumer del grupo de notificaciones (varios workers se reparten los streams)"""
+        return StreamConsumer([MESSAGES_STREAM, NOTIFICATIONS_STREAM], NOTIFICATIONS_GROUP,
+                              NotificationEvents.handle, **kwargs)
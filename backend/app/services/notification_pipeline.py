@@ -0,0 +1,439 @@
+"""
+Pipeline de notificaciones (lado worker).
+
+NotificationEvents deja eventos compactos (solo ids) en los streams y
+`flask notification-worker` los procesa por lote:
+
+1. intents_from_events: una consulta por entidad para todo el lote
+   (mensajes, usuarios, visitas) y el contenido de cada notificación
+2. process: filtra por preferencias y escribe Notification y una
+   NotificationDelivery por canal en un solo commit. Cada notificación
+   guarda la entrada del stream que la originó (source, único junto con
+   user_id y type): un lote reclamado tras un fallo no se duplica
+3. deliver: push agrupado por proveedor (PushGateway.send_batch), email y
+   SMS uno por uno. Los fallos transitorios quedan en 'retrying' con
+   backoff exponencial y retry_due() los reenvía; cada entrega guarda
+   estado, intentos y último error. Las entregas 'pending' que nadie envió
+   (worker caído entre los dos commits) vencen a los `stale_pending`
+   segundos y retry_due() también las toma
+"""
+import random
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy.orm import joinedload, selectinload
+from app import db
+from app.models import User, Message, Visit, Notification, NotificationPreference, NotificationDelivery
+from app.utils.presence import presence
+from app.utils.push_gateway import DEAD_TOKEN_ERRORS, push_gateways_from_config
+
+logger = logging.getLogger(__name__)
+
+# Flag de NotificationPreference que habilita cada tipo
+TYPE_PREFERENCES = {
+    'new_match': 'new_match_enabled',
+    'new_message': 'new_message_enabled',
+    'visit_reminder': 'visit_reminder_enabled',
+    'nearby_user': 'nearby_user_enabled'
+}
+
+# Proveedor por canal (push: tokens FCM en user_preferences.fcm_token)
+CHANNEL_PROVIDERS = {'push': 'fcm', 'email': 'email', 'sms': 'sms'}
+
+
+class NotificationPipeline:
+    def __init__(self, gateways=None, max_attempts=5, retry_base=30, retry_max=3600, stale_pending=120):
+        self.gateways = gateways or {}
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.stale_pending = stale_pending
+        self.stats = defaultdict(int)
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            gateways=push_gateways_from_config(config),
+            max_attempts=config.get('NOTIFICATION_MAX_ATTEMPTS', 5),
+            retry_base=config.get('NOTIFICATION_RETRY_BASE_SECONDS', 30),
+            retry_max=config.get('NOTIFICATION_RETRY_MAX_SECONDS', 3600),
+            stale_pending=config.get('NOTIFICATION_STALE_PENDING_SECONDS', 120)
+        )
+
+    # Eventos -> notificaciones
+    def intents_from_events(self, events):
+        """
+        Convertir eventos del stream en notificaciones a enviar:
+        [{user_id, type, title, body, data, channels, source}]
+        `source` viene del evento (entrada del stream, None en la cola local)
+        """
+        by_type = defaultdict(list)
+        for event in events:
+            by_type[event.get('type')].append(event)
+
+        intents = []
+        intents.extend(self._message_intents(by_type['message.created']))
+        intents.extend(self._match_intents(by_type['match.created']))
+        intents.extend(self._visit_intents(by_type['visit.reminder']))
+        for event in by_type['notification.requested']:
+            intents.append({
+                'user_id': event['user_id'],
+                'type': event['notification_type'],
+                'title': event.get('title') or '',
+                'body': event.get('body') or '',
+                'data': event.get('data') or {},
+                'channels': event.get('channels'),
+                'source': event.get('source')
+            })
+        return intents
+
+    @staticmethod
+    def _users(user_ids):
+        if not user_ids:
+            return {}
+        # Token de dispositivo y teléfono están en user_preferences
+        return {
+            user.id: user
+            for user in User.query.options(joinedload(User.preferences)).filter(User.id.in_(set(user_ids))).all()
+        }
+
+    @staticmethod
+    def _device_token(user):
+        return user.preferences.fcm_token if user.preferences else None
+
+    @staticmethod
+    def _phone_number(user):
+        return user.preferences.phone_number if user.preferences else None
+
+    def _message_intents(self, events):
+        if not events:
+            return []
+
+        messages = {
+            message.id: message
+            for message in Message.query.filter(Message.id.in_([event['message_id'] for event in events])).all()
+        }
+        users = self._users([event['sender_id'] for event in events] + [event['receiver_id'] for event in events])
+        # Presencia real (marcador en Redis, un MGET por lote); users.is_online se escribe con demora
+        online = presence.are_online([event['receiver_id'] for event in events])
+
+        intents = []
+        for event in events:
+            message = messages.get(event['message_id'])
+            sender = users.get(event['sender_id'])
+            receiver = users.get(event['receiver_id'])
+            if message is None or message.is_deleted or not sender or not receiver:
+                continue
+            # Solo notificar si el receptor no está online
+            if online.get(receiver.id):
+                continue
+
+            text = message.text or ''
+            intents.append({
+                'user_id': receiver.id,
+                'type': 'new_message',
+                'title': f'{sender.nickname}',
+                'body': text[:100] + ('...' if len(text) > 100 else ''),
+                'data': {
+                    'sender_id': sender.id,
+                    'sender_name': sender.nickname,
+                    'sender_avatar': sender.avatar_url,
+                    'message_id': message.id
+                },
+                'source': event.get('source')
+            })
+        return intents
+
+    def _match_intents(self, events):
+        if not events:
+            return []
+
+        users = self._users([user_id for event in events for user_id in event['user_ids']])
+        intents = []
+        for event in events:
+            user1, user2 = (users.get(user_id) for user_id in event['user_ids'])
+            if not user1 or not user2:
+                continue
+            for user, other in ((user1, user2), (user2, user1)):
+                intents.append({
+                    'user_id': user.id,
+                    'type': 'new_match',
+                    'title': '¡Nuevo match! 🎉',
+                    'body': f'¡Tienes un match con {other.nickname}! Ya pueden chatear.',
+                    'data': {
+                        'matched_user_id': other.id,
+                        'matched_user_name': other.nickname,
+                        'matched_user_avatar': other.avatar_url
+                    },
+                    'source': event.get('source')
+                })
+        return intents
+
+    def _visit_intents(self, events):
+        if not events:
+            return []
+
+        visits = {
+            visit.id: visit
+            for visit in Visit.query.options(joinedload(Visit.park)).filter(
+                Visit.id.in_([event['visit_id'] for event in events])
+            ).all()
+        }
+        intents = []
+        for event in events:
+            visit = visits.get(event['visit_id'])
+            if visit is None:
+                continue
+            intents.append({
+                'user_id': visit.user_id,
+                'type': 'visit_reminder',
+                'title': '🐕 Recordatorio de visita',
+                'body': f'Tienes una visita programada a {visit.park.name} hoy a las {visit.time.strftime("%H:%M")}',
+                'data': {
+                    'visit_id': visit.id,
+                    'park_id': visit.park_id,
+                    'park_name': visit.park.name,
+                    'visit_time': visit.time.isoformat()
+                },
+                'source': event.get('source')
+            })
+        return intents
+
+    # Persistencia
+    def process(self, intents):
+        """
+        Guardar notificaciones y entregas del lote (un commit) y enviarlas.
+        Las ya guardadas para la misma entrada del stream se saltean.
+        Returns: cantidad de notificaciones guardadas
+        """
+        if not intents:
+            return 0
+
+        sources = {intent['source'] for intent in intents if intent.get('source')}
+        existing = set()
+        if sources:
+            existing = set(db.session.query(Notification.source, Notification.user_id, Notification.type).filter(
+                Notification.source.in_(sources)
+            ).all())
+
+        user_ids = {intent['user_id'] for intent in intents}
+        users = self._users(user_ids)
+        preferences = {
+            pref.user_id: pref
+            for pref in NotificationPreference.query.filter(NotificationPreference.user_id.in_(user_ids)).all()
+        }
+
+        now = datetime.utcnow()
+        notifications = []
+        deliveries = []
+        for intent in intents:
+            user = users.get(intent['user_id'])
+            if not user or not user.is_active:
+                continue
+            if (intent.get('source'), user.id, intent['type']) in existing:
+                # Lote reclamado: sus entregas pendientes las retoma retry_due()
+                self.stats['duplicates'] += 1
+                continue
+
+            pref = preferences.get(user.id)
+            flag = TYPE_PREFERENCES.get(intent['type'])
+            if pref is not None and flag and getattr(pref, flag) is False:
+                self.stats['muted'] += 1
+                continue
+
+            notification = Notification(
+                user_id=user.id,
+                type=intent['type'],
+                title=intent['title'],
+                body=intent['body'],
+                data=intent.get('data') or {},
+                source=intent.get('source'),
+                created_at=now
+            )
+            notifications.append(notification)
+            for channel in intent.get('channels') or self._channels(pref):
+                if channel not in CHANNEL_PROVIDERS:
+                    continue
+                deliveries.append(NotificationDelivery(
+                    notification=notification,
+                    user_id=user.id,
+                    channel=channel,
+                    provider=CHANNEL_PROVIDERS[channel],
+                    status='pending',
+                    attempts=0,
+                    # Si este worker no llega a enviarla, retry_due() la toma al vencer
+                    next_attempt_at=now + timedelta(seconds=self.stale_pending),
+                    created_at=now
+                ))
+
+        if not notifications:
+            return 0
+
+        # Inserts agrupados por tabla en el flush del commit
+        db.session.add_all(notifications)
+        db.session.add_all(deliveries)
+        db.session.commit()
+        self.stats['notifications'] += len(notifications)
+
+        self.deliver(deliveries, users)
+        return len(notifications)
+
+    @staticmethod
+    def _channels(pref):
+        """Canales según preferencias (sin preferencias: solo push)"""
+        if pref is None:
+            return ['push']
+        channels = []
+        if pref.push_enabled:
+            channels.append('push')
+        if pref.email_enabled:
+            channels.append('email')
+        if pref.sms_enabled:
+            channels.append('sms')
+        return channels
+
+    # Envío
+    def deliver(self, deliveries, users=None):
+        """Enviar entregas pendientes o vencidas y registrar el resultado (un commit)"""
+        if not deliveries:
+            return
+
+        users = users or self._users([delivery.user_id for delivery in deliveries])
+        push = defaultdict(list)
+        for delivery in deliveries:
+            user = users.get(delivery.user_id)
+            if user is None:
+                self._finish(delivery, 'skipped', 'user not found')
+            elif delivery.channel == 'push':
+                push[delivery.provider].append((delivery, user))
+            elif delivery.channel == 'email':
+                self._record(delivery, self._send_email(user, delivery.notification))
+            elif delivery.channel == 'sms':
+                if not self._phone_number(user):
+                    self._finish(delivery, 'skipped', 'no phone number')
+                else:
+                    self._record(delivery, self._send_sms(user, delivery.notification))
+
+        for provider, items in push.items():
+            self._deliver_push(provider, items)
+
+        db.session.commit()
+
+    def _deliver_push(self, provider, items):
+        """Un lote por proveedor; tokens muertos se borran del usuario"""
+        gateway = self.gateways.get(provider)
+        sendable = []
+        for delivery, user in items:
+            if gateway is None:
+                self._finish(delivery, 'skipped', 'provider not configured')
+            elif not self._device_token(user):
+                self._finish(delivery, 'skipped', 'no device token')
+            else:
+                sendable.append((delivery, user))
+
+        if not sendable:
+            return
+
+        messages = []
+        for delivery, user in sendable:
+            notification = delivery.notification
+            messages.append({
+                'token': self._device_token(user),
+                'title': notification.title,
+                'body': notification.body,
+                'data': dict(notification.data or {}, notification_id=notification.id, type=notification.type)
+            })
+
+        results = gateway.send_batch(messages)
+        for (delivery, user), result in zip(sendable, results):
+            if result.error in DEAD_TOKEN_ERRORS:
+                user.preferences.fcm_token = None
+            self._record(delivery, result.ok, result.error, result.retryable, result.retry_after)
+
+    def _record(self, delivery, ok, error=None, retryable=False, retry_after=None):
+        delivery.attempts = (delivery.attempts or 0) + 1
+        if ok:
+            self._finish(delivery, 'sent')
+        elif retryable and delivery.attempts < self.max_attempts:
+            delivery.status = 'retrying'
+            delivery.last_error = (error or '')[:200]
+            delivery.next_attempt_at = datetime.utcnow() + timedelta(
+                seconds=self.backoff(delivery.attempts, retry_after)
+            )
+            self.stats['retrying'] += 1
+        else:
+            self._finish(delivery, 'failed', error)
+
+    def _finish(self, delivery, status, error=None):
+        delivery.status = status
+        delivery.next_attempt_at = None
+        delivery.last_error = error[:200] if error else None
+        if status == 'sent':
+            delivery.delivered_at = datetime.utcnow()
+        self.stats[status] += 1
+
+    def backoff(self, attempts, retry_after=None):
+        """Segundos hasta el próximo intento: exponencial con jitter, respetando Retry-After"""
+        delay = min(self.retry_max, self.retry_base * 2 ** (attempts - 1))
+        delay = delay / 2 + random.uniform(0, delay / 2)
+        return max(delay, retry_after or 0)
+
+    def retry_due(self, limit=500):
+        """
+        Reenviar entregas con reintento vencido y pendientes abandonadas
+        (más viejas que stale_pending). FOR UPDATE SKIP LOCKED: varios
+        workers no toman la misma entrega.
+        Returns: cantidad de entregas reenviadas
+        """
+        deliveries = NotificationDelivery.query.options(
+            selectinload(NotificationDelivery.notification)
+        ).filter(
+            NotificationDelivery.status.in_(('pending', 'retrying')),
+            NotificationDelivery.next_attempt_at <= datetime.utcnow()
+        ).order_by(NotificationDelivery.next_attempt_at).limit(limit).with_for_update(skip_locked=True).all()
+
+        if not deliveries:
+            db.session.commit()  # Liberar la transacción de lectura
+            return 0
+
+        self.deliver(deliveries)
+        return len(deliveries)
+
+    @staticmethod
+    def _send_email(user, notification):
+        """Enviar notificación por email"""
+        try:
+            # Aquí iría la integración con servicio de email
+            logger.info(f"Email notification sent to {user.email}")
+            return True
+        except Exception as e:
+            logger.error(f"Email notification error: {str(e)}")
+            return False
+
+    @staticmethod
+    def _send_sms(user, notification):
+        """Enviar notificación por SMS"""
+        try:
+            # Aquí iría la integración con servicio SMS
+            logger.info(f"SMS notification sent to {user.preferences.phone_number}")
+            return True
+        except Exception as e:
+            logger.error(f"SMS notification error: {str(e)}")
+            return False
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats['gateways'] = {provider: dict(gateway.stats) for provider, gateway in self.gateways.items()}
+        return stats
+
+
+_pipeline = None
+
+
+def get_notification_pipeline():
+    """Pipeline del proceso, construido con la config de la app actual"""
+    global _pipeline
+    if _pipeline is None:
+        from flask import current_app
+        _pipeline = NotificationPipeline.from_config(current_app.config)
+    return _pipeline
@@ -1,24 +1,6 @@
 """
-Servicio de notificaciones (para futuras implementaciones)
+Servicio de notificaciones (encola eventos; ver notification_service_extended)
 """
-from app import db
-from app.models import User
+from app.services.notification_service_extended import NotificationService
 
-class NotificationService:
-    @staticmethod
-    def notify_new_match(user1_id, user2_id):
-        """Notificar nuevo match mutuo"""
-        # TODO: Implementar notificaciones push/email
-        pass
-    
-    @staticmethod
-    def notify_new_message(sender_id, receiver_id, message):
-        """Notificar nuevo mensaje"""
-        # TODO: Implementar notificaciones push/email
-        pass
-    
-    @staticmethod
-    def notify_upcoming_visit(user_id, visit):
-        """Recordatorio de visita próxima"""
-        # TODO: Implementar notificaciones push/email
-        pass
+__all__ = ['NotificationService']
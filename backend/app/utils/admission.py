@@ -0,0 +1,179 @@
+"""
+WebSocket admission control.
+
+Connection attempts are checked against in-process token buckets per IP
+(before authentication) and per user (after the token is verified, before
+any database work), and against a cap on live sockets per worker. Nothing
+touches Redis on the connect path: attempt counts are pushed to Redis in
+one pipeline every `sync_interval` seconds, and identities that exceeded
+the limit across all workers are blocked locally until the window ends.
+
+A rejected attempt raises ConnectionRefusedError with a retry hint, which
+Socket.IO clients receive as connect_error data:
+
+    {"code": "RATE_LIMITED" | "SERVER_BUSY", "retry_after": seconds}
+"""
+import time
+import math
+import logging
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Dict
+
+from flask_socketio import ConnectionRefusedError
+
+from .background import PeriodicTask
+from .redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Classic token bucket: `capacity` attempts, refilled over `window` seconds"""
+    __slots__ = ('capacity', 'rate', 'tokens', 'updated')
+
+    def __init__(self, capacity: int, window: float):
+        self.capacity = capacity
+        self.rate = capacity / window
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Consume one token. Returns 0 if allowed, else seconds until one is available"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class AdmissionController:
+    """Per-worker connection admission with periodic Redis sync"""
+
+    def __init__(self, max_buckets: int = 50000):
+        self.max_buckets = max_buckets
+        self._buckets = OrderedDict()   # 'ip:1.2.3.4' / 'user:7' -> TokenBucket
+        self._attempts = defaultdict(int)  # attempts since the last sync
+        self._blocked = {}              # identity -> blocked until (time.time())
+        self._sockets = set()
+        self._lock = threading.Lock()
+        self._stats = defaultdict(int)
+        self._config = None
+        self._task = None
+
+    @property
+    def config(self) -> Dict:
+        if self._config is None:
+            from flask import current_app
+            self._config = {
+                'ip': tuple(current_app.config.get('WS_CONNECT_IP_LIMIT', (20, 60))),
+                'user': tuple(current_app.config.get('WS_CONNECT_USER_LIMIT', (10, 60))),
+                'max_sockets': current_app.config.get('WS_MAX_SOCKETS_PER_WORKER', 5000),
+                'sync_interval': current_app.config.get('WS_ADMISSION_SYNC_INTERVAL', 5),
+            }
+        return self._config
+
+    def _ensure_sync(self):
+        if self._task is None:
+            self._task = PeriodicTask('admission-sync', self.config['sync_interval'], self.sync)
+        self._task.ensure_started()
+
+    @staticmethod
+    def _refuse(code: str, retry_after: float):
+        raise ConnectionRefusedError({'code': code, 'retry_after': max(1, math.ceil(retry_after))})
+
+    def _check(self, kind: str, identity: str):
+        limit, window = self.config[kind]
+        key = f"{kind}:{identity}"
+        now = time.time()
+
+        with self._lock:
+            self._attempts[key] += 1
+            blocked_until = self._blocked.get(key, 0)
+            if blocked_until > now:
+                retry_after = blocked_until - now
+            else:
+                self._blocked.pop(key, None)
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    bucket = self._buckets[key] = TokenBucket(limit, window)
+                    while len(self._buckets) > self.max_buckets:
+                        self._buckets.popitem(last=False)
+                else:
+                    self._buckets.move_to_end(key)
+                retry_after = bucket.take()
+            if retry_after:
+                self._stats[f'{kind}_rejected'] += 1
+
+        self._ensure_sync()
+        if retry_after:
+            self._refuse('RATE_LIMITED', retry_after)
+
+    # Connect path
+    def admit_ip(self, ip: str):
+        """Before authentication: IP bucket and worker socket cap"""
+        if len(self._sockets) >= self.config['max_sockets']:
+            self._stats['capacity_rejected'] += 1
+            self._refuse('SERVER_BUSY', 5)
+        self._check('ip', ip)
+
+    def admit_user(self, user_id: int):
+        """After token verification, before any database work"""
+        self._check('user', str(user_id))
+
+    def socket_opened(self, sid: str):
+        with self._lock:
+            self._sockets.add(sid)
+            self._stats['admitted'] += 1
+
+    def socket_closed(self, sid: str):
+        with self._lock:
+            self._sockets.discard(sid)
+
+    # Cluster-wide view
+    def sync(self):
+        """Push attempt counts to Redis (one pipeline) and block identities over the global limit"""
+        with self._lock:
+            if not self._attempts:
+                return
+            attempts, self._attempts = self._attempts, defaultdict(int)
+
+        if not redis_client.redis_client:
+            return
+
+        now = time.time()
+        keys = list(attempts)
+        pipe = redis_client.pipeline()
+        for key in keys:
+            kind = key.split(':', 1)[0]
+            window = self.config[kind][1]
+            redis_key = f"admission:{key}:{int(now // window)}"
+            pipe.incrby(redis_key, attempts[key])
+            pipe.expire(redis_key, window * 2)
+        results = pipe.execute()
+
+        with self._lock:
+            for key in [key for key, until in self._blocked.items() if until <= now]:
+                del self._blocked[key]
+            for index, key in enumerate(keys):
+                kind = key.split(':', 1)[0]
+                limit, window = self.config[kind]
+                if results[index * 2] > limit:
+                    self._blocked[key] = (now // window + 1) * window
+                    self._stats['globally_blocked'] += 1
+            self._stats['syncs'] += 1
+
+    def get_stats(self) -> Dict[str, int]:
+        """Admission counters for this worker"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['sockets'] = len(self._sockets)
+            stats['buckets'] = len(self._buckets)
+            stats['blocked'] = len(self._blocked)
+        return stats
+
+
+# Global admission controller
+admission = AdmissionController()
@@ -0,0 +1,40 @@
+"""
+Side effects that must only happen once the database transaction commits.
+Model methods that invalidate caches (conversation membership, presence
+audience, conversation lists) run inside the caller's transaction; if
+they invalidated immediately, another request could reload the old rows
+before the commit and cache them again. after_commit() queues the call
+on the session and runs it right after the next successful commit; a
+rollback discards the queue.
+"""
+import logging
+from typing import Callable
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+_QUEUE_KEY = 'after_commit'
+
+
+def after_commit(callback: Callable, *args):
+    """Run callback(*args) after the current transaction of db.session commits"""
+    from app import db
+
+    db.session.info.setdefault(_QUEUE_KEY, []).append((callback, args))
+
+
+@event.listens_for(Session, 'after_commit')
+def _run_queue(session):
+    queue = session.info.pop(_QUEUE_KEY, None)
+    for callback, args in queue or ():
+        try:
+            callback(*args)
+        except Exception as e:
+            logger.error(f"After-commit callback {getattr(callback, '__name__', callback)} failed: {e}")
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_queue(session):
+    session.info.pop(_QUEUE_KEY, None)
@@ -5,55 +5,15 @@ from functools import wraps
 from flask import request, jsonify, current_app
 import jwt
 from datetime import datetime, timedelta
-from google.oauth2 import id_token
-from google.auth.transport import requests
-import requests as http_requests
 from app.utils.error_handler import safe_error_response, mask_sensitive_data
 
 def verify_google_token(token):
     """Verificar token de Google (ID token o access token)"""
+    from app.utils.google_verifier import get_google_verifier
+    
     try:
-        # Primero intentar como ID token (JWT)
-        if token.startswith('eyJ'):
-            try:
-                # Verificar ID token con Google
-                client_id = os.environ.get('GOOGLE_CLIENT_ID', '301209986798-fuk4h414g85ljkaho0b4hgn6qgb4o16p.apps.googleusercontent.com')
-                idinfo = id_token.verify_oauth2_token(token, requests.Request(), client_id)
-                
-                if idinfo['iss'] not in ['accounts.google.com', 'https://accounts.google.com']:
-                    raise ValueError('Wrong issuer.')
-                
-                return {
-                    'sub': idinfo['sub'],
-                    'email': idinfo['email'],
-                    'name': idinfo.get('name'),
-                    'picture': idinfo.get('picture'),
-                    'email_verified': idinfo.get('email_verified', False)
-                }
-            except ValueError as e:
-                current_app.logger.error(f"Error verificando ID token: {str(e)}")
-                # Si falla, intentar como access token
-                pass
-        
-        # Intentar como access token
-        response = http_requests.get(
-            'https://www.googleapis.com/oauth2/v1/userinfo',
-            headers={'Authorization': f'Bearer {token}'}
-        )
-        
-        if response.status_code != 200:
-            return None
-            
-        user_info = response.json()
-        
-        # Transformar a formato esperado
-        return {
-            'sub': user_info.get('id'),  # Google ID
-            'email': user_info.get('email'),
-            'name': user_info.get('name'),
-            'picture': user_info.get('picture'),
-            'email_verified': user_info.get('verified_email', False)
-        }
+        # ID token verificado localmente (claves cacheadas); access token vía userinfo
+        return get_google_verifier().verify(token)
         
     except Exception as e:
         current_app.logger.error(f"Error verificando token Google: {str(e)}")
@@ -200,13 +160,14 @@ def role_required(roles):
         @wraps(f)
         @login_required
         def decorated_function(*args, **kwargs):
-            from app.models import User
+            from app.utils.auth_cache import user_status_cache
             
-            user = User.query.get(request.current_user_id)
-            if not user or user.role.value not in roles:
+            # Rol desde la caché de estado (TTL corto, se invalida al cambiar rol/ban)
+            status = user_status_cache.get(request.current_user_id)
+            if not status or status['role'] not in roles:
                 return jsonify({'error': 'Insufficient permissions'}), 403
                 
-            request.current_user = user
+            request.current_user_role = status['role']
             return f(*args, **kwargs)
             
         return decorated_function
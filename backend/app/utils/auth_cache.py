@@ -0,0 +1,133 @@
+"""
+Node-local caches for the authentication hot path.
+
+VerifiedTokenCache: token -> payload of a token whose signature and
+static claims were already verified, kept until the token expires (one
+cache for realtime handshakes, one for API access tokens).
+Time-dependent checks (expiry, max age) and revocation are still applied
+by the caller on every use; a cache hit only skips decoding and HMAC
+verification. Keys are SHA-256 digests, never raw tokens.
+
+UserStatusCache: user_id -> {is_active, role} with a short TTL, so a
+handshake storm does not turn into a users-table query per connection.
+Admin changes to role/active status invalidate the entry on every node
+over the room registry delta channel.
+"""
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+
+from .room_registry import room_registry
+
+USER_STATUS_CACHE_NAME = 'user_status'
+
+
+class VerifiedTokenCache:
+    """LRU of verified JWT payloads, bounded by the token's own expiry"""
+
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self._entries = OrderedDict()  # digest -> (payload, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _digest(token: str) -> str:
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        """Payload of an already verified token, or None"""
+        digest = self._digest(token)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry and entry[1] > time.time():
+                self._entries.move_to_end(digest)
+                self.hits += 1
+                return entry[0]
+            if entry:
+                del self._entries[digest]
+            self.misses += 1
+            return None
+
+    def put(self, token: str, payload: Dict[str, Any], expires_at: Optional[float] = None):
+        """Remember a verified payload until expires_at (default: its exp claim)"""
+        expires_at = expires_at or payload.get('exp')
+        if not expires_at:
+            return
+        digest = self._digest(token)
+        with self._lock:
+            self._entries[digest] = (payload, float(expires_at))
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+class UserStatusCache:
+    """user_id -> {'is_active', 'role'} with TTL; None for unknown users"""
+
+    def __init__(self, ttl: float = 60.0, max_size: int = 50000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()  # user_id -> (status or None, expires_at)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _load(user_id: int) -> Optional[Dict[str, Any]]:
+        from app import db
+        from app.models import User
+
+        row = db.session.query(User.is_active, User.role).filter(User.id == user_id).first()
+        if row is None:
+            return None
+        return {'is_active': bool(row.is_active), 'role': row.role.value if row.role else None}
+
+    def get(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """Cached status of a user (None if the user does not exist)"""
+        room_registry.ensure_listening()
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and entry[1] > now:
+                self._entries.move_to_end(user_id)
+                return entry[0]
+
+        status = self._load(user_id)
+
+        with self._lock:
+            self._entries[user_id] = (status, now + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return status
+
+    def invalidate(self, *user_ids: int):
+        """Drop cached status (role change, ban, deactivation) on every node"""
+        self._drop(user_ids)
+        room_registry.invalidate(USER_STATUS_CACHE_NAME, list(user_ids))
+
+    def _drop(self, user_ids: Optional[Iterable[int]]):
+        """Drop entries on this node only (None: all of them)"""
+        with self._lock:
+            if user_ids is None:
+                self._entries.clear()
+                return
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+
+# Global caches
+realtime_token_cache = VerifiedTokenCache()
+access_token_cache = VerifiedTokenCache(max_size=50000)
+user_status_cache = UserStatusCache()
+room_registry.on_invalidate(USER_STATUS_CACHE_NAME, user_status_cache._drop)
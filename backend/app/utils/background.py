@@ -0,0 +1,48 @@
+"""
+Periodic background tasks running on the Socket.IO worker.
+Tasks are started lazily the first time they are needed, use
+socketio.start_background_task/socketio.sleep so they work with any
+async_mode, and run inside an application context.
+"""
+import logging
+import threading
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicTask:
+    """Run a function every `interval` seconds in a background task"""
+
+    def __init__(self, name: str, interval: float, func: Callable[[], None]):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self._started = False
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        """Start the task once per process (no-op if already running)"""
+        if self._started:
+            return
+
+        with self._lock:
+            if self._started:
+                return
+
+            from flask import current_app
+            from app import socketio
+
+            app = current_app._get_current_object()
+            socketio.start_background_task(self._run, app, socketio)
+            self._started = True
+            logger.info(f"Background task started: {self.name}")
+
+    def _run(self, app, socketio):
+        while True:
+            socketio.sleep(self.interval)
+            try:
+                with app.app_context():
+                    self.func()
+            except Exception as e:
+                logger.error(f"Background task {self.name} failed: {e}")
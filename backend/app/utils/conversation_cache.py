@@ -0,0 +1,87 @@
+"""
+Node-local cache of conversation membership.
+High-frequency socket events (typing, read receipts) only need to know
+who the two participants of a conversation are, which never changes
+after creation. Caching it avoids a Conversation lookup per event.
+Deleted or missing conversations are cached for a shorter time.
+Invalidations (conversation deleted) are published to the other nodes
+over the room registry delta channel.
+"""
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Iterable, Optional, Tuple
+
+from .room_registry import room_registry
+
+logger = logging.getLogger(__name__)
+
+CACHE_NAME = 'conversation_membership'
+
+
+class ConversationMembershipCache:
+    """conversation_id -> (user1_id, user2_id) with TTL and LRU bound"""
+
+    def __init__(self, ttl: int = 300, negative_ttl: int = 30, max_size: int = 10000):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _load(self, conversation_id: int) -> Optional[Tuple[int, int]]:
+        from app import db
+        from app.models import Conversation
+
+        row = db.session.query(Conversation.user1_id, Conversation.user2_id).filter(
+            Conversation.id == conversation_id,
+            Conversation.is_deleted == False
+        ).first()
+        return (row.user1_id, row.user2_id) if row else None
+
+    def get_participants(self, conversation_id: int) -> Optional[Tuple[int, int]]:
+        """Participants of an active conversation, None if missing or deleted"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(conversation_id)
+            if entry and entry[1] > now:
+                self._entries.move_to_end(conversation_id)
+                return entry[0]
+
+        participants = self._load(conversation_id)
+        expires_at = now + (self.ttl if participants else self.negative_ttl)
+
+        with self._lock:
+            self._entries[conversation_id] = (participants, expires_at)
+            self._entries.move_to_end(conversation_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+        return participants
+
+    def get_other_user(self, conversation_id: int, user_id: int) -> Optional[int]:
+        """Other participant, None if the user is not part of the conversation"""
+        participants = self.get_participants(conversation_id)
+        if not participants or user_id not in participants:
+            return None
+        return participants[1] if participants[0] == user_id else participants[0]
+
+    def invalidate(self, conversation_id: int):
+        """Drop a conversation (e.g. after it is deleted) on every node"""
+        self._drop([conversation_id])
+        room_registry.invalidate(CACHE_NAME, [conversation_id])
+
+    def _drop(self, conversation_ids: Optional[Iterable[int]]):
+        """Drop entries on this node only (None: all of them)"""
+        with self._lock:
+            if conversation_ids is None:
+                self._entries.clear()
+                return
+            for conversation_id in conversation_ids:
+                self._entries.pop(conversation_id, None)
+
+
+# Global membership cache
+conversation_cache = ConversationMembershipCache()
+room_registry.on_invalidate(CACHE_NAME, conversation_cache._drop)
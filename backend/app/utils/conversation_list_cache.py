@@ -0,0 +1,131 @@
+"""
+Per-user versioned cache of the serialized conversation list.
+
+    convlist:ver:{user_id}   version counter, bumped on every change
+    convlist:body:{user_id}  "<version>\n<etag>\n<body>" of the last response
+
+Anything that changes a user's list (new message, read watermark,
+match/unmatch, block, presence, profile or ban of a partner) bumps the
+counter; a cached body is only served while its version matches. The
+ETag is a hash of the body, so a client polling with If-None-Match gets
+a 304 after a single MGET, and a counter reset can never validate a
+stale copy. Counters expire after version_ttl without activity; storing
+a body refreshes its counter, so a counter always outlives the bodies
+cached against it.
+"""
+import time
+import zlib
+import logging
+import threading
+from typing import List, Optional, Tuple
+
+from .redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+
+class ConversationListCache:
+    """Versioned per-user response cache with in-memory fallback for DEV"""
+
+    def __init__(self, ttl: int = 600, version_ttl: int = 7 * 86400):
+        self.ttl = ttl
+        self.version_ttl = version_ttl
+        self._versions = {}  # user_id -> version counter
+        self._bodies = {}    # user_id -> (version, etag, body, expires_at)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _version_key(user_id: int) -> str:
+        return f"convlist:ver:{user_id}"
+
+    @staticmethod
+    def _body_key(user_id: int) -> str:
+        return f"convlist:body:{user_id}"
+
+    @staticmethod
+    def etag(body: str) -> str:
+        return '"cl-{:08x}"'.format(zlib.crc32(body.encode('utf-8')))
+
+    def lookup(self, user_id: int) -> Tuple[int, Optional[str], Optional[str]]:
+        """
+        Current version and the cached response if it is still valid.
+        Returns: (version, etag or None, body or None)
+        """
+        try:
+            if redis_client.redis_client:
+                version, cached = redis_client.redis_client.mget(
+                    self._version_key(user_id), self._body_key(user_id)
+                )
+                version = int(version or 0)
+                if cached:
+                    cached_version, etag, body = cached.split('\n', 2)
+                    if int(cached_version) == version:
+                        return version, etag, body
+                return version, None, None
+
+            with self._lock:
+                version = self._versions.get(user_id, 0)
+                entry = self._bodies.get(user_id)
+                if entry and entry[0] == version and entry[3] > time.time():
+                    return version, entry[1], entry[2]
+                return version, None, None
+
+        except Exception as e:
+            logger.error(f"Conversation list cache lookup failed: {e}")
+            return 0, None, None
+
+    def store(self, user_id: int, version: int, body: str) -> str:
+        """
+        Cache a body computed for `version` (ignored later if a bump
+        happened meanwhile). Returns its ETag.
+        """
+        etag = self.etag(body)
+        try:
+            if redis_client.redis_client:
+                pipe = redis_client.write_pipeline()
+                pipe.set(self._body_key(user_id), f"{version}\n{etag}\n{body}", ex=self.ttl)
+                pipe.expire(self._version_key(user_id), self.version_ttl)
+                pipe.execute()
+            else:
+                with self._lock:
+                    self._bodies[user_id] = (version, etag, body, time.time() + self.ttl)
+        except Exception as e:
+            logger.error(f"Conversation list cache store failed: {e}")
+        return etag
+
+    def bump(self, *user_ids: int):
+        """Invalidate the cached lists of the given users (one pipeline)"""
+        user_ids = [user_id for user_id in dict.fromkeys(user_ids) if user_id]
+        if not user_ids:
+            return
+
+        try:
+            if redis_client.redis_client:
+                pipe = redis_client.write_pipeline()  # joins the request's batch() if any
+                for user_id in user_ids:
+                    pipe.incr(self._version_key(user_id))
+                    pipe.expire(self._version_key(user_id), self.version_ttl)
+                pipe.execute()
+            else:
+                with self._lock:
+                    for user_id in user_ids:
+                        self._versions[user_id] = self._versions.get(user_id, 0) + 1
+                        self._bodies.pop(user_id, None)
+        except Exception as e:
+            logger.error(f"Conversation list cache bump failed: {e}")
+
+    @staticmethod
+    def partner_ids(user_id: int) -> List[int]:
+        """Users whose conversation list shows this user (active conversations)"""
+        from app import db
+        from app.models import Conversation
+
+        return [row.user2_id if row.user1_id == user_id else row.user1_id
+                for row in db.session.query(Conversation.user1_id, Conversation.user2_id).filter(
+                    db.or_(Conversation.user1_id == user_id, Conversation.user2_id == user_id),
+                    Conversation.is_deleted == False
+                ).all()]
+
+
+# Global conversation list cache
+conversation_list_cache = ConversationListCache()
@@ -0,0 +1,43 @@
+"""
+Request-scoped user loading.
+
+load_current_user() returns the authenticated user of the request
+(request.current_user_id, set by login_required) as g.current_user,
+fetched once per request together with the dog and preferences
+relationships. load_user() shares the same per-request map, so a service
+asking for a user the route already loaded does not query again.
+
+Outside a request (CLI, stream workers) nothing is cached: a long-lived
+application context would otherwise keep stale rows.
+"""
+from flask import g, has_request_context, request
+from sqlalchemy.orm import joinedload
+
+
+def _query_user(user_id):
+    from app.models import User
+
+    return User.query.options(
+        joinedload(User.dog),
+        joinedload(User.preferences)
+    ).filter(User.id == user_id).first()
+
+
+def load_user(user_id):
+    """User with dog and preferences, at most one query per request and id"""
+    if user_id is None:
+        return None
+    if not has_request_context():
+        return _query_user(user_id)
+
+    users = g.setdefault('loaded_users', {})
+    if user_id not in users:
+        users[user_id] = _query_user(user_id)
+    return users[user_id]
+
+
+def load_current_user():
+    """Authenticated user of the request (g.current_user), or None"""
+    if 'current_user' not in g:
+        g.current_user = load_user(getattr(request, 'current_user_id', None))
+    return g.current_user
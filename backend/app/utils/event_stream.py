@@ -0,0 +1,205 @@
+"""
+Durable event log on Redis Streams.
+
+Unlike pub/sub, entries stay in the stream (trimmed to ~EVENT_STREAM_MAXLEN)
+until consumers read them, so a worker that is down catches up when it
+restarts. Streams:
+
+    events:realtime        dispatch envelopes (REALTIME_DISPATCH_MODE=dispatcher)
+    events:messages        message.created / conversation.left for notifications
+    events:notifications   match.created / visit.reminder / notification.requested
+
+Consumers read through consumer groups: every group sees every entry,
+and inside a group each entry goes to one consumer, so workers scale
+horizontally. Entries are acked after the handler returns; entries of a
+consumer that died are reclaimed with XAUTOCLAIM once idle for
+`claim_idle_ms`.
+
+append() goes through redis_client.writer(), so inside batch() it joins
+the request's single round trip and never waits on consumers.
+"""
+import os
+import time
+import socket
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from . import serialization
+from .redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+STREAM_PREFIX = 'events:'
+
+
+def stream_key(name: str) -> str:
+    return f"{STREAM_PREFIX}{name}"
+
+
+def entry_timestamp_ms(entry_id: str) -> int:
+    """Milliseconds part of a stream entry id ("<ms>-<seq>")"""
+    return int(entry_id.split('-', 1)[0])
+
+
+class EventStream:
+    """Append-only writer for the event streams"""
+
+    def __init__(self, maxlen: Optional[int] = None):
+        self._maxlen = maxlen
+
+    @property
+    def maxlen(self) -> int:
+        if self._maxlen is None:
+            from flask import current_app
+            self._maxlen = current_app.config.get('EVENT_STREAM_MAXLEN', 100000)
+        return self._maxlen
+
+    def append(self, name: str, event: Dict[str, Any]) -> bool:
+        """
+        Add an event to a stream (approximate MAXLEN trimming).
+        Returns False without Redis, so callers can fall back to inline work.
+        """
+        if not redis_client.redis_client:
+            return False
+
+        try:
+            redis_client.writer().xadd(
+                stream_key(name),
+                {'data': serialization.dumps(event)},
+                maxlen=self.maxlen,
+                approximate=True
+            )
+            return True
+        except Exception as e:
+            logger.error(f"Event stream append to {name} failed: {e}")
+            return False
+
+
+class StreamConsumer:
+    """
+    Consumer group reader with acks and pending-entry reclaim.
+    handler(name, events) receives a batch of (entry_id, event) from one
+    stream; the batch is acked when it returns and stays pending (to be
+    reclaimed) if it raises.
+    """
+
+    def __init__(self, names: List[str], group: str,
+                 handler: Callable[[str, List[Tuple[str, Any]]], None],
+                 consumer: Optional[str] = None, count: int = 100, block_ms: int = 1000,
+                 claim_idle_ms: int = 60000, start_id: str = '$'):
+        self.names = list(names)
+        self.group = group
+        self.handler = handler
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self.count = count
+        self.block_ms = block_ms
+        self.claim_idle_ms = claim_idle_ms
+        # '$': a new group starts at the tail; existing groups resume where they left off
+        self.start_id = start_id
+        self.stats = {'processed': 0, 'acked': 0, 'failed': 0, 'reclaimed': 0, 'malformed': 0}
+
+    @property
+    def _redis(self):
+        return redis_client.redis_client
+
+    def ensure_groups(self):
+        """Create the consumer group on every stream (idempotent)"""
+        from redis.exceptions import ResponseError
+
+        for name in self.names:
+            try:
+                self._redis.xgroup_create(stream_key(name), self.group, id=self.start_id, mkstream=True)
+            except ResponseError as e:
+                if 'BUSYGROUP' not in str(e):
+                    raise
+
+    def _process(self, name: str, entries) -> int:
+        events = []
+        malformed = []
+        for entry_id, fields in entries:
+            if fields is None:
+                continue  # Trimmed away while pending
+            try:
+                events.append((entry_id, serialization.loads(fields['data'])))
+            except (KeyError, ValueError):
+                malformed.append(entry_id)
+
+        if malformed:
+            # Never going to parse: ack so they do not come back
+            self._redis.xack(stream_key(name), self.group, *malformed)
+            self.stats['malformed'] += len(malformed)
+
+        if not events:
+            return 0
+
+        try:
+            self.handler(name, events)
+        except Exception as e:
+            self.stats['failed'] += len(events)
+            logger.error(f"Stream consumer {self.group} failed on {name}: {e}")
+            return 0
+
+        self._redis.xack(stream_key(name), self.group, *[entry_id for entry_id, _ in events])
+        self.stats['processed'] += len(events)
+        self.stats['acked'] += len(events)
+        return len(events)
+
+    def reclaim(self) -> int:
+        """Take over and process entries left pending by dead consumers"""
+        processed = 0
+        for name in self.names:
+            start = '0-0'
+            while True:
+                result = self._redis.xautoclaim(
+                    stream_key(name), self.group, self.consumer,
+                    min_idle_time=self.claim_idle_ms, start_id=start, count=self.count
+                )
+                start, entries = result[0], result[1]
+                if entries:
+                    self.stats['reclaimed'] += len(entries)
+                    processed += self._process(name, entries)
+                if not entries or start in ('0-0', b'0-0'):
+                    break
+        return processed
+
+    def poll(self) -> int:
+        """Read and process one batch of new entries (blocks up to block_ms)"""
+        response = self._redis.xreadgroup(
+            self.group, self.consumer,
+            {stream_key(name): '>' for name in self.names},
+            count=self.count, block=self.block_ms
+        )
+        processed = 0
+        for key, entries in response or []:
+            name = key[len(STREAM_PREFIX):]
+            processed += self._process(name, entries)
+        return processed
+
+    def run(self, should_stop: Callable[[], bool] = lambda: False,
+            tick: Optional[Callable[[], None]] = None, tick_interval: float = 1.0):
+        """
+        Consume until should_stop() is true, reclaiming pending entries periodically.
+        tick() (e.g. due retries) runs between polls at most every tick_interval seconds.
+        """
+        if not self._redis:
+            raise RuntimeError("Redis no disponible para consumir streams")
+
+        self.ensure_groups()
+        last_claim = 0.0
+        last_tick = 0.0
+        while not should_stop():
+            try:
+                if time.time() - last_claim >= self.claim_idle_ms / 2000:
+                    last_claim = time.time()
+                    self.reclaim()
+                self.poll()
+                if tick and time.time() - last_tick >= tick_interval:
+                    last_tick = time.time()
+                    tick()
+            except Exception as e:
+                logger.error(f"Stream consumer {self.group} error: {e}")
+                time.sleep(1)
+
+
+# Global event stream writer
+event_stream = EventStream()
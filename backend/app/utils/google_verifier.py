@@ -0,0 +1,279 @@
+"""
+Google sign-in token verification.
+
+ID tokens (JWT) are verified locally with RS256 against Google's signing
+keys. The JWKS document is fetched through a pooled HTTP session and kept
+for as long as its Cache-Control max-age allows; a token signed with an
+unknown key id triggers at most one early refetch per `refetch_interval`
+(key rotation). Access tokens fall back to the userinfo endpoint through
+the same session, with timeouts.
+
+Successful verifications are memoized briefly (never past the token's
+exp), so a client retrying a login does not hit Google again.
+
+All URLs come from the app config (GOOGLE_CERTS_URL, GOOGLE_USERINFO_URL),
+so tests can point the verifier at a local stand-in key server.
+"""
+import re
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import jwt
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from jwt.algorithms import RSAAlgorithm
+    RSA_AVAILABLE = True
+except ImportError:
+    # PyJWT without cryptography: verification goes through google-auth
+    RSA_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_ISSUERS = ('accounts.google.com', 'https://accounts.google.com')
+DEFAULT_CERTS_URL = 'https://www.googleapis.com/oauth2/v3/certs'
+DEFAULT_USERINFO_URL = 'https://www.googleapis.com/oauth2/v1/userinfo'
+DEFAULT_CLIENT_ID = '301209986798-fuk4h414g85ljkaho0b4hgn6qgb4o16p.apps.googleusercontent.com'
+
+_MAX_AGE = re.compile(r'max-age=(\d+)')
+
+
+class GoogleTokenVerifier:
+    """Local ID token verification with cached keys, pooled userinfo fallback"""
+
+    def __init__(self, client_ids=(), certs_url: str = DEFAULT_CERTS_URL,
+                 userinfo_url: str = DEFAULT_USERINFO_URL, timeout: float = 3.0,
+                 memo_ttl: float = 60, clock_skew: float = 10, refetch_interval: float = 30,
+                 max_memo: int = 10000):
+        self.client_ids = tuple(client_ids)
+        self.certs_url = certs_url
+        self.userinfo_url = userinfo_url
+        self.timeout = timeout
+        self.memo_ttl = memo_ttl
+        self.clock_skew = clock_skew
+        self.refetch_interval = refetch_interval
+        self.max_memo = max_memo
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32, max_retries=1)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self._keys = {}             # kid -> public key
+        self._keys_expire_at = 0.0
+        self._keys_fetched_at = 0.0
+        self._memo = OrderedDict()  # token digest -> (user info, expires_at)
+        self._lock = threading.Lock()
+        self.stats = {'memo_hits': 0, 'id_tokens': 0, 'access_tokens': 0, 'key_fetches': 0, 'failures': 0}
+
+    @classmethod
+    def from_config(cls, config) -> 'GoogleTokenVerifier':
+        client_ids = [client_id.strip() for client_id in (config.get('GOOGLE_CLIENT_ID') or DEFAULT_CLIENT_ID).split(',')
+                      if client_id.strip()]
+        return cls(
+            client_ids=client_ids,
+            certs_url=config.get('GOOGLE_CERTS_URL') or DEFAULT_CERTS_URL,
+            userinfo_url=config.get('GOOGLE_USERINFO_URL') or DEFAULT_USERINFO_URL,
+            timeout=config.get('GOOGLE_HTTP_TIMEOUT', 3.0),
+            memo_ttl=config.get('GOOGLE_TOKEN_MEMO_TTL', 60),
+        )
+
+    # Public API
+    def verify(self, token: str) -> Optional[Dict[str, Any]]:
+        """Normalized user info ({sub, email, name, picture, email_verified}) or None"""
+        digest = hashlib.sha256(token.encode('utf-8')).hexdigest()
+        now = time.time()
+        with self._lock:
+            entry = self._memo.get(digest)
+            if entry and entry[1] > now:
+                self._memo.move_to_end(digest)
+                self.stats['memo_hits'] += 1
+                return entry[0]
+            if entry:
+                del self._memo[digest]
+
+        info, expires_at = None, now + self.memo_ttl
+        if token.startswith('eyJ'):
+            try:
+                claims = self.verify_id_token(token)
+                info = self._from_id_token(claims)
+                expires_at = min(expires_at, claims['exp'])
+            except (jwt.InvalidTokenError, ValueError, KeyError) as e:
+                logger.warning(f"Google ID token rejected: {e}")
+
+        if info is None:
+            info = self.fetch_userinfo(token)
+
+        if info is None:
+            with self._lock:
+                self.stats['failures'] += 1
+            return None
+
+        with self._lock:
+            self._memo[digest] = (info, expires_at)
+            while len(self._memo) > self.max_memo:
+                self._memo.popitem(last=False)
+        return info
+
+    def verify_id_token(self, token: str) -> Dict[str, Any]:
+        """Verify signature, audience, issuer and expiry. Raises jwt.InvalidTokenError"""
+        with self._lock:
+            self.stats['id_tokens'] += 1
+
+        if not RSA_AVAILABLE:
+            return self._verify_with_google_auth(token)
+
+        header = jwt.get_unverified_header(token)
+        if header.get('alg') != 'RS256':
+            raise jwt.InvalidAlgorithmError(f"Unexpected algorithm {header.get('alg')}")
+
+        key = self._signing_key(header.get('kid'))
+        if key is None:
+            raise jwt.InvalidKeyError(f"Unknown signing key {header.get('kid')}")
+
+        claims = jwt.decode(
+            token,
+            key,
+            algorithms=['RS256'],
+            audience=self.client_ids or None,
+            options={'verify_aud': bool(self.client_ids), 'require': ['exp', 'iat', 'sub']},
+            leeway=self.clock_skew
+        )
+        if claims.get('iss') not in GOOGLE_ISSUERS:
+            raise jwt.InvalidIssuerError('Wrong issuer.')
+        return claims
+
+    def fetch_userinfo(self, access_token: str) -> Optional[Dict[str, Any]]:
+        """Access-token path: userinfo endpoint through the pooled session"""
+        with self._lock:
+            self.stats['access_tokens'] += 1
+        try:
+            response = self.session.get(
+                self.userinfo_url,
+                headers={'Authorization': f'Bearer {access_token}'},
+                timeout=self.timeout
+            )
+        except requests.RequestException as e:
+            logger.error(f"Google userinfo request failed: {e}")
+            return None
+
+        if response.status_code != 200:
+            return None
+
+        try:
+            user_info = response.json()
+        except ValueError:
+            return None
+        return {
+            'sub': user_info.get('id'),  # Google ID
+            'email': user_info.get('email'),
+            'name': user_info.get('name'),
+            'picture': user_info.get('picture'),
+            'email_verified': user_info.get('verified_email', False)
+        }
+
+    def clear(self):
+        """Forget memoized verifications and cached keys"""
+        with self._lock:
+            self._memo.clear()
+            self._keys = {}
+            self._keys_expire_at = 0.0
+
+    # Signing keys
+    def _signing_key(self, kid: Optional[str]):
+        now = time.time()
+        with self._lock:
+            keys, fresh = self._keys, now < self._keys_expire_at
+            # Unknown kid with fresh keys: refetch early, but not in a loop
+            can_refetch = now - self._keys_fetched_at >= self.refetch_interval
+        if fresh and (kid in keys or not can_refetch):
+            return keys.get(kid)
+
+        keys = self._fetch_keys()
+        return keys.get(kid)
+
+    def _fetch_keys(self) -> Dict[str, Any]:
+        try:
+            response = self.session.get(self.certs_url, timeout=self.timeout)
+            response.raise_for_status()
+            document = response.json()
+        except (requests.RequestException, ValueError) as e:
+            logger.error(f"Fetching Google signing keys failed: {e}")
+            with self._lock:
+                # Keep serving the previous keys; retry after refetch_interval
+                self._keys_fetched_at = time.time()
+                if self._keys:
+                    self._keys_expire_at = self._keys_fetched_at + self.refetch_interval
+                return self._keys
+
+        keys = {}
+        for jwk in document.get('keys', []):
+            try:
+                keys[jwk['kid']] = RSAAlgorithm.from_jwk(jwk)
+            except (KeyError, ValueError, jwt.InvalidKeyError) as e:
+                logger.warning(f"Skipping invalid Google signing key: {e}")
+
+        now = time.time()
+        max_age, age = self._cache_lifetime(response.headers)
+        with self._lock:
+            self._keys = keys
+            self._keys_fetched_at = now
+            self._keys_expire_at = now + max(0, max_age - age)
+            self.stats['key_fetches'] += 1
+        return keys
+
+    @staticmethod
+    def _cache_lifetime(headers) -> Tuple[int, int]:
+        """(max-age, Age) from the response headers; no max-age means refetch every time"""
+        match = _MAX_AGE.search(headers.get('Cache-Control', ''))
+        max_age = int(match.group(1)) if match else 0
+        try:
+            age = int(headers.get('Age', 0))
+        except ValueError:
+            age = 0
+        return max_age, age
+
+    def _verify_with_google_auth(self, token: str) -> Dict[str, Any]:
+        from google.oauth2 import id_token
+        from google.auth.transport.requests import Request
+
+        try:
+            claims = id_token.verify_token(token, Request(session=self.session), certs_url=self.certs_url,
+                                           clock_skew_in_seconds=int(self.clock_skew))
+        except Exception as e:
+            raise jwt.InvalidTokenError(str(e))
+        if self.client_ids and claims.get('aud') not in self.client_ids:
+            raise jwt.InvalidAudienceError('Invalid audience')
+        if claims.get('iss') not in GOOGLE_ISSUERS:
+            raise jwt.InvalidIssuerError('Wrong issuer.')
+        return claims
+
+    @staticmethod
+    def _from_id_token(claims: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            'sub': claims['sub'],
+            'email': claims['email'],
+            'name': claims.get('name'),
+            'picture': claims.get('picture'),
+            'email_verified': claims.get('email_verified', False)
+        }
+
+
+_verifier = None
+_verifier_lock = threading.Lock()
+
+
+def get_google_verifier() -> GoogleTokenVerifier:
+    """Process-wide verifier built from the current app config"""
+    global _verifier
+    if _verifier is None:
+        from flask import current_app
+        with _verifier_lock:
+            if _verifier is None:
+                _verifier = GoogleTokenVerifier.from_config(current_app.config)
+    return _verifier
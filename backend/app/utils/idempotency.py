@@ -0,0 +1,131 @@
+"""
+Idempotency for client-generated message temp ids (dm:send and HTTP send).
+A temp id is claimed with a single SET NX GET: the first send wins the
+claim, retries get back the cached ack without touching the database.
+The unique (sender_id, client_temp_id) constraint on messages stays as
+the backstop when the cache entry has expired or was lost; temp ids of
+different senders never collide.
+"""
+import time
+import logging
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from . import serialization
+from .redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+PENDING = '__pending__'
+
+
+class MessageIdempotency:
+    """Redis-backed temp_id -> ack cache with in-memory fallback for DEV"""
+
+    def __init__(self, pending_ttl: int = 30, ack_ttl: int = 86400):
+        # Short TTL while the send is in flight, so a crashed send
+        # does not block client retries for long
+        self.pending_ttl = pending_ttl
+        self.ack_ttl = ack_ttl
+        self._memory = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(sender_id: int, temp_id: str) -> str:
+        return f"idem:msg:{sender_id}:{temp_id}"
+
+    def _memory_get(self, key: str) -> Optional[str]:
+        entry = self._memory.get(key)
+        if entry and entry[1] > time.time():
+            return entry[0]
+        self._memory.pop(key, None)
+        return None
+
+    def claim(self, sender_id: int, temp_id: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """
+        Claim a temp id for sending.
+        Returns: (claimed, cached_ack)
+            (True, None)  -> first time seen, caller must create the message
+            (False, ack)  -> already delivered, replay the cached ack
+            (False, None) -> same temp id currently in flight, drop the retry
+        """
+        key = self._key(sender_id, temp_id)
+        client = redis_client.redis_client
+
+        try:
+            if client:
+                try:
+                    previous = client.set(key, PENDING, nx=True, ex=self.pending_ttl, get=True)
+                except Exception as e:
+                    if 'syntax' not in str(e).lower():
+                        raise
+                    # Redis < 7.0 cannot combine NX and GET
+                    if client.set(key, PENDING, nx=True, ex=self.pending_ttl):
+                        previous = None
+                    else:
+                        previous = client.get(key) or PENDING
+            else:
+                with self._lock:
+                    previous = self._memory_get(key)
+                    if previous is None:
+                        self._memory[key] = (PENDING, time.time() + self.pending_ttl)
+
+        except Exception as e:
+            logger.error(f"Idempotency claim failed, falling back to unique index: {e}")
+            return True, None
+
+        if previous is None:
+            return True, None
+        if previous == PENDING:
+            return False, None
+        return False, serialization.loads(previous)
+
+    def remember(self, sender_id: int, temp_id: str, ack: Dict[str, Any]):
+        """Store the ack of a delivered message for retries"""
+        key = self._key(sender_id, temp_id)
+        value = serialization.dumps(ack)
+
+        try:
+            if redis_client.redis_client:
+                redis_client.writer().set(key, value, ex=self.ack_ttl)
+            else:
+                with self._lock:
+                    self._memory[key] = (value, time.time() + self.ack_ttl)
+        except Exception as e:
+            logger.error(f"Idempotency remember failed: {e}")
+
+    def release(self, sender_id: int, temp_id: str):
+        """Drop a pending claim after a failed send so the client can retry"""
+        key = self._key(sender_id, temp_id)
+
+        try:
+            if redis_client.redis_client:
+                redis_client.writer().delete(key)
+            else:
+                with self._lock:
+                    self._memory.pop(key, None)
+        except Exception as e:
+            logger.error(f"Idempotency release failed: {e}")
+
+
+def build_message_ack(message, message_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Ack record shared by dm:send and the HTTP send path"""
+    return {
+        'tempId': message.client_temp_id,
+        'serverId': message.id,
+        'timestamp': message.created_at.isoformat(),
+        'message': message_data
+    }
+
+
+def socket_ack(ack: Dict[str, Any]) -> Dict[str, Any]:
+    """dm:ack payload from a cached ack record"""
+    return {
+        'tempId': ack['tempId'],
+        'serverId': ack['serverId'],
+        'timestamp': ack['timestamp']
+    }
+
+
+# Global idempotency instance
+message_idempotency = MessageIdempotency()
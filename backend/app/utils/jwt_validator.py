@@ -13,7 +13,30 @@ def decode_token(token: str, token_type: str = 'access') -> Dict[str, Any]:
     """
     Decode and strictly validate JWT token.
     Verifies iss/aud/exp/nbf claims as per CLAUDE.md requirements.
+    A token is verified once and its payload reused until exp (a cache
+    hit is a dictionary lookup); revocation is checked on every use.
     """
+    from app.utils.auth_cache import access_token_cache
+    
+    payload = access_token_cache.get(token)
+    if payload is None:
+        payload = _verify_token(token, token_type)
+        access_token_cache.put(token, payload)
+    elif payload.get('type') != token_type:
+        logger.warning(f"Invalid {token_type} token: wrong type")
+        raise jwt.InvalidTokenError(f'Invalid token type. Expected: {token_type}')
+    
+    # Check token blacklist if enabled
+    if current_app.config.get('ENABLE_TOKEN_BLACKLIST', False):
+        jti = payload.get('jti')
+        if jti and is_token_blacklisted(jti):
+            logger.warning(f"Invalid {token_type} token: Token has been revoked")
+            raise jwt.InvalidTokenError('Token has been revoked')
+    
+    return payload
+
+def _verify_token(token: str, token_type: str) -> Dict[str, Any]:
+    """Signature, exp/nbf/aud/iss, type and user_id checks (raises jwt errors)"""
     try:
         # Decode with strict validation
         # Use config-based security settings instead of debug flag
@@ -47,12 +70,6 @@ def decode_token(token: str, token_type: str = 'access') -> Dict[str, Any]:
         if not user_id or not isinstance(user_id, int):
             raise jwt.InvalidTokenError('Invalid user_id in token')
         
-        # Check token blacklist if enabled
-        if current_app.config.get('ENABLE_TOKEN_BLACKLIST', False):
-            jti = payload.get('jti')
-            if jti and is_token_blacklisted(jti):
-                raise jwt.InvalidTokenError('Token has been revoked')
-        
         return payload
         
     except jwt.ExpiredSignatureError:
@@ -79,11 +96,45 @@ def validate_websocket_token(token: str) -> Optional[Dict[str, Any]]:
     Validate WebSocket handshake token with strict security.
     As per CLAUDE.md: enforce WSS and short-lived JWTs for Socket.IO.
     Expects 'realtime' token type with aud=realtime.
+    Signature and static claims are verified once per token (reconnects
+    reuse the verified payload); age and revocation are checked every time.
     """
+    from app.utils.auth_cache import realtime_token_cache
+    
+    is_dev = os.environ.get('FLASK_ENV', 'development') == 'development'
+    
+    payload = realtime_token_cache.get(token)
+    if payload is None:
+        payload = _verify_websocket_token(token)
+        if not payload:
+            return None
+        realtime_token_cache.put(token, payload)
+    
+    # Additional WebSocket-specific validations
+    current_time = time.time()
+    token_age = current_time - payload.get('iat', current_time)
+    
+    # Use environment-based token age limits
+    max_age_minutes = int(os.environ.get('WS_JWT_TTL_MIN', 60 if is_dev else 10))
+    max_age = max_age_minutes * 60
+    if token_age > max_age:
+        logger.warning(f"WebSocket token too old: {token_age}s (max: {max_age}s)")
+        return None
+    
+    # Check token blacklist if enabled
+    if current_app.config.get('ENABLE_TOKEN_BLACKLIST', False):
+        jti = payload.get('jti')
+        if jti and is_token_blacklisted(jti):
+            logger.warning(f"Blacklisted WebSocket token attempted: {jti}")
+            return None
+    
+    return payload
+
+def _verify_websocket_token(token: str) -> Optional[Dict[str, Any]]:
+    """Signature, exp/nbf/aud/iss, type and user_id checks of a realtime token"""
     try:
         # Use custom decode for realtime tokens
         is_production = getattr(current_app.config, 'IS_PRODUCTION', False) or os.environ.get('FLASK_ENV') == 'production'
-        is_dev = os.environ.get('FLASK_ENV', 'development') == 'development'
         
         options = {
             'verify_signature': True,
@@ -109,30 +160,12 @@ def validate_websocket_token(token: str) -> Optional[Dict[str, Any]]:
             logger.warning(f"WebSocket expects realtime token, got: {payload.get('type')}")
             return None
         
-        # Additional WebSocket-specific validations
-        current_time = time.time()
-        token_age = current_time - payload.get('iat', current_time)
-        
-        # Use environment-based token age limits
-        max_age_minutes = int(os.environ.get('WS_JWT_TTL_MIN', 60 if is_dev else 10))
-        max_age = max_age_minutes * 60
-        if token_age > max_age:
-            logger.warning(f"WebSocket token too old: {token_age}s (max: {max_age}s)")
-            return None
-        
         # Check user_id exists and is valid
         user_id = payload.get('user_id')
         if not user_id or not isinstance(user_id, int):
             logger.warning("Invalid user_id in WebSocket token")
             return None
         
-        # Check token blacklist if enabled
-        if current_app.config.get('ENABLE_TOKEN_BLACKLIST', False):
-            jti = payload.get('jti')
-            if jti and is_token_blacklisted(jti):
-                logger.warning(f"Blacklisted WebSocket token attempted: {jti}")
-                return None
-        
         return payload
         
     except jwt.ExpiredSignatureError:
@@ -157,35 +190,35 @@ def validate_websocket_token(token: str) -> Optional[Dict[str, Any]]:
 def is_token_blacklisted(jti: str) -> bool:
     """
     Check if token is blacklisted/revoked.
-    Uses Redis in production, always allows in development.
+    Uses the revocation list in production, always allows in development.
+    Non-revoked tokens are answered by the local Bloom filter (no Redis).
     """
     # DEV: Always allow
     if current_app.config.get('IS_DEVELOPMENT', True):
         return False
     
-    # PROD: Check blacklist in Redis
+    # PROD: Bloom filter, confirmed in Redis on a hit
     try:
-        from app.utils.redis_client import redis_client
-        return redis_client.redis_client and redis_client.redis_client.sismember('blacklisted_tokens', jti)
-    except:
+        from app.utils.token_revocation import token_revocations
+        return token_revocations.is_revoked(jti)
+    except Exception:
         # Fail safe - if can't check blacklist, allow but log
         logger.warning(f"Could not check token blacklist for jti: {jti}")
         return False
 
-def blacklist_token(jti: str, ttl_seconds: int = 86400):
+def blacklist_token(jti: str, ttl_seconds: int = 86400, expires_at: Optional[float] = None):
     """
     Add token to blacklist.
-    Implements proper token revocation in production.
+    The revocation expires with the token (expires_at = its exp claim),
+    or after ttl_seconds when exp is not known.
     """
     if current_app.config.get('IS_DEVELOPMENT', True):
         logger.info(f"DEV: Would blacklist token {jti}")
         return
     
     try:
-        from app.utils.redis_client import redis_client
-        if redis_client.redis_client:
-            redis_client.redis_client.sadd('blacklisted_tokens', jti)
-            redis_client.redis_client.expire('blacklisted_tokens', ttl_seconds)
+        from app.utils.token_revocation import token_revocations
+        token_revocations.revoke(jti, expires_at=expires_at, ttl_seconds=ttl_seconds)
     except Exception as e:
         logger.error(f"Failed to blacklist token {jti}: {str(e)}")
 
@@ -8,6 +8,7 @@ import logging
 from datetime import datetime
 from functools import wraps
 from flask import current_app, request, g
+from flask_socketio import ConnectionRefusedError
 import uuid
 
 class StructuredLogger:
@@ -112,6 +113,8 @@ def log_websocket_errors(f):
     def decorated_function(*args, **kwargs):
         try:
             return f(*args, **kwargs)
+        except ConnectionRefusedError:
+            raise  # Connect rejections carry data for the client's connect_error
         except Exception as e:
             error_id = StructuredLogger.log_error(
                 current_app.logger,
@@ -0,0 +1,253 @@
+"""
+Cold storage for archived chat history.
+Messages moved out of the hot `messages` table are stored as gzip JSONL
+segments per conversation, indexed by a manifest with the ULID range of
+each segment so readers only open the segments a cursor needs.
+
+Layout:
+    <base>/<conversation_id>/manifest.json
+    <base>/<conversation_id>/<first_id>-<last_id>.jsonl.gz
+
+Stores: S3ArchiveStore (S3 or any S3-compatible object storage, selected
+by MESSAGE_ARCHIVE_BUCKET) or LocalArchiveStore. Container disks are
+wiped on redeploy, so a local directory only counts as durable when it
+is declared a persistent volume (MESSAGE_ARCHIVE_LOCAL_DURABLE); hot
+rows are never deleted into a store that is not durable. Every segment
+is read back and checked before write_segment returns.
+"""
+import os
+import gzip
+import json
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+try:
+    import boto3
+    BOTO3_AVAILABLE = True
+except ImportError:
+    BOTO3_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+class LocalArchiveStore:
+    """Archive store backed by the local filesystem (or a mounted bucket)"""
+
+    def __init__(self, base_path: str, durable: bool = False):
+        self.base_path = base_path
+        # Only true for a persistent volume: container disks do not survive a redeploy
+        self.durable = durable
+
+    def _path(self, conversation_id: int, name: str) -> str:
+        return os.path.join(self.base_path, str(conversation_id), name)
+
+    def exists(self, conversation_id: int, name: str) -> bool:
+        return os.path.exists(self._path(conversation_id, name))
+
+    def read(self, conversation_id: int, name: str) -> bytes:
+        with open(self._path(conversation_id, name), 'rb') as f:
+            return f.read()
+
+    def write(self, conversation_id: int, name: str, data: bytes):
+        """Atomic write (temp file + rename) so readers never see partial files"""
+        path = self._path(conversation_id, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+
+class S3ArchiveStore:
+    """Archive store on S3 or S3-compatible object storage (endpoint_url)"""
+
+    durable = True
+
+    def __init__(self, bucket: str, prefix: str = '', endpoint_url: Optional[str] = None, client=None):
+        if client is None:
+            if not BOTO3_AVAILABLE:
+                raise RuntimeError("S3 archive store requires boto3")
+            client = boto3.client('s3', endpoint_url=endpoint_url or None)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+
+    def _key(self, conversation_id: int, name: str) -> str:
+        return '/'.join(part for part in (self.prefix, str(conversation_id), name) if part)
+
+    def exists(self, conversation_id: int, name: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(conversation_id, name))
+            return True
+        except Exception as e:
+            # botocore ClientError: missing keys come back as a 404 from HEAD
+            if getattr(e, 'response', {}).get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def read(self, conversation_id: int, name: str) -> bytes:
+        response = self.client.get_object(Bucket=self.bucket, Key=self._key(conversation_id, name))
+        return response['Body'].read()
+
+    def write(self, conversation_id: int, name: str, data: bytes):
+        """Single PUT: objects are replaced atomically"""
+        self.client.put_object(Bucket=self.bucket, Key=self._key(conversation_id, name), Body=data)
+
+
+def archive_store_from_config(config):
+    """S3 store when MESSAGE_ARCHIVE_BUCKET is set, local directory otherwise"""
+    bucket = config.get('MESSAGE_ARCHIVE_BUCKET')
+    if bucket:
+        return S3ArchiveStore(
+            bucket,
+            prefix=config.get('MESSAGE_ARCHIVE_PREFIX', ''),
+            endpoint_url=config.get('MESSAGE_ARCHIVE_ENDPOINT_URL')
+        )
+    return LocalArchiveStore(
+        config.get('MESSAGE_ARCHIVE_FOLDER', 'archive/messages'),
+        durable=config.get('MESSAGE_ARCHIVE_LOCAL_DURABLE', False)
+    )
+
+
+class MessageArchive:
+    """Read/write archived message segments"""
+
+    MANIFEST = 'manifest.json'
+
+    def __init__(self, store=None, segment_cache_size: int = 32):
+        self._store = store
+        self._segment_cache = OrderedDict()
+        self._segment_cache_size = segment_cache_size
+        self._lock = threading.Lock()
+
+    @property
+    def store(self):
+        if self._store is None:
+            from flask import current_app
+            self._store = archive_store_from_config(current_app.config)
+        return self._store
+
+    # Manifest
+    def get_manifest(self, conversation_id: int) -> Optional[Dict[str, Any]]:
+        """Manifest of a conversation, None if it has no archived history"""
+        if not self.store.exists(conversation_id, self.MANIFEST):
+            return None
+        return json.loads(self.store.read(conversation_id, self.MANIFEST))
+
+    def _save_manifest(self, conversation_id: int, manifest: Dict[str, Any]):
+        manifest['segments'].sort(key=lambda s: s['first_id'])
+        manifest['updated_at'] = datetime.utcnow().isoformat()
+        self.store.write(conversation_id, self.MANIFEST, json.dumps(manifest).encode('utf-8'))
+
+    # Writing
+    def write_segment(self, conversation_id: int, records: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Store records (ordered by id) as a new segment and register it in
+        the manifest. Both are read back from the store and checked before
+        this returns, so the caller can delete the hot rows afterwards
+        (if the store is durable).
+        """
+        if not records:
+            raise ValueError("Cannot archive an empty segment")
+
+        first_id, last_id = records[0]['id'], records[-1]['id']
+        name = f"{first_id}-{last_id}.jsonl.gz"
+
+        lines = '\n'.join(json.dumps(record, separators=(',', ':')) for record in records)
+        self.store.write(conversation_id, name, gzip.compress(lines.encode('utf-8')))
+
+        segment = {
+            'name': name,
+            'first_id': first_id,
+            'last_id': last_id,
+            'count': len(records),
+            'created_at': datetime.utcnow().isoformat()
+        }
+
+        manifest = self.get_manifest(conversation_id) or {
+            'conversation_id': conversation_id,
+            'segments': []
+        }
+        manifest['segments'] = [s for s in manifest['segments'] if s['name'] != name] + [segment]
+        self._save_manifest(conversation_id, manifest)
+
+        self._verify_segment(conversation_id, segment, [record['id'] for record in records])
+        return segment
+
+    def _verify_segment(self, conversation_id: int, segment: Dict[str, Any], ids: List[str]):
+        """Read the segment and manifest back from the store; raise if they do not match"""
+        data = gzip.decompress(self.store.read(conversation_id, segment['name'])).decode('utf-8')
+        stored_ids = [json.loads(line)['id'] for line in data.splitlines() if line]
+        if stored_ids != ids:
+            raise RuntimeError(f"Archive segment {segment['name']} of conversation {conversation_id} failed verification")
+
+        manifest = self.get_manifest(conversation_id)
+        if not manifest or segment['name'] not in [s['name'] for s in manifest['segments']]:
+            raise RuntimeError(f"Archive manifest of conversation {conversation_id} is missing {segment['name']}")
+
+    # Reading
+    def _load_segment(self, conversation_id: int, name: str) -> List[Dict[str, Any]]:
+        """Decoded segment records; segments are immutable so they are cached"""
+        key = (conversation_id, name)
+        with self._lock:
+            if key in self._segment_cache:
+                self._segment_cache.move_to_end(key)
+                return self._segment_cache[key]
+
+        data = gzip.decompress(self.store.read(conversation_id, name)).decode('utf-8')
+        records = [json.loads(line) for line in data.splitlines() if line]
+
+        with self._lock:
+            self._segment_cache[key] = records
+            while len(self._segment_cache) > self._segment_cache_size:
+                self._segment_cache.popitem(last=False)
+
+        return records
+
+    def read_page(self, conversation_id: int, before_id: Optional[str] = None,
+                  limit: int = 50) -> List[Dict[str, Any]]:
+        """
+        Archived records older than before_id, newest first (same order as
+        Message.get_conversation_messages).
+        """
+        if limit <= 0:
+            return []
+
+        try:
+            manifest = self.get_manifest(conversation_id)
+        except Exception as e:
+            logger.error(f"Archive manifest read failed for conversation {conversation_id}: {e}")
+            return []
+
+        if not manifest:
+            return []
+
+        page = []
+        seen = set()
+        for segment in sorted(manifest['segments'], key=lambda s: s['last_id'], reverse=True):
+            if before_id and segment['first_id'] >= before_id:
+                continue
+
+            records = self._load_segment(conversation_id, segment['name'])
+            for record in reversed(records):
+                if before_id and record['id'] >= before_id:
+                    continue
+                if record['id'] in seen:
+                    continue  # Segment re-written after an interrupted run
+                seen.add(record['id'])
+                page.append(record)
+
+            # Segments are disjoint ranges, so once the page is full the
+            # remaining (older) segments cannot contribute newer records
+            if len(page) >= limit:
+                break
+
+        page.sort(key=lambda r: r['id'], reverse=True)
+        return page[:limit]
+
+
+# Global archive instance
+message_archive = MessageArchive()
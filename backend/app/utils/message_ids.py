@@ -92,6 +92,14 @@ class MessageIDGenerator:
         except Exception:
             return 0
     
+    def floor_id(self, timestamp_ms: int) -> str:
+        """Smallest ID for a timestamp (milliseconds), usable as a sync cursor"""
+        timestamp_ms = max(0, int(timestamp_ms))
+        if ULID_AVAILABLE:
+            # 48-bit timestamp + zeroed randomness
+            return str(ULID.from_bytes(timestamp_ms.to_bytes(6, 'big') + bytes(10)))
+        return f"{timestamp_ms}{0:06d}"
+    
     def is_newer(self, id1: str, id2: str) -> bool:
         """Check if id1 is newer than id2"""
         try:
@@ -152,4 +160,12 @@ def generate_message_id() -> str:
 
 def validate_message_id(id_str: str) -> bool:
     """Convenient function to validate message ID"""
-    return message_id_generator.validate_id(id_str)
\ No newline at end of file
+    return message_id_generator.validate_id(id_str)
+
+def message_id_floor(timestamp_ms: int) -> str:
+    """Convenient function to build the smallest message ID for a timestamp"""
+    return message_id_generator.floor_id(timestamp_ms)
+
+def message_id_timestamp(id_str: str) -> int:
+    """Convenient function to extract the timestamp (ms) of a message ID"""
+    return message_id_generator.extract_timestamp(id_str)
@@ -0,0 +1,316 @@
+"""
+Presence subsystem with multi-device refcounting.
+
+Redis layout:
+    presence:user:{user_id}     marker key, TTL refreshed by heartbeats
+    presence:sockets:{user_id}  ZSET of live socket ids scored by last heartbeat
+    presence:online             SET of online user ids (replaces KEYS scans)
+
+A user is online while the marker key exists. Each worker refreshes the
+marker and socket scores of its local sockets every heartbeat interval,
+so sockets of a crashed worker expire on their own. A user goes offline
+only when the last socket disconnects. Bulk lookups are one MGET.
+
+Connect and disconnect run as one Lua script each, which also writes the
+socket:user:{sid} map, so a socket lifecycle event is one round trip.
+
+The users.is_online column is updated in periodic batches instead of a
+commit on every connect/disconnect. A crashed worker never queues the
+offline writes of its sockets, so a reconciliation pass (at startup and
+every `reconcile_interval` seconds) clears is_online for users whose
+marker is gone.
+"""
+import time
+import logging
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List
+
+from .background import PeriodicTask
+from .redis_client import redis_client, socket_user_key, SOCKET_USER_TTL
+
+logger = logging.getLogger(__name__)
+
+ONLINE_SET = 'presence:online'
+
+# Users checked per MGET/UPDATE in the reconciliation pass
+RECONCILE_BATCH_SIZE = 1000
+
+
+def _marker_key(user_id: int) -> str:
+    return f"presence:user:{user_id}"
+
+
+def _sockets_key(user_id: int) -> str:
+    return f"presence:sockets:{user_id}"
+
+
+class PresenceManager:
+    """Per-user socket refcounting with heartbeat expiry"""
+
+    def __init__(self, ttl: int = 90, heartbeat_interval: float = 30.0, db_flush_interval: float = 5.0,
+                 reconcile_interval: float = 60.0):
+        self.ttl = ttl
+        self._local = {}             # sid -> user_id, sockets connected to this worker
+        self._memory = defaultdict(dict)  # DEV fallback: user_id -> {sid: last_heartbeat}
+        self._db_pending = {}        # user_id -> is_online, waiting for the batched write
+        self._lock = threading.Lock()
+        self._stats = defaultdict(int)
+        self._heartbeat_task = PeriodicTask('presence-heartbeat', heartbeat_interval, self.heartbeat)
+        self._db_task = PeriodicTask('presence-db-flush', db_flush_interval, self.flush_db)
+        self._reconcile_task = PeriodicTask('presence-db-reconcile', reconcile_interval, self.reconcile_db)
+
+    @property
+    def _redis(self):
+        return redis_client.redis_client
+
+    def _ensure_tasks(self):
+        self._heartbeat_task.ensure_started()
+        self._db_task.ensure_started()
+        self._reconcile_task.ensure_started()
+
+    def _queue_db_write(self, user_id: int, is_online: bool):
+        with self._lock:
+            self._db_pending[user_id] = is_online
+
+    def _memory_live_sockets(self, user_id: int) -> Dict[str, float]:
+        """DEV fallback: drop expired sockets and return the live ones"""
+        cutoff = time.time() - self.ttl
+        sockets = self._memory.get(user_id, {})
+        for sid in [sid for sid, seen in sockets.items() if seen < cutoff]:
+            del sockets[sid]
+        if not sockets:
+            self._memory.pop(user_id, None)
+        return sockets
+
+    # Connection lifecycle
+    @staticmethod
+    def _script_keys(user_id: int, socket_id: str) -> List[str]:
+        return [socket_user_key(socket_id), _marker_key(user_id), _sockets_key(user_id), ONLINE_SET]
+
+    def connect(self, user_id: int, socket_id: str) -> bool:
+        """Register a socket and its user mapping. Returns True if the user just came online"""
+        now = time.time()
+        with self._lock:
+            self._local[socket_id] = user_id
+        redis_client.set_socket_user(socket_id, user_id, local_only=bool(self._redis))
+
+        try:
+            if self._redis:
+                was_online = redis_client.run_script(
+                    'socket_connect',
+                    self._script_keys(user_id, socket_id),
+                    [user_id, socket_id, now, self.ttl, SOCKET_USER_TTL]
+                )
+            else:
+                with self._lock:
+                    was_online = bool(self._memory_live_sockets(user_id))
+                    self._memory[user_id][socket_id] = now
+        except Exception as e:
+            logger.error(f"Presence connect failed: {e}")
+            return False
+
+        self._ensure_tasks()
+        if was_online:
+            return False
+
+        self._stats['online_transitions'] += 1
+        self._queue_db_write(user_id, True)
+        return True
+
+    def disconnect(self, user_id: int, socket_id: str) -> bool:
+        """Unregister a socket and its user mapping. Returns True if it was the user's last one"""
+        now = time.time()
+        with self._lock:
+            self._local.pop(socket_id, None)
+        redis_client.remove_socket_user(socket_id, local_only=bool(self._redis))
+
+        try:
+            if self._redis:
+                # Atomic: a device connecting meanwhile keeps the user online
+                went_offline = bool(redis_client.run_script(
+                    'socket_disconnect',
+                    self._script_keys(user_id, socket_id),
+                    [user_id, socket_id, now, self.ttl]
+                ))
+            else:
+                with self._lock:
+                    self._memory.get(user_id, {}).pop(socket_id, None)
+                    went_offline = not self._memory_live_sockets(user_id)
+        except Exception as e:
+            logger.error(f"Presence disconnect failed: {e}")
+            return False
+
+        if went_offline:
+            self._stats['offline_transitions'] += 1
+            self._queue_db_write(user_id, False)
+        return went_offline
+
+    def clear_user(self, user_id: int):
+        """Force a user offline on every device (e.g. ban, logout everywhere)"""
+        with self._lock:
+            for sid in [sid for sid, uid in self._local.items() if uid == user_id]:
+                del self._local[sid]
+            self._memory.pop(user_id, None)
+
+        try:
+            if self._redis:
+                pipe = self._redis.pipeline()
+                pipe.delete(_marker_key(user_id), _sockets_key(user_id))
+                pipe.srem(ONLINE_SET, user_id)
+                pipe.execute()
+        except Exception as e:
+            logger.error(f"Presence clear failed: {e}")
+
+        self._queue_db_write(user_id, False)
+
+    def heartbeat(self):
+        """Refresh marker and socket scores of this worker's sockets (one pipeline)"""
+        now = time.time()
+        with self._lock:
+            local = dict(self._local)
+            if not self._redis:
+                for sid, user_id in local.items():
+                    self._memory[user_id][sid] = now
+                return
+
+        if not local:
+            return
+
+        pipe = self._redis.pipeline(transaction=False)
+        user_ids = set()
+        for sid, user_id in local.items():
+            pipe.zadd(_sockets_key(user_id), {sid: now})
+            pipe.expire(socket_user_key(sid), SOCKET_USER_TTL)
+            user_ids.add(user_id)
+        for user_id in user_ids:
+            pipe.expire(_sockets_key(user_id), self.ttl)
+            pipe.set(_marker_key(user_id), 1, ex=self.ttl)
+        pipe.sadd(ONLINE_SET, *user_ids)
+        pipe.execute()
+        self._stats['heartbeats'] += 1
+
+    # Lookups
+    def is_online(self, user_id: int) -> bool:
+        """Check if a user has at least one live socket"""
+        return self.are_online([user_id]).get(user_id, False)
+
+    def are_online(self, user_ids: Iterable[int]) -> Dict[int, bool]:
+        """Bulk presence lookup in a single MGET"""
+        user_ids = list(dict.fromkeys(user_ids))
+        if not user_ids:
+            return {}
+
+        try:
+            if self._redis:
+                markers = self._redis.mget([_marker_key(user_id) for user_id in user_ids])
+                return {user_id: marker is not None for user_id, marker in zip(user_ids, markers)}
+
+            with self._lock:
+                return {user_id: bool(self._memory_live_sockets(user_id)) for user_id in user_ids}
+        except Exception as e:
+            logger.error(f"Bulk presence lookup failed: {e}")
+            return {user_id: False for user_id in user_ids}
+
+    def get_online_users(self) -> List[int]:
+        """Online user ids from the online set, pruning entries whose marker expired"""
+        try:
+            if not self._redis:
+                with self._lock:
+                    return [user_id for user_id in list(self._memory.keys())
+                            if self._memory_live_sockets(user_id)]
+
+            members = [int(member) for member in self._redis.smembers(ONLINE_SET)]
+            online = self.are_online(members)
+            stale = [user_id for user_id, is_online in online.items() if not is_online]
+            if stale:
+                self._redis.srem(ONLINE_SET, *stale)
+            return [user_id for user_id, is_online in online.items() if is_online]
+        except Exception as e:
+            logger.error(f"Get online users failed: {e}")
+            return []
+
+    # Batched DB writes
+    def flush_db(self) -> int:
+        """Write pending users.is_online changes in two UPDATE statements"""
+        with self._lock:
+            if not self._db_pending:
+                return 0
+            pending, self._db_pending = self._db_pending, {}
+
+        from app import db
+        from app.models import User
+
+        try:
+            for is_online in (True, False):
+                user_ids = [user_id for user_id, status in pending.items() if status is is_online]
+                if user_ids:
+                    User.query.filter(User.id.in_(user_ids)).update(
+                        {'is_online': is_online}, synchronize_session=False
+                    )
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Presence DB flush failed: {e}")
+            with self._lock:
+                for user_id, is_online in pending.items():
+                    self._db_pending.setdefault(user_id, is_online)
+            return 0
+
+        self._stats['db_flushes'] += 1
+        return len(pending)
+
+    def reconcile_db(self) -> int:
+        """Clear users.is_online for users without a presence marker. Returns users cleared"""
+        from app import db
+        from app.models import User
+
+        cleared = 0
+        try:
+            candidates = [row.id for row in db.session.query(User.id).filter(User.is_online == True).all()]
+            for start in range(0, len(candidates), RECONCILE_BATCH_SIZE):
+                batch = candidates[start:start + RECONCILE_BATCH_SIZE]
+                # Not are_online(): a failed lookup there reads as everyone offline
+                if self._redis:
+                    markers = self._redis.mget([_marker_key(user_id) for user_id in batch])
+                    stale = [user_id for user_id, marker in zip(batch, markers) if marker is None]
+                else:
+                    with self._lock:
+                        stale = [user_id for user_id in batch if not self._memory_live_sockets(user_id)]
+
+                # A queued write is newer than this pass
+                with self._lock:
+                    stale = [user_id for user_id in stale if user_id not in self._db_pending]
+                if stale:
+                    User.query.filter(User.id.in_(stale), User.is_online == True).update(
+                        {'is_online': False}, synchronize_session=False
+                    )
+                    cleared += len(stale)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Presence DB reconciliation failed: {e}")
+            return 0
+
+        if cleared:
+            logger.info(f"Presence reconciliation cleared is_online for {cleared} users")
+        self._stats['db_reconciled'] += cleared
+        return cleared
+
+    def start_reconciliation(self) -> int:
+        """Reconcile users.is_online now (process startup) and keep doing it periodically"""
+        cleared = self.reconcile_db()
+        self._reconcile_task.ensure_started()
+        return cleared
+
+    def get_stats(self) -> Dict[str, int]:
+        """Presence counters for this worker"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['local_sockets'] = len(self._local)
+            stats['db_pending'] = len(self._db_pending)
+        return stats
+
+
+# Global presence manager
+presence = PresenceManager()
@@ -0,0 +1,171 @@
+"""
+Targeted presence fan-out.
+user_online/user_offline are only delivered to the personal rooms of
+users who have a mutual match or a conversation with the user (minus
+blocks), in a single emit. The audience comes from a node-local
+adjacency cache with TTL, invalidated on every node (room registry
+delta channel) when matches, conversations or blocks change.
+
+Offline events are debounced: a disconnect is announced only if the
+user is still offline after `offline_grace` seconds, and a reconnect
+inside that window suppresses both the offline and the online event.
+"""
+import time
+import logging
+import threading
+from collections import OrderedDict, defaultdict
+from datetime import datetime
+from typing import Dict, FrozenSet, Iterable, Optional
+
+from .background import PeriodicTask
+from .conversation_list_cache import conversation_list_cache
+from .realtime_delivery import realtime_delivery, user_room
+from .room_registry import room_registry
+
+logger = logging.getLogger(__name__)
+
+AUDIENCE_CACHE_NAME = 'presence_audience'
+
+
+class PresenceAudienceCache:
+    """user_id -> users allowed to see their presence, with TTL and LRU bound"""
+
+    def __init__(self, ttl: int = 300, max_size: int = 20000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _load(self, user_id: int) -> FrozenSet[int]:
+        from app import db
+        from app.models import Match, Conversation, UserBlock
+
+        audience = set(row.matched_user_id for row in db.session.query(Match.matched_user_id).filter(
+            Match.user_id == user_id,
+            Match.is_mutual == True
+        ).all())
+
+        for row in db.session.query(Conversation.user1_id, Conversation.user2_id).filter(
+            db.or_(Conversation.user1_id == user_id, Conversation.user2_id == user_id),
+            Conversation.is_deleted == False
+        ).all():
+            audience.add(row.user2_id if row.user1_id == user_id else row.user1_id)
+
+        if audience:
+            for row in db.session.query(UserBlock.blocker_id, UserBlock.blocked_id).filter(
+                db.or_(UserBlock.blocker_id == user_id, UserBlock.blocked_id == user_id)
+            ).all():
+                audience.discard(row.blocked_id if row.blocker_id == user_id else row.blocker_id)
+
+        audience.discard(user_id)
+        return frozenset(audience)
+
+    def get(self, user_id: int) -> FrozenSet[int]:
+        """Users that must receive presence changes of user_id"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and entry[1] > now:
+                self._entries.move_to_end(user_id)
+                return entry[0]
+
+        audience = self._load(user_id)
+
+        with self._lock:
+            self._entries[user_id] = (audience, now + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+        return audience
+
+    def invalidate(self, *user_ids: int):
+        """Drop cached audiences on every node (match, unmatch, block, conversation changes)"""
+        self._drop(user_ids)
+        room_registry.invalidate(AUDIENCE_CACHE_NAME, user_ids)
+
+    def _drop(self, user_ids: Optional[Iterable[int]]):
+        """Drop entries on this node only (None: all of them)"""
+        with self._lock:
+            if user_ids is None:
+                self._entries.clear()
+                return
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+
+class PresenceFanout:
+    """Deliver presence transitions to the user's audience only"""
+
+    def __init__(self, audience: PresenceAudienceCache, offline_grace: float = 5.0):
+        self.audience = audience
+        self.offline_grace = offline_grace
+        self._pending_offline: Dict[int, float] = {}  # user_id -> due time
+        self._lock = threading.Lock()
+        self._stats = defaultdict(int)
+        self._task = PeriodicTask('presence-offline-debounce', 1.0, self.flush_offline)
+
+    def _deliver(self, user_id: int, status: str, skip_sid: Optional[str] = None):
+        timestamp = datetime.utcnow().isoformat()
+
+        audience = self.audience.get(user_id)
+        if not audience:
+            return
+
+        # is_online of this user is part of the audience's conversation lists
+        conversation_list_cache.bump(*audience)
+
+        realtime_delivery.dispatch('user_presence', f'user_{status}', {
+            'user_id': user_id,
+            'timestamp': timestamp
+        }, [user_room(other_id) for other_id in audience], skip_sid=skip_sid)
+        self._stats[f'{status}_delivered'] += 1
+        self._stats['recipients'] += len(audience)
+
+    def user_online(self, user_id: int, skip_sid: Optional[str] = None):
+        """User came online; silent if it is a reconnect inside the grace window"""
+        with self._lock:
+            if self._pending_offline.pop(user_id, None) is not None:
+                self._stats['flaps_suppressed'] += 1
+                return
+        self._deliver(user_id, 'online', skip_sid)
+
+    def user_offline(self, user_id: int):
+        """User went offline; announced after the grace window"""
+        with self._lock:
+            self._pending_offline[user_id] = time.time() + self.offline_grace
+        self._task.ensure_started()
+
+    def flush_offline(self):
+        """Announce debounced offline events that are still offline"""
+        now = time.time()
+        with self._lock:
+            due = [user_id for user_id, due_at in self._pending_offline.items() if due_at <= now]
+            for user_id in due:
+                del self._pending_offline[user_id]
+
+        if not due:
+            return
+
+        from .presence import presence
+
+        # The user may have reconnected through another worker
+        online = presence.are_online(due)
+        for user_id in due:
+            if online.get(user_id):
+                self._stats['flaps_suppressed'] += 1
+                continue
+            self._deliver(user_id, 'offline')
+
+    def get_stats(self) -> Dict[str, int]:
+        """Presence fan-out counters"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['pending_offline'] = len(self._pending_offline)
+        return stats
+
+
+# Global instances
+presence_audience = PresenceAudienceCache()
+room_registry.on_invalidate(AUDIENCE_CACHE_NAME, presence_audience._drop)
+presence_fanout = PresenceFanout(presence_audience)
@@ -0,0 +1,131 @@
+"""
+Batched push delivery over HTTP.
+
+Each push provider is reached through a gateway URL that accepts many
+messages per request (FCM v1 only sends one message per call, so in
+production the URL points at a relay that fans out; in tests at
+scripts/fake_push_server.py):
+
+    POST {url}
+    {"provider": "fcm", "messages": [{"token", "title", "body", "data"}, ...]}
+
+    200 -> {"results": [{"ok": true} | {"ok": false, "error": "UNREGISTERED"}, ...]}
+           one result per message, same order
+    429 / 5xx -> the whole batch is retried (Retry-After honored)
+    other 4xx -> the whole batch failed permanently
+
+Errors in PERMANENT_ERRORS are not retried; DEAD_TOKEN_ERRORS also mean
+the caller should forget the device token.
+"""
+import logging
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# The device token is no longer valid: forget it
+DEAD_TOKEN_ERRORS = frozenset({'UNREGISTERED', 'NotRegistered', 'InvalidRegistration'})
+PERMANENT_ERRORS = DEAD_TOKEN_ERRORS | {'INVALID_ARGUMENT', 'MismatchSenderId'}
+
+
+class PushResult(NamedTuple):
+    ok: bool
+    error: Optional[str] = None
+    retryable: bool = False
+    retry_after: Optional[float] = None
+
+
+class PushGateway:
+    """One provider endpoint; send_batch() splits into requests of `batch_size`"""
+
+    def __init__(self, provider: str, url: str, batch_size: int = 500, timeout: float = 5.0):
+        self.provider = provider
+        self.url = url
+        self.batch_size = batch_size
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=8)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.stats = {'requests': 0, 'sent': 0, 'failed': 0, 'retryable': 0}
+
+    def send_batch(self, messages: List[Dict[str, Any]]) -> List[PushResult]:
+        """Send messages ({token, title, body, data}); one PushResult per message"""
+        results = []
+        for start in range(0, len(messages), self.batch_size):
+            results.extend(self._post(messages[start:start + self.batch_size]))
+        return results
+
+    def _post(self, chunk: List[Dict[str, Any]]) -> List[PushResult]:
+        self.stats['requests'] += 1
+        try:
+            response = self.session.post(
+                self.url,
+                json={'provider': self.provider, 'messages': chunk},
+                timeout=self.timeout
+            )
+        except requests.RequestException as e:
+            logger.warning(f"Push gateway {self.provider} unreachable: {e}")
+            return self._all(chunk, PushResult(False, 'unreachable', retryable=True))
+
+        if response.status_code == 429 or response.status_code >= 500:
+            result = PushResult(False, f'HTTP {response.status_code}', retryable=True,
+                                retry_after=self._retry_after(response))
+            return self._all(chunk, result)
+
+        if response.status_code != 200:
+            return self._all(chunk, PushResult(False, f'HTTP {response.status_code}'))
+
+        try:
+            items = response.json().get('results') or []
+        except ValueError:
+            items = []
+        if len(items) != len(chunk):
+            return self._all(chunk, PushResult(False, 'bad gateway response', retryable=True))
+
+        results = []
+        for item in items:
+            if item.get('ok'):
+                results.append(PushResult(True))
+                continue
+            error = item.get('error') or 'unknown'
+            results.append(PushResult(False, error, retryable=error not in PERMANENT_ERRORS))
+        self._count(results)
+        return results
+
+    def _all(self, chunk, result: PushResult) -> List[PushResult]:
+        results = [result] * len(chunk)
+        self._count(results)
+        return results
+
+    def _count(self, results: List[PushResult]):
+        for result in results:
+            if result.ok:
+                self.stats['sent'] += 1
+            elif result.retryable:
+                self.stats['retryable'] += 1
+            else:
+                self.stats['failed'] += 1
+
+    @staticmethod
+    def _retry_after(response) -> Optional[float]:
+        try:
+            return float(response.headers.get('Retry-After'))
+        except (TypeError, ValueError):
+            return None
+
+
+def push_gateways_from_config(config) -> Dict[str, PushGateway]:
+    """Gateways for the providers with a configured URL (PUSH_FCM_URL)"""
+    gateways = {}
+    if config.get('PUSH_FCM_URL'):
+        gateways['fcm'] = PushGateway(
+            'fcm',
+            config['PUSH_FCM_URL'],
+            batch_size=config.get('PUSH_BATCH_SIZE', 500),
+            timeout=config.get('PUSH_TIMEOUT', 5.0)
+        )
+    return gateways
@@ -1,19 +1,210 @@
 """
 Rate limiting with development-friendly configurations
 Prevents abuse while being permissive during development
+
+Limits are enforced with GCRA (one atomic Lua script per Redis round
+trip) behind an in-process bucket per key: after each sync a worker may
+serve a share of the remaining allowance locally, without Redis, and the
+hits it served are charged on the next sync. Keys known to be over the
+limit are rejected locally until their retry time. When Redis is down the
+limiter fails open and logs at most once per minute.
+
+The local share is split across the worker processes (RATE_LIMIT_WORKERS,
+else gunicorn's WEB_CONCURRENCY) and capped at max_local hits, so the
+allowances handed out after a sync add up to at most local_share of what
+Redis reported. Worst case, every worker spends an allowance granted just
+before the key ran out: a key is over-admitted by at most
+min(local_share * remaining, workers * max_local) hits per sync interval.
 """
 import os
 import time
+import math
 import logging
+import threading
+from collections import OrderedDict
 from functools import wraps
-from typing import Dict, Optional, Callable
+from typing import Dict, Optional, Callable, Tuple
 from flask import request, jsonify, current_app
 from flask_socketio import disconnect
 
+from .background import PeriodicTask
 from .redis_client import redis_client
 
 logger = logging.getLogger(__name__)
 
+
+def _worker_count() -> int:
+    """Worker processes sharing the limits (RATE_LIMIT_WORKERS or WEB_CONCURRENCY)"""
+    try:
+        return int(os.environ.get('RATE_LIMIT_WORKERS') or os.environ.get('WEB_CONCURRENCY') or 1)
+    except ValueError:
+        return 1
+
+
+class _LocalBucket:
+    __slots__ = ('limit', 'window', 'allowance', 'pending', 'synced_at', 'blocked_until', 'tat')
+
+    def __init__(self, limit: int, window: float):
+        self.limit = limit
+        self.window = window
+        self.allowance = 0        # hits this worker may still serve without Redis
+        self.pending = 0          # hits served locally, not yet charged in Redis
+        self.synced_at = 0.0
+        self.blocked_until = 0.0
+        self.tat = 0.0            # GCRA state when there is no Redis
+
+
+class GCRALimiter:
+    """GCRA rate limiter: Redis Lua script plus an in-process pre-check"""
+
+    def __init__(self, sync_interval: float = 1.0, local_share: float = 0.5,
+                 workers: Optional[int] = None, max_local: int = 10,
+                 max_keys: int = 100000, error_log_interval: float = 60):
+        self.sync_interval = sync_interval
+        self.local_share = local_share
+        self.workers = max(1, workers or _worker_count())
+        self.max_local = max_local
+        self.max_keys = max_keys
+        self.error_log_interval = error_log_interval
+        self._buckets = OrderedDict()  # key -> _LocalBucket
+        self._lock = threading.Lock()
+        self._task = None
+        self._last_error_log = 0.0
+        self._suppressed_errors = 0
+        self.stats = {'local': 0, 'remote': 0, 'rejected': 0, 'failed_open': 0, 'synced': 0}
+
+    def _bucket(self, key: str, limit: int, window: float) -> _LocalBucket:
+        """Bucket of a key (lock held)"""
+        bucket = self._buckets.get(key)
+        if bucket is None or bucket.limit != limit or bucket.window != window:
+            bucket = self._buckets[key] = _LocalBucket(limit, window)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def check(self, key: str, limit: int, window: float) -> Tuple[bool, int, float]:
+        """One hit on `key`. Returns (allowed, remaining, retry_after seconds)"""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._bucket(key, limit, window)
+            if redis_client.redis_client is None:
+                return self._check_local(bucket, now)
+
+            if bucket.blocked_until > now:
+                self.stats['rejected'] += 1
+                return False, 0, bucket.blocked_until - now
+
+            if bucket.allowance > 0 and now - bucket.synced_at < self.sync_interval:
+                bucket.allowance -= 1
+                bucket.pending += 1
+                self.stats['local'] += 1
+                return True, bucket.allowance, 0.0
+
+            served, bucket.pending = bucket.pending, 0
+
+        self._ensure_sync()
+        try:
+            allowed, remaining, retry_after = redis_client.rate_limit(key, limit, window, served=served)
+        except Exception as e:
+            with self._lock:
+                bucket.pending += served
+                self.stats['failed_open'] += 1
+            self._log_failure(e)
+            return True, limit, 0.0
+
+        with self._lock:
+            self._apply(bucket, now, allowed, remaining, retry_after)
+            self.stats['remote'] += 1
+            if not allowed:
+                self.stats['rejected'] += 1
+        return allowed, remaining, retry_after
+
+    def _apply(self, bucket: _LocalBucket, now: float, allowed: bool, remaining: int, retry_after: float):
+        """Store the Redis verdict in the local bucket (lock held)"""
+        bucket.synced_at = now
+        bucket.allowance = self._local_allowance(remaining)
+        bucket.blocked_until = 0.0 if allowed else now + retry_after
+
+    def _local_allowance(self, remaining: int) -> int:
+        """This worker's slice of the remaining allowance"""
+        return min(self.max_local, int(remaining * self.local_share / self.workers))
+
+    def _check_local(self, bucket: _LocalBucket, now: float) -> Tuple[bool, int, float]:
+        """GCRA in process only (development without Redis, lock held)"""
+        interval = bucket.window / bucket.limit
+        tat = max(bucket.tat, now)
+        next_tat = tat + interval
+        if next_tat - bucket.window > now:
+            self.stats['rejected'] += 1
+            return False, 0, next_tat - bucket.window - now
+        bucket.tat = next_tat
+        return True, int((now + bucket.window - next_tat) / interval), 0.0
+
+    def flush(self):
+        """Charge hits served locally for keys that went quiet (one pipeline)"""
+        if redis_client.redis_client is None:
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            due = [(key, bucket, bucket.pending) for key, bucket in self._buckets.items()
+                   if bucket.pending and now - bucket.synced_at >= self.sync_interval]
+            for _, bucket, _ in due:
+                bucket.pending = 0
+        if not due:
+            return
+
+        try:
+            pipe = redis_client.redis_client.pipeline(transaction=False)
+            for key, bucket, served in due:
+                interval = max(1, int(bucket.window * 1000 // bucket.limit))
+                redis_client.scripts['rate_limit'](
+                    keys=[key], args=[interval, int(bucket.window * 1000), served, 0], client=pipe
+                )
+            results = pipe.execute()
+        except Exception as e:
+            with self._lock:
+                for _, bucket, served in due:
+                    bucket.pending += served
+            self._log_failure(e)
+            return
+
+        with self._lock:
+            for (_, bucket, _), (_, remaining, _) in zip(due, results):
+                bucket.synced_at = now
+                bucket.allowance = self._local_allowance(remaining)
+            self.stats['synced'] += len(due)
+
+    def _ensure_sync(self):
+        if self._task is None:
+            self._task = PeriodicTask('rate-limit-sync', self.sync_interval, self.flush)
+        try:
+            self._task.ensure_started()
+        except RuntimeError:
+            # Outside an application context (scripts): hits sync on the next check
+            pass
+
+    def _log_failure(self, error: Exception):
+        """Fail-open log, throttled to one line per error_log_interval"""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_error_log < self.error_log_interval:
+                self._suppressed_errors += 1
+                return
+            suppressed, self._suppressed_errors = self._suppressed_errors, 0
+            self._last_error_log = now
+        logger.error(f"Rate limiting unavailable, failing open ({suppressed} similar errors suppressed): {error}")
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+# Global GCRA limiter (shared by RateLimiter and RedisClient.check_rate_limit)
+gcra_limiter = GCRALimiter()
+
 class RateLimiter:
     """Rate limiter with development/production configurations"""
     
@@ -68,39 +259,34 @@ class RateLimiter:
         Check if request is within rate limit
         Returns: (allowed: bool, info: dict)
         """
-        try:
-            if identifier is None:
-                identifier = self.get_client_identifier()
-            
-            # Use custom limit or default for type
-            if custom_limit:
-                limit, window = custom_limit
-            else:
-                limit, window = self.limits.get(limit_type, (1000, 60))  # Very high default
-            
-            # Create Redis key
-            key = f"rate_limit:{limit_type}:{identifier}"
-            
-            # Check with Redis (or fallback)
-            allowed = redis_client.check_rate_limit(key, limit, window)
-            
-            info = {
-                'limit_type': limit_type,
-                'identifier': identifier,
-                'limit': limit,
-                'window': window,
-                'allowed': allowed
-            }
-            
-            if not allowed:
-                logger.warning(f"Rate limit exceeded: {info}")
-            
-            return allowed, info
-            
-        except Exception as e:
-            logger.error(f"Rate limit check failed: {e}")
-            # Fail open - allow request if rate limiting fails
-            return True, {'error': str(e)}
+        if identifier is None:
+            identifier = self.get_client_identifier()
+        
+        # Use custom limit or default for type
+        if custom_limit:
+            limit, window = custom_limit
+        else:
+            limit, window = self.limits.get(limit_type, (1000, 60))  # Very high default
+        
+        # Local bucket first; Redis (or the in-process fallback) when due
+        allowed, remaining, retry_after = gcra_limiter.check(
+            f"rate_limit:{limit_type}:{identifier}", limit, window
+        )
+        
+        info = {
+            'limit_type': limit_type,
+            'identifier': identifier,
+            'limit': limit,
+            'window': window,
+            'allowed': allowed,
+            'remaining': remaining,
+            'retry_after': retry_after
+        }
+        
+        if not allowed:
+            logger.warning(f"Rate limit exceeded: {info}")
+        
+        return allowed, info
     
     def rate_limit(self, 
                   limit_type: str, 
@@ -123,7 +309,7 @@ class RateLimiter:
                             'rate_limit_info': {
                                 'limit': info.get('limit'),
                                 'window': info.get('window'),
-                                'retry_after': info.get('window', 60)
+                                'retry_after': max(1, math.ceil(info.get('retry_after') or 0))
                             }
                         }), 429
                 
@@ -0,0 +1,132 @@
+"""
+Read-receipt coalescing.
+Clients send dm:read constantly while scrolling. Receipts are kept in
+memory as a monotonic max per (conversation, user) and flushed every
+`flush_interval` seconds: one batched upsert into message_reads and one
+dm:read-receipt per row the upsert actually moved forward. Stale or
+repeated receipts never reach the database; the last flushed watermarks
+are kept in a bounded LRU.
+Pending receipts live in the worker that received them; a crash loses
+at most one flush interval, and the next read event restores them.
+"""
+import time
+import logging
+import threading
+from collections import OrderedDict, defaultdict
+from datetime import datetime
+from typing import Dict
+
+from .background import PeriodicTask
+from .conversation_list_cache import conversation_list_cache
+from .message_ids import validate_message_id, message_id_timestamp
+from .realtime_delivery import realtime_delivery, user_room
+
+logger = logging.getLogger(__name__)
+
+# Tolerated clock skew for watermark ULIDs ahead of the server clock
+MAX_FUTURE_SKEW_MS = 60000
+
+
+class ReadReceiptCoalescer:
+    """Accumulate read watermarks and flush them in batches"""
+
+    def __init__(self, flush_interval: float = 0.25, max_known: int = 50000):
+        self._pending = {}   # (conversation_id, user_id) -> (up_to_message_id, other_user_id)
+        self._known = OrderedDict()  # (conversation_id, user_id) -> last flushed up_to_message_id (LRU)
+        self._max_known = max_known
+        self._lock = threading.Lock()
+        self._stats = defaultdict(int)
+        self._task = PeriodicTask('read-receipt-flush', flush_interval, self.flush)
+
+    def record(self, conversation_id: int, user_id: int, other_user_id: int,
+               up_to_message_id: str) -> bool:
+        """
+        Register a read watermark. Returns False if the id is invalid.
+        Older or repeated watermarks are accepted but dropped.
+        """
+        if not isinstance(up_to_message_id, str) or not validate_message_id(up_to_message_id):
+            return False
+        if message_id_timestamp(up_to_message_id) > time.time() * 1000 + MAX_FUTURE_SKEW_MS:
+            return False
+
+        key = (conversation_id, user_id)
+        with self._lock:
+            self._stats['received'] += 1
+            pending = self._pending.get(key)
+            current = pending[0] if pending else self._known.get(key)
+            if not pending and current:
+                self._known.move_to_end(key)
+            if current and up_to_message_id <= current:  # ULID comparison
+                self._stats['coalesced'] += 1
+                return True
+            self._pending[key] = (up_to_message_id, other_user_id)
+
+        self._task.ensure_started()
+        return True
+
+    def flush(self) -> int:
+        """Write pending watermarks in one upsert and emit the receipts"""
+        with self._lock:
+            if not self._pending:
+                return 0
+            pending, self._pending = self._pending, {}
+
+        from app import db
+        from app.models import MessageRead
+
+        try:
+            written = MessageRead.upsert_watermarks([{
+                'conversation_id': conversation_id,
+                'user_id': user_id,
+                'up_to_message_id': up_to_message_id
+            } for (conversation_id, user_id), (up_to_message_id, _) in pending.items()])
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Read receipt flush failed: {e}")
+            # Put them back unless a newer watermark arrived meanwhile
+            with self._lock:
+                for key, value in pending.items():
+                    current = self._pending.get(key)
+                    if not current or current[0] < value[0]:
+                        self._pending[key] = value
+            return 0
+
+        # Unread counts of the readers changed
+        if written:
+            conversation_list_cache.bump(*[user_id for _, user_id in written])
+        
+        with self._lock:
+            # A rejected row is already at or past ours, so ours stays a valid lower bound
+            for key, (up_to_message_id, _) in pending.items():
+                self._known[key] = up_to_message_id
+                self._known.move_to_end(key)
+            while len(self._known) > self._max_known:
+                self._known.popitem(last=False)
+            self._stats['flushes'] += 1
+            self._stats['written'] += len(written)
+            self._stats['rejected'] += len(pending) - len(written)
+
+        timestamp = datetime.utcnow().isoformat()
+        for (conversation_id, user_id), (up_to_message_id, other_user_id) in pending.items():
+            if (conversation_id, user_id) not in written:
+                continue
+            realtime_delivery.dispatch('messages_read', 'dm:read-receipt', {
+                'conversationId': conversation_id,
+                'userId': user_id,
+                'upToMessageId': up_to_message_id,
+                'timestamp': timestamp
+            }, [user_room(other_user_id)])
+
+        return len(written)
+
+    def get_stats(self) -> Dict[str, int]:
+        """Receipt counters and number of pending watermarks"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['pending'] = len(self._pending)
+        return stats
+
+
+# Global read receipt coalescer
+read_receipts = ReadReceiptCoalescer()
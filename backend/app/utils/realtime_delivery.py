@@ -0,0 +1,258 @@
+"""
+Realtime delivery layer for Socket.IO fan-out.
+Resolves the target rooms of an event once and emits a single packet,
+so a socket that is in several target rooms receives it only once.
+
+Binary frames (REALTIME_BINARY_FRAMES): sockets that opt in at connect
+join the ':bin' variant of their rooms and receive fan-out events as a
+single binary attachment (msgpack when available) instead of JSON text.
+The binary variant is only encoded and emitted while this node has at
+least one opted-in socket.
+
+Dispatch mode (REALTIME_DISPATCH_MODE): with 'dispatcher', dispatch()
+only appends an envelope to the events:realtime stream and the realtime
+dispatcher workers perform the emit; 'direct' emits in place.
+
+Node-aware routing: with Redis, room membership is tracked by the room
+registry and an event is emitted to local members and published only to
+the nodes that have members in the target rooms (see room_registry).
+"""
+import logging
+import threading
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional
+
+import socketio
+
+from .serialization import encode_binary
+from .room_registry import room_registry
+
+logger = logging.getLogger(__name__)
+
+
+def conversation_room(conversation_id: int) -> str:
+    """Room joined by sockets that have a conversation open"""
+    return f'conversation_{conversation_id}'
+
+
+def user_room(user_id: int) -> str:
+    """Personal room joined by every socket of a user"""
+    return f'user_{user_id}'
+
+
+def binary_room(room: str) -> str:
+    """Variant of a room joined by sockets that receive binary frames"""
+    return f'{room}:bin'
+
+
+class RealtimeDelivery:
+    """Deduplicated fan-out with per-event counters"""
+
+    def __init__(self, socketio=None, namespace: str = '/'):
+        self.socketio = socketio
+        self.namespace = namespace
+        self._binary_enabled = None
+        self._dispatch_mode = None
+        self._binary_sids = set()
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: {
+            'emits': 0,       # emit calls (one serialization + one publish each)
+            'rooms': 0,       # target rooms requested
+            'sessions': 0,    # distinct local sessions reached
+            'duplicates': 0,  # room memberships collapsed by deduplication
+            'published': 0,   # envelopes handed to the dispatcher
+            'nodes': 0,       # other nodes the event was routed to
+        })
+
+    def _get_socketio(self):
+        if self.socketio is None:
+            from app import socketio
+            self.socketio = socketio
+        return self.socketio
+
+    @property
+    def binary_enabled(self) -> bool:
+        if self._binary_enabled is None:
+            from flask import current_app
+            self._binary_enabled = bool(current_app.config.get('REALTIME_BINARY_FRAMES', False))
+        return self._binary_enabled
+
+    @property
+    def dispatch_mode(self) -> str:
+        if self._dispatch_mode is None:
+            from flask import current_app
+            self._dispatch_mode = current_app.config.get('REALTIME_DISPATCH_MODE', 'direct')
+        return self._dispatch_mode
+
+    # Socket registration
+    def register_socket(self, sid: str, binary: bool = False):
+        """Remember the frame format requested by a socket at connect"""
+        if binary and self.binary_enabled:
+            with self._lock:
+                self._binary_sids.add(sid)
+
+    def unregister_socket(self, sid: str):
+        with self._lock:
+            self._binary_sids.discard(sid)
+        room_registry.leave_all(sid)
+
+    def is_binary(self, sid: str) -> bool:
+        return sid in self._binary_sids
+
+    def join(self, room: str, sid: Optional[str] = None):
+        """join_room using the room variant that matches the socket's frame format"""
+        from flask import request
+        from flask_socketio import join_room
+
+        sid = sid or request.sid
+        join_room(binary_room(room) if self.is_binary(sid) else room, sid=sid, namespace=self.namespace)
+        room_registry.join(room, sid)
+
+    def leave(self, room: str, sid: Optional[str] = None):
+        """leave_room counterpart of join()"""
+        from flask import request
+        from flask_socketio import leave_room
+
+        sid = sid or request.sid
+        leave_room(binary_room(room) if self.is_binary(sid) else room, sid=sid, namespace=self.namespace)
+        room_registry.leave(room, sid)
+
+    def resolve_sessions(self, rooms: List[str], skip_sid: Optional[str] = None) -> Dict[str, int]:
+        """
+        Resolve the distinct local sessions behind a set of rooms.
+        Returns: {'sessions': distinct sids, 'memberships': room memberships}
+        """
+        server = getattr(self._get_socketio(), 'server', None)
+        manager = getattr(server, 'manager', None)
+        if manager is None:
+            return {'sessions': 0, 'memberships': 0}
+
+        sessions = set()
+        memberships = 0
+        for room in rooms:
+            for sid, _ in manager.get_participants(self.namespace, room):
+                if sid == skip_sid:
+                    continue
+                memberships += 1
+                sessions.add(sid)
+
+        return {'sessions': len(sessions), 'memberships': memberships}
+
+    def deliver(self, event: str, payload: Any, rooms: Iterable[str], skip_sid: Optional[str] = None) -> int:
+        """
+        Emit an event once to the union of the given rooms.
+        The payload is serialized once and published once; the client
+        manager sends one packet per distinct session.
+        Returns the number of distinct local sessions targeted.
+        """
+        target_rooms = sorted(set(room for room in rooms if room))
+        if not target_rooms:
+            return 0
+
+        resolved = self.resolve_sessions(
+            target_rooms + ([binary_room(room) for room in target_rooms] if self.binary_enabled else []),
+            skip_sid
+        )
+
+        nodes = 0
+        if room_registry.enabled:
+            # Local members directly, other nodes only if they have members
+            self.deliver_local(event, payload, target_rooms, skip_sid)
+            nodes = room_registry.publish(event, payload, target_rooms, skip_sid=skip_sid)
+        else:
+            self._emit(self._get_socketio().emit, event, payload, target_rooms, skip_sid)
+
+        with self._lock:
+            stats = self._stats[event]
+            stats['emits'] += 1
+            stats['rooms'] += len(target_rooms)
+            stats['sessions'] += resolved['sessions']
+            stats['duplicates'] += resolved['memberships'] - resolved['sessions']
+            stats['nodes'] += nodes
+
+        return resolved['sessions']
+
+    def deliver_local(self, event: str, payload: Any, rooms: List[str], skip_sid: Optional[str] = None):
+        """Emit to the members of the rooms connected to this node only (no message queue)"""
+        rooms = room_registry.local_rooms(rooms)
+        if not rooms:
+            return
+        server = getattr(self._get_socketio(), 'server', None)
+        if server is None:
+            return
+        manager = server.manager
+
+        def emit(event, data, to, skip_sid, namespace):
+            # Base Manager.emit: sends to local participants, never publishes
+            socketio.Manager.emit(manager, event, data, namespace, room=to, skip_sid=skip_sid)
+
+        self._emit(emit, event, payload, rooms, skip_sid)
+
+    def _emit(self, emit, event: str, payload: Any, rooms: List[str], skip_sid: Optional[str]):
+        emit(event, payload, to=rooms, skip_sid=skip_sid, namespace=self.namespace)
+        if self.binary_enabled and self._binary_sids:
+            # Same event for opted-in sockets, encoded once as a binary frame
+            emit(event, encode_binary(payload), to=[binary_room(room) for room in rooms],
+                 skip_sid=skip_sid, namespace=self.namespace)
+
+    def deliver_message(self, event: str, payload: Any, conversation_id: int,
+                        sender_id: int, receiver_id: int) -> int:
+        """Deliver a conversation event to the open chat and both participants"""
+        return self.deliver(event, payload, [
+            conversation_room(conversation_id),
+            user_room(sender_id),
+            user_room(receiver_id),
+        ])
+
+    def dispatch(self, channel: str, event: str, payload: Any, rooms: Iterable[str],
+                 skip_sid: Optional[str] = None) -> int:
+        """
+        Deliver an event from a request handler.
+        In dispatcher mode the envelope is appended once to the realtime
+        stream (`channel` tags its kind) and a dispatcher worker emits it;
+        otherwise (or without Redis) it is delivered directly.
+        Returns the local sessions targeted (0 when handed to the dispatcher).
+        """
+        rooms = sorted(set(room for room in rooms if room))
+        if not rooms:
+            return 0
+
+        if self.dispatch_mode == 'dispatcher':
+            from .event_stream import event_stream
+
+            if event_stream.append('realtime', {
+                'channel': channel,
+                'event': event,
+                'rooms': rooms,
+                'skip_sid': skip_sid,
+                'payload': payload
+            }):
+                with self._lock:
+                    self._stats[event]['published'] += 1
+                return 0
+
+        return self.deliver(event, payload, rooms, skip_sid=skip_sid)
+
+    def dispatch_message(self, channel: str, event: str, payload: Any, conversation_id: int,
+                         sender_id: int, receiver_id: int) -> int:
+        """dispatch() to the open chat and both participants"""
+        return self.dispatch(channel, event, payload, [
+            conversation_room(conversation_id),
+            user_room(sender_id),
+            user_room(receiver_id),
+        ])
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        """Per-event fan-out counters"""
+        with self._lock:
+            return {event: dict(stats) for event, stats in self._stats.items()}
+
+    def reset_stats(self):
+        """Reset fan-out counters"""
+        with self._lock:
+            self._stats.clear()
+
+
+# Global delivery instance; events routed to this node by other nodes land here
+realtime_delivery = RealtimeDelivery()
+room_registry.bind(realtime_delivery.deliver_local)
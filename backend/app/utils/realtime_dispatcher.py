@@ -0,0 +1,133 @@
+"""
+Realtime dispatcher worker (REALTIME_DISPATCH_MODE=dispatcher).
+
+Request handlers append one envelope per event to the events:realtime
+stream:
+
+    {"channel": ..., "event": ..., "rooms": [...], "skip_sid": ..., "payload": {...}}
+
+The dispatcher reads them through the 'dispatcher' consumer group and
+hands each one to RealtimeDelivery.deliver, which routes it with the room
+registry: the envelope is published once to rooms:node:{id} of every
+node with members in its rooms, and that node emits to its local sockets.
+The dispatcher holds no sockets itself.
+Each entry goes to one dispatcher of the group: run as many as needed.
+
+Entries are read in batches of `batch_size`; unread entries wait in the
+stream (backpressure without dropping messages). Inside a batch only the
+latest typing/presence event per target survives, and typing/presence
+entries older than `ephemeral_max_age_ms` (backlog after a restart) are
+skipped.
+"""
+import time
+import logging
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from .event_stream import StreamConsumer, entry_timestamp_ms
+
+logger = logging.getLogger(__name__)
+
+REALTIME_STREAM = 'realtime'
+DISPATCHER_GROUP = 'dispatcher'
+
+# Ephemeral state: superseded by the next event, safe to coalesce or skip
+EPHEMERAL_CHANNELS = frozenset({'typing_events', 'user_presence'})
+
+
+class RealtimeDispatcher:
+    """Consume dispatch envelopes from the realtime stream and emit them in batches"""
+
+    def __init__(self, delivery, batch_size: int = 200, ephemeral_max_age_ms: int = 10000):
+        self.delivery = delivery
+        self.ephemeral_max_age_ms = ephemeral_max_age_ms
+        self.consumer = StreamConsumer([REALTIME_STREAM], DISPATCHER_GROUP, self.handle, count=batch_size)
+        self._running = False
+        self._lock = threading.Lock()
+        self._stats = defaultdict(int)
+
+    # Delivery side
+    @staticmethod
+    def _coalesce_key(envelope: dict) -> Optional[Tuple]:
+        channel = envelope.get('channel')
+        if channel not in EPHEMERAL_CHANNELS:
+            return None
+        payload = envelope.get('payload') or {}
+        user_id = payload.get('userId', payload.get('user_id'))
+        if channel == 'user_presence':
+            # user_online and user_offline of the same user replace each other
+            return (channel, tuple(envelope['rooms']), user_id)
+        return (channel, envelope['event'], tuple(envelope['rooms']), user_id,
+                payload.get('conversationId', payload.get('chat_id')))
+
+    def coalesce(self, batch: List[Tuple[str, dict]]) -> List[Tuple[str, dict]]:
+        """Keep only the latest ephemeral event per target, preserving order"""
+        latest = {}
+        for index, (_, envelope) in enumerate(batch):
+            key = self._coalesce_key(envelope)
+            if key is not None:
+                latest[key] = index
+
+        keep = set(latest.values())
+        return [item for index, item in enumerate(batch)
+                if item[1].get('channel') not in EPHEMERAL_CHANNELS or index in keep]
+
+    def handle(self, name: str, events: List[Tuple[str, Any]]):
+        """StreamConsumer handler: emit a batch of envelopes"""
+        cutoff = time.time() * 1000 - self.ephemeral_max_age_ms
+        batch = []
+        for entry_id, envelope in events:
+            if not isinstance(envelope, dict) or not envelope.get('event') or not envelope.get('rooms'):
+                self._count('invalid')
+                continue
+            if envelope.get('channel') in EPHEMERAL_CHANNELS and entry_timestamp_ms(entry_id) < cutoff:
+                self._count('expired')
+                continue
+            batch.append((entry_id, envelope))
+
+        self.deliver_batch(batch)
+
+    def deliver_batch(self, batch: List[Tuple[str, dict]]) -> int:
+        """Emit a batch of envelopes. Returns the number of emits"""
+        items = self.coalesce(batch)
+        delivered = 0
+        for _, envelope in items:
+            try:
+                self.delivery.deliver(
+                    envelope['event'],
+                    envelope.get('payload'),
+                    envelope['rooms'],
+                    skip_sid=envelope.get('skip_sid')
+                )
+                delivered += 1
+            except Exception as e:
+                self._count('failed')
+                logger.error(f"Realtime dispatch of {envelope['event']} failed: {e}")
+
+        with self._lock:
+            self._stats['batches'] += 1
+            self._stats['delivered'] += delivered
+            self._stats['coalesced'] += len(batch) - len(items)
+        return delivered
+
+    def _count(self, key: str, amount: int = 1):
+        with self._lock:
+            self._stats[key] += amount
+
+    # Lifecycle
+    def run(self):
+        """Block consuming and emitting until stop() is called"""
+        self._running = True
+        logger.info(f"Realtime dispatcher consuming as {self.consumer.consumer}")
+        self.consumer.run(lambda: not self._running)
+
+    def stop(self):
+        self._running = False
+
+    def get_stats(self) -> Dict[str, int]:
+        """Dispatcher and stream consumer counters"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update(self.consumer.stats)
+        return stats
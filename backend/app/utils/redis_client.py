@@ -1,8 +1,19 @@
-"""Redis client with DEV fallbacks and PROD pub/sub capabilities."""
+"""
+Redis client with DEV fallbacks and PROD pub/sub capabilities.
+
+Single pooled client for the whole app:
+- Configured connection pool (REDIS_MAX_CONNECTIONS, keepalive, timeouts)
+- batch(): auto-pipelining for request handlers, fire-and-forget writes
+  issued inside the block go out in one round trip when it exits
+- Multi-step operations run as server-side Lua scripts (rate limit
+  check-and-increment, socket connect/disconnect with presence)
+"""
 import os
 import json
 import logging
-from typing import Optional, Dict, Any, List
+import threading
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, List, Tuple, Union, Callable
 from datetime import datetime, timedelta
 
 try:
@@ -18,8 +29,99 @@ except ImportError:
             return None
     redis = MockRedis()
 
+from . import serialization
+
 logger = logging.getLogger(__name__)
 
+SOCKET_USER_TTL = 7200  # socket_id -> user_id mapping, refreshed by presence heartbeats
+
+# GCRA: KEYS[1] holds the theoretical arrival time (TAT, ms on the Redis clock)
+# ARGV: emission interval ms (window / limit), burst tolerance ms (window),
+#       hits already served by an in-process bucket (always charged),
+#       cost of the request being checked (0 = only sync served hits)
+# Returns {allowed, remaining, retry_after_ms}
+RATE_LIMIT_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local interval = tonumber(ARGV[1])
+local tolerance = tonumber(ARGV[2])
+local tat = tonumber(redis.call('GET', KEYS[1]) or '0')
+if tat < now then
+    tat = now
+end
+tat = tat + tonumber(ARGV[3]) * interval
+local next_tat = tat + tonumber(ARGV[4]) * interval
+local allowed = 0
+local retry_after = 0
+if next_tat - tolerance <= now then
+    allowed = 1
+    tat = next_tat
+else
+    retry_after = next_tat - tolerance - now
+end
+if tat > now then
+    redis.call('SET', KEYS[1], tat, 'PX', tat - now)
+end
+local remaining = math.floor((now + tolerance - tat) / interval)
+if remaining < 0 then
+    remaining = 0
+end
+return {allowed, remaining, retry_after}
+"""
+
+# KEYS: socket map, presence marker, presence sockets zset, online set
+# ARGV: user_id, socket_id, now, presence ttl, socket map ttl
+# Returns 1 if the user already had a live socket
+SOCKET_CONNECT_SCRIPT = """
+local now = tonumber(ARGV[3])
+local ttl = tonumber(ARGV[4])
+local was_online = redis.call('EXISTS', KEYS[2])
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[5])
+redis.call('ZADD', KEYS[3], now, ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[3], '-inf', now - ttl)
+redis.call('EXPIRE', KEYS[3], ttl)
+redis.call('SET', KEYS[2], 1, 'EX', ttl)
+redis.call('SADD', KEYS[4], ARGV[1])
+return was_online
+"""
+
+# Same KEYS; ARGV: user_id, socket_id, now, presence ttl
+# Returns 1 if it was the user's last live socket
+SOCKET_DISCONNECT_SCRIPT = """
+local now = tonumber(ARGV[3])
+redis.call('DEL', KEYS[1])
+redis.call('ZREM', KEYS[3], ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[3], '-inf', now - tonumber(ARGV[4]))
+if redis.call('ZCARD', KEYS[3]) > 0 then
+    return 0
+end
+redis.call('DEL', KEYS[2], KEYS[3])
+redis.call('SREM', KEYS[4], ARGV[1])
+return 1
+"""
+
+
+def socket_user_key(socket_id: str) -> str:
+    return f"socket:user:{socket_id}"
+
+
+class _BatchPipeline:
+    """
+    Write-only pipeline handed out by write_pipeline() inside batch():
+    commands queue on the batch and execute() is deferred to its exit, so
+    there are no results to return.
+    """
+
+    def __init__(self, pipeline):
+        self._pipeline = pipeline
+
+    def __getattr__(self, name):
+        return getattr(self._pipeline, name)
+
+    def execute(self, *args, **kwargs):
+        return None
+
+
 class RedisClient:
     """Redis client with in-memory fallback for DEV."""
     
@@ -29,9 +131,12 @@ class RedisClient:
         self.is_development = os.environ.get('FLASK_ENV', 'development') == 'development'
         
         # Fallback in-memory storage for development
-        self._memory_store = {}
         self._memory_pubsub = {}
-        self._presence = {}
+        
+        # Sockets of this worker (sticky sessions): lookups skip Redis
+        self._socket_users = {}
+        self._local = threading.local()
+        self.scripts = {}
         
         self._initialize_redis()
     
@@ -48,11 +153,22 @@ class RedisClient:
         
         try:
             redis_url = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
-            self.redis_client = redis.from_url(redis_url, decode_responses=True)
+            pool = redis.ConnectionPool.from_url(
+                redis_url,
+                decode_responses=True,
+                max_connections=int(os.environ.get('REDIS_MAX_CONNECTIONS', '100')),
+                socket_keepalive=True,
+                socket_connect_timeout=5,
+                socket_timeout=5,
+                retry_on_timeout=True,
+                health_check_interval=30,
+            )
+            self.redis_client = redis.Redis(connection_pool=pool)
             
             # Test connection
             self.redis_client.ping()
             self.pubsub = self.redis_client.pubsub()
+            self._register_scripts()
             logger.info("Redis connected successfully")
             
         except (ConnectionError, RedisError) as e:
@@ -64,6 +180,63 @@ class RedisClient:
                 logger.warning(f"Redis connection failed, using fallback: {e}")
                 self.redis_client = None
     
+    def _register_scripts(self):
+        """Register Lua scripts (EVALSHA, reloaded automatically after a flush)"""
+        self.scripts = {
+            'rate_limit': self.redis_client.register_script(RATE_LIMIT_SCRIPT),
+            'socket_connect': self.redis_client.register_script(SOCKET_CONNECT_SCRIPT),
+            'socket_disconnect': self.redis_client.register_script(SOCKET_DISCONNECT_SCRIPT),
+        }
+    
+    def run_script(self, name: str, keys: List[str], args: List[Any]):
+        """Run a registered Lua script in one round trip"""
+        if name not in self.scripts:
+            self._register_scripts()
+        return self.scripts[name](keys=keys, args=args, client=self.redis_client)
+    
+    # Auto-pipelining
+    @contextmanager
+    def batch(self):
+        """
+        Auto-pipelining for request handlers: writes issued inside the block
+        through publish(), writer(), write_pipeline() and the socket map are
+        queued and sent in one round trip on exit. Reads (including
+        pipeline() results) still run immediately.
+        """
+        if not self.redis_client or getattr(self._local, 'pipeline', None) is not None:
+            yield  # No Redis, or nested inside an outer batch
+            return
+        
+        self._local.pipeline = self.redis_client.pipeline(transaction=False)
+        try:
+            yield
+        finally:
+            pipe, self._local.pipeline = self._local.pipeline, None
+            if len(pipe):
+                try:
+                    pipe.execute()
+                except Exception as e:
+                    logger.error(f"Redis batch failed: {e}")
+    
+    def pipeline(self):
+        """Non-transactional pipeline; execute() returns the results immediately"""
+        return self.redis_client.pipeline(transaction=False)
+    
+    def write_pipeline(self):
+        """
+        Pipeline for writes whose results are not needed: inside batch() it
+        joins the batch (execute() is deferred and returns None)
+        """
+        active = getattr(self._local, 'pipeline', None)
+        if active is not None:
+            return _BatchPipeline(active)
+        return self.redis_client.pipeline(transaction=False)
+    
+    def writer(self):
+        """Target for fire-and-forget writes: the active batch or the client"""
+        active = getattr(self._local, 'pipeline', None)
+        return active if active is not None else self.redis_client
+    
     def is_connected(self) -> bool:
         """Check if Redis is connected"""
         if not self.redis_client:
@@ -75,11 +248,13 @@ class RedisClient:
             return False
     
     # Pub/Sub operations
-    def publish(self, channel: str, message: Dict[str, Any]):
-        """Publish message to channel"""
+    def publish(self, channel: str, message: Union[Dict[str, Any], str, bytes]):
+        """Publish message to channel (dict, or data already encoded by the caller)"""
         try:
             if self.redis_client:
-                self.redis_client.publish(channel, json.dumps(message))
+                if not isinstance(message, (str, bytes)):
+                    message = serialization.dumps(message)
+                self.writer().publish(channel, message)
                 return True
             else:
                 # Development fallback - store in memory
@@ -108,181 +283,115 @@ class RedisClient:
             logger.error(f"Subscribe failed: {e}")
             return None
     
-    # Presence system
-    def set_user_online(self, user_id: int, socket_id: str = None):
-        """Set user as online"""
+    def subscribe_to_events(self, channels: List[str], callback: Callable[[str, Any], None],
+                            should_stop: Callable[[], bool] = lambda: False):
+        """
+        Blocking pub/sub consumer for workers: callback(channel, data) per
+        message. Returns when should_stop() is true or the connection drops.
+        """
+        if not self.redis_client:
+            logger.error("Pub/Sub requires Redis")
+            return
+        
+        pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
         try:
-            if self.redis_client:
-                key = f"presence:user:{user_id}"
-                data = {
-                    'online': True,
-                    'last_seen': datetime.utcnow().isoformat(),
-                    'socket_id': socket_id
-                }
-                self.redis_client.setex(key, 3600, json.dumps(data))  # 1 hour TTL
-            else:
-                # Development fallback
-                self._presence[user_id] = {
-                    'online': True,
-                    'last_seen': datetime.utcnow().isoformat(),
-                    'socket_id': socket_id
-                }
+            pubsub.subscribe(*channels)
+            while not should_stop():
+                message = pubsub.get_message(timeout=1.0)
+                if not message or message['type'] != 'message':
+                    continue
+                try:
+                    data = serialization.loads(message['data'])
+                except ValueError as e:
+                    logger.error(f"Error parsing Pub/Sub message: {e}")
+                    continue
+                callback(message['channel'], data)
                 
         except Exception as e:
-            logger.error(f"Set user online failed: {e}")
+            logger.error(f"Pub/Sub listener failed: {e}")
+        finally:
+            pubsub.close()
+    
+    # Presence system (delegates to app.utils.presence, which refcounts devices)
+    def set_user_online(self, user_id: int, socket_id: str = None):
+        """Set user as online"""
+        from .presence import presence
+        presence.connect(user_id, socket_id or 'default')
     
     def set_user_offline(self, user_id: int):
-        """Set user as offline"""
-        try:
-            if self.redis_client:
-                key = f"presence:user:{user_id}"
-                self.redis_client.delete(key)
-            else:
-                # Development fallback
-                self._presence.pop(user_id, None)
-                
-        except Exception as e:
-            logger.error(f"Set user offline failed: {e}")
+        """Set user as offline on every device"""
+        from .presence import presence
+        presence.clear_user(user_id)
     
     def is_user_online(self, user_id: int) -> bool:
         """Check if user is online"""
-        try:
-            if self.redis_client:
-                key = f"presence:user:{user_id}"
-                return self.redis_client.exists(key) == 1
-            else:
-                # Development fallback
-                return user_id in self._presence
-                
-        except Exception as e:
-            logger.error(f"Check user online failed: {e}")
-            return False
+        from .presence import presence
+        return presence.is_online(user_id)
     
     def get_online_users(self) -> List[int]:
         """Get list of online user IDs"""
-        try:
-            if self.redis_client:
-                keys = self.redis_client.keys("presence:user:*")
-                return [int(key.split(":")[-1]) for key in keys]
-            else:
-                # Development fallback
-                return list(self._presence.keys())
-                
-        except Exception as e:
-            logger.error(f"Get online users failed: {e}")
-            return []
+        from .presence import presence
+        return presence.get_online_users()
     
     # Socket-User mapping for SocketIO sessions
-    def set_socket_user(self, socket_id: str, user_id: int):
-        """Map socket_id to user_id"""
+    def set_socket_user(self, socket_id: str, user_id: int, local_only: bool = False):
+        """Map socket_id to user_id (local_only: Redis already written by a script)"""
+        self._socket_users[socket_id] = user_id
+        if local_only:
+            return
+        
         try:
             if self.redis_client:
-                key = f"socket:user:{socket_id}"
-                self.redis_client.setex(key, 7200, str(user_id))  # 2 hours TTL
-            else:
-                # Development fallback
-                if not hasattr(self, '_socket_users'):
-                    self._socket_users = {}
-                self._socket_users[socket_id] = user_id
+                self.writer().setex(socket_user_key(socket_id), SOCKET_USER_TTL, str(user_id))
                 
         except Exception as e:
             logger.error(f"Set socket user failed: {e}")
     
     def get_socket_user(self, socket_id: str) -> Optional[int]:
-        """Get user_id from socket_id"""
+        """Get user_id from socket_id (sockets of this worker never hit Redis)"""
+        user_id = self._socket_users.get(socket_id)
+        if user_id is not None or not self.redis_client:
+            return user_id
+        
         try:
-            if self.redis_client:
-                key = f"socket:user:{socket_id}"
-                user_id_str = self.redis_client.get(key)
-                return int(user_id_str) if user_id_str else None
-            else:
-                # Development fallback
-                if not hasattr(self, '_socket_users'):
-                    self._socket_users = {}
-                return self._socket_users.get(socket_id)
+            user_id_str = self.redis_client.get(socket_user_key(socket_id))
+            return int(user_id_str) if user_id_str else None
                 
         except Exception as e:
             logger.error(f"Get socket user failed: {e}")
             return None
     
-    def remove_socket_user(self, socket_id: str):
+    def remove_socket_user(self, socket_id: str, local_only: bool = False):
         """Remove socket_id to user_id mapping"""
+        self._socket_users.pop(socket_id, None)
+        if local_only:
+            return
+        
         try:
             if self.redis_client:
-                key = f"socket:user:{socket_id}"
-                self.redis_client.delete(key)
-            else:
-                # Development fallback
-                if hasattr(self, '_socket_users'):
-                    self._socket_users.pop(socket_id, None)
+                self.writer().delete(socket_user_key(socket_id))
                 
         except Exception as e:
             logger.error(f"Remove socket user failed: {e}")
     
     # Rate limiting
+    def rate_limit(self, key: str, limit: int, window: float, served: int = 0,
+                   cost: int = 1) -> Tuple[bool, int, float]:
+        """
+        GCRA check in one round trip: `limit` requests per `window` seconds.
+        `served` hits already allowed locally are charged first.
+        Returns (allowed, remaining, retry_after seconds). Raises on Redis errors.
+        """
+        interval = max(1, int(window * 1000 // limit))
+        allowed, remaining, retry_after = self.run_script(
+            'rate_limit', [key], [interval, int(window * 1000), served, cost]
+        )
+        return bool(allowed), int(remaining), retry_after / 1000.0
+    
     def check_rate_limit(self, key: str, limit: int, window: int) -> bool:
         """Check rate limit (requests per window in seconds)"""
-        try:
-            if self.redis_client:
-                pipe = self.redis_client.pipeline()
-                pipe.incr(key)
-                pipe.expire(key, window)
-                results = pipe.execute()
-                
-                current_count = results[0]
-                return current_count <= limit
-            else:
-                # Development fallback - very permissive
-                # TODO: PRODUCTION - Implement proper rate limiting
-                logger.debug(f"Rate limit check (dev mode): {key} - always allowing")
-                return True
-                
-        except Exception as e:
-            logger.error(f"Rate limit check failed: {e}")
-            # Fail open in case of Redis issues
-            return True
-    
-    # Chat rooms
-    def join_room(self, room: str, user_id: int):
-        """Add user to room"""
-        try:
-            if self.redis_client:
-                self.redis_client.sadd(f"room:{room}", user_id)
-            else:
-                # Development fallback
-                if room not in self._memory_store:
-                    self._memory_store[room] = set()
-                self._memory_store[room].add(user_id)
-                
-        except Exception as e:
-            logger.error(f"Join room failed: {e}")
-    
-    def leave_room(self, room: str, user_id: int):
-        """Remove user from room"""
-        try:
-            if self.redis_client:
-                self.redis_client.srem(f"room:{room}", user_id)
-            else:
-                # Development fallback
-                if room in self._memory_store:
-                    self._memory_store[room].discard(user_id)
-                    
-        except Exception as e:
-            logger.error(f"Leave room failed: {e}")
-    
-    def get_room_users(self, room: str) -> List[int]:
-        """Get users in room"""
-        try:
-            if self.redis_client:
-                users = self.redis_client.smembers(f"room:{room}")
-                return [int(u) for u in users]
-            else:
-                # Development fallback
-                return list(self._memory_store.get(room, set()))
-                
-        except Exception as e:
-            logger.error(f"Get room users failed: {e}")
-            return []
+        from .rate_limiter import gcra_limiter
+        return gcra_limiter.check(key, limit, window)[0]
 
 
 class MockPubSub:
@@ -0,0 +1,354 @@
+"""
+Room registry with a node-local membership index.
+
+Each worker (node) keeps room -> sessions for its own sockets in process.
+Only transitions are shared: when a room gains its first local member or
+loses its last one, the node updates rooms:members:{room} (the set of node
+ids with members) and publishes a compact delta on rooms:deltas:
+
+    {"node": "...", "join": ["conversation_7"], "leave": ["user_3"]}
+
+Nodes cache room -> nodes for the rooms they deliver to and keep the cache
+current from the deltas, so routing an event needs no Redis read. Deltas
+that arrive while a room is being loaded are replayed on top of the loaded
+set, so a load never overwrites a newer join or leave. An event
+is emitted locally and published once to rooms:node:{id} of every other
+node that has members in its rooms; nodes without members never see it.
+
+Nodes announce themselves in the rooms:nodes sorted set every
+`heartbeat_interval` seconds; nodes that stop doing so are ignored and
+lazily removed from the room sets.
+
+The delta channel also carries invalidations of other node-local caches
+(conversation membership, presence audiences):
+
+    {"node": "...", "invalidate": {"conversation_membership": [7]}}
+
+Each cache registers a callback with on_invalidate(); after a listener
+reconnect every callback is called with None, since invalidations published
+meanwhile were missed.
+"""
+import os
+import time
+import uuid
+import socket
+import logging
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, Iterable, List, Optional
+
+from . import serialization
+from .background import PeriodicTask
+from .redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+DELTAS_CHANNEL = 'rooms:deltas'
+NODES_KEY = 'rooms:nodes'
+
+
+def room_members_key(room: str) -> str:
+    """Set of node ids with at least one member in the room"""
+    return f"rooms:members:{room}"
+
+
+def node_channel(node_id: str) -> str:
+    """Pub/Sub channel with the deliveries addressed to one node"""
+    return f"rooms:node:{node_id}"
+
+
+class RoomRegistry:
+    """Node-local room index, membership deltas and node-aware routing"""
+
+    def __init__(self, heartbeat_interval: float = 5, cache_ttl: float = 30, max_cached_rooms: int = 100000):
+        self.node_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.heartbeat_interval = heartbeat_interval
+        self.cache_ttl = cache_ttl
+        self.max_cached_rooms = max_cached_rooms
+
+        self._rooms = defaultdict(set)     # room -> local sids
+        self._sid_rooms = defaultdict(set)  # sid -> rooms
+        self._routes = OrderedDict()       # room -> (node ids, loaded at)
+        self._loading = defaultdict(list)  # room -> delta logs of route loads in flight
+        self._alive = None                 # live node ids (None until the first heartbeat)
+        self._dead_members = set()         # (room, node) pairs to prune
+        self._lock = threading.Lock()
+        self._stats = defaultdict(int)
+        self._task = None
+        self._listening = False
+        self._deliver = None
+        self._invalidators = {}            # cache name -> callback(keys)
+
+    @property
+    def enabled(self) -> bool:
+        """Node-aware routing needs Redis; without it delivery stays in process"""
+        return redis_client.redis_client is not None
+
+    # Local membership
+    def join(self, room: str, sid: str):
+        with self._lock:
+            first = not self._rooms[room]
+            self._rooms[room].add(sid)
+            self._sid_rooms[sid].add(room)
+        if first:
+            self._publish_delta(join=[room])
+
+    def leave(self, room: str, sid: str):
+        with self._lock:
+            self._sid_rooms[sid].discard(room)
+            if not self._sid_rooms[sid]:
+                del self._sid_rooms[sid]
+            last = self._discard(room, sid)
+        if last:
+            self._publish_delta(leave=[room])
+
+    def leave_all(self, sid: str):
+        """Drop a disconnected socket from every room it was in"""
+        with self._lock:
+            rooms = self._sid_rooms.pop(sid, set())
+            emptied = [room for room in rooms if self._discard(room, sid)]
+        if emptied:
+            self._publish_delta(leave=emptied)
+
+    def _discard(self, room: str, sid: str) -> bool:
+        """Remove sid from a local room (lock held). True if the room became empty"""
+        members = self._rooms.get(room)
+        if not members or sid not in members:
+            return False
+        members.discard(sid)
+        if members:
+            return False
+        del self._rooms[room]
+        return True
+
+    def local_rooms(self, rooms: Iterable[str]) -> List[str]:
+        """Rooms with members on this node"""
+        return [room for room in rooms if room in self._rooms]
+
+    def _publish_delta(self, join: List[str] = (), leave: List[str] = ()):
+        if not self.enabled:
+            return
+        self._ensure_started()
+        try:
+            pipe = redis_client.write_pipeline()
+            for room in join:
+                pipe.sadd(room_members_key(room), self.node_id)
+            for room in leave:
+                pipe.srem(room_members_key(room), self.node_id)
+            pipe.publish(DELTAS_CHANNEL, serialization.dumps({
+                'node': self.node_id, 'join': list(join), 'leave': list(leave)
+            }))
+            pipe.execute()
+            self._count('deltas_published')
+        except Exception as e:
+            logger.error(f"Room membership delta failed: {e}")
+
+    # Cache invalidations
+    def on_invalidate(self, cache: str, callback):
+        """Register callback(keys) for invalidations of a node-local cache (keys=None: drop everything)"""
+        self._invalidators[cache] = callback
+
+    def ensure_listening(self):
+        """Start the delta listener on nodes that hold caches but no sockets (HTTP-only workers)"""
+        if self.enabled:
+            self._ensure_started()
+
+    def invalidate(self, cache: str, keys: Iterable) -> bool:
+        """Tell the other nodes to drop keys from a node-local cache"""
+        if not self.enabled:
+            return False
+        return redis_client.publish(DELTAS_CHANNEL, {
+            'node': self.node_id, 'invalidate': {cache: list(keys)}
+        })
+
+    def _apply_invalidations(self, invalidations: Optional[Dict[str, List[Any]]]):
+        """Run the registered callbacks; None means every cache, completely"""
+        if invalidations is None:
+            invalidations = dict.fromkeys(self._invalidators)
+        for cache, keys in invalidations.items():
+            callback = self._invalidators.get(cache)
+            if callback is None:
+                continue
+            try:
+                callback(keys)
+            except Exception as e:
+                logger.error(f"Cache invalidation for {cache} failed: {e}")
+        self._count('invalidations_received')
+
+    # Routing
+    def route(self, rooms: List[str]) -> Dict[str, List[str]]:
+        """Other live nodes with members in the given rooms: {node_id: [rooms]}"""
+        self._ensure_started()
+        now = time.time()
+        routes = {}
+        missing = []
+        with self._lock:
+            for room in rooms:
+                cached = self._routes.get(room)
+                if cached and now - cached[1] < self.cache_ttl:
+                    self._routes.move_to_end(room)
+                    routes[room] = tuple(cached[0])
+                else:
+                    missing.append(room)
+
+        if missing:
+            # Record the deltas received while SMEMBERS is in flight
+            logs = {}
+            with self._lock:
+                for room in missing:
+                    logs[room] = []
+                    self._loading[room].append(logs[room])
+            try:
+                pipe = redis_client.redis_client.pipeline(transaction=False)
+                for room in missing:
+                    pipe.smembers(room_members_key(room))
+                loaded = pipe.execute()
+            finally:
+                with self._lock:
+                    for room, log in logs.items():
+                        self._stop_loading(room, log)
+
+            loaded_at = time.time()
+            with self._lock:
+                for room, nodes in zip(missing, loaded):
+                    nodes = set(nodes)
+                    for joined, node in logs[room]:
+                        if joined:
+                            nodes.add(node)
+                        else:
+                            nodes.discard(node)
+                    routes[room] = tuple(nodes)
+                    self._routes[room] = (nodes, loaded_at)
+                    self._routes.move_to_end(room)
+                while len(self._routes) > self.max_cached_rooms:
+                    self._routes.popitem(last=False)
+            self._count('route_loads', len(missing))
+
+        targets = defaultdict(list)
+        alive = self._alive
+        for room, nodes in routes.items():
+            for node in nodes:
+                if node == self.node_id:
+                    continue
+                if alive is not None and node not in alive:
+                    self._dead_members.add((room, node))
+                    continue
+                targets[node].append(room)
+        return dict(targets)
+
+    def _stop_loading(self, room: str, log: list):
+        """Detach a finished load's delta log (lock held)"""
+        logs = [other for other in self._loading[room] if other is not log]
+        if logs:
+            self._loading[room] = logs
+        else:
+            del self._loading[room]
+
+    def publish(self, event: str, payload: Any, rooms: List[str], skip_sid: Optional[str] = None) -> int:
+        """Send an event to the other nodes with members. Returns the number of nodes"""
+        targets = self.route(rooms)
+        for node, node_rooms in targets.items():
+            redis_client.publish(node_channel(node), {
+                'event': event,
+                'payload': payload,
+                'rooms': node_rooms,
+                'skip_sid': skip_sid
+            })
+        self._count('deliveries_published', len(targets))
+        return len(targets)
+
+    def _on_message(self, channel: str, data: Any):
+        if channel == DELTAS_CHANNEL:
+            node = data.get('node')
+            if node == self.node_id:
+                return
+            if 'invalidate' in data:
+                self._apply_invalidations(data['invalidate'])
+                return
+            with self._lock:
+                for room in data.get('join', ()):
+                    cached = self._routes.get(room)
+                    if cached:
+                        cached[0].add(node)
+                    for log in self._loading.get(room, ()):
+                        log.append((True, node))
+                for room in data.get('leave', ()):
+                    cached = self._routes.get(room)
+                    if cached:
+                        cached[0].discard(node)
+                    for log in self._loading.get(room, ()):
+                        log.append((False, node))
+            self._count('deltas_received')
+            return
+
+        # Delivery addressed to this node: emit to local members only
+        self._count('deliveries_received')
+        if self._deliver is not None:
+            self._deliver(data['event'], data.get('payload'), data.get('rooms') or [], data.get('skip_sid'))
+
+    # Lifecycle
+    def bind(self, deliver):
+        """Local delivery callback for events routed to this node: deliver(event, payload, rooms, skip_sid)"""
+        self._deliver = deliver
+
+    def _ensure_started(self):
+        if self._listening:
+            return
+
+        with self._lock:
+            if self._listening:
+                return
+            self._listening = True
+
+        from flask import current_app
+        from app import socketio
+
+        self.heartbeat()
+        self._task = PeriodicTask('room-registry-heartbeat', self.heartbeat_interval, self.heartbeat)
+        self._task.ensure_started()
+        socketio.start_background_task(self._listen, current_app._get_current_object(), socketio)
+        logger.info(f"Room registry listening as node {self.node_id}")
+
+    def _listen(self, app, socketio):
+        channels = [DELTAS_CHANNEL, node_channel(self.node_id)]
+        while True:
+            with app.app_context():
+                redis_client.subscribe_to_events(channels, self._on_message)
+            # Deltas may have been missed while disconnected: reload routes and caches
+            with self._lock:
+                self._routes.clear()
+            self._apply_invalidations(None)
+            socketio.sleep(1)
+
+    def heartbeat(self):
+        """Announce this node, refresh the live node set and prune dead members"""
+        now = time.time()
+        pipe = redis_client.redis_client.pipeline(transaction=False)
+        pipe.zadd(NODES_KEY, {self.node_id: now})
+        pipe.zremrangebyscore(NODES_KEY, '-inf', now - self.heartbeat_interval * 20)
+        pipe.zrangebyscore(NODES_KEY, now - self.heartbeat_interval * 3, '+inf')
+        with self._lock:
+            dead, self._dead_members = self._dead_members, set()
+        for room, node in dead:
+            pipe.srem(room_members_key(room), node)
+        results = pipe.execute()
+        self._alive = set(results[2])
+
+    def _count(self, key: str, amount: int = 1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Registry counters for this node"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['node_id'] = self.node_id
+            stats['local_rooms'] = len(self._rooms)
+            stats['local_sessions'] = len(self._sid_rooms)
+            stats['cached_routes'] = len(self._routes)
+        stats['alive_nodes'] = len(self._alive) if self._alive is not None else None
+        return stats
+
+
+# Global registry for this worker
+room_registry = RoomRegistry()
@@ -145,6 +145,7 @@ class MessageSanitizer:
             'reply_to_id': self._validate_id_field,
             'attachment_url': self._validate_url_field,
             'message_type': self._validate_message_type,
+            'temp_id': self._validate_temp_id,
         }
         
         for field, validator in optional_fields.items():
@@ -179,6 +180,21 @@ class MessageSanitizer:
         
         return str_value, warnings
     
+    def _validate_temp_id(self, value: Any) -> tuple[Optional[str], List[str]]:
+        """Validate client temp id (UUID or similar, max 36 chars)"""
+        warnings = []
+        
+        if not value:
+            return None, warnings
+        
+        str_value = str(value)
+        
+        if len(str_value) > 36 or not re.match(r'^[a-zA-Z0-9_-]+$', str_value):
+            warnings.append(f"Invalid temp ID format: {str_value[:36]}")
+            return None, warnings
+        
+        return str_value, warnings
+    
     def _validate_url_field(self, value: Any) -> tuple[Optional[str], List[str]]:
         """Validate URL field"""
         warnings = []
@@ -251,4 +267,9 @@ def sanitize_message(text: str) -> tuple[str, List[str]]:
 
 def validate_message_data(data: Dict[str, Any]) -> tuple[Dict[str, Any], List[str]]:
     """Convenient function to validate message data"""
-    return sanitizer.validate_message_data(data)
\ No newline at end of file
+    return sanitizer.validate_message_data(data)
+
+def validate_temp_id(value: Any) -> Optional[str]:
+    """Convenient function to validate a client temp id (None if missing or invalid)"""
+    temp_id, _ = sanitizer._validate_temp_id(value)
+    return temp_id
\ No newline at end of file
@@ -0,0 +1,118 @@
+"""
+Serialization layer for realtime and pub/sub payloads.
+Uses orjson when installed (stdlib json otherwise) and supports
+pre-encoded fragments (RawJSON): a message is encoded once and the same
+bytes are spliced into every socket packet, pub/sub envelope and cache
+entry that carries it. orjson splices them natively (orjson.Fragment);
+only the stdlib fallback walks the payload to insert them.
+
+Optional binary frames encode a whole payload as msgpack (or orjson
+bytes if msgpack is not installed) for clients that opt in.
+"""
+import json
+import logging
+from typing import Any, Union
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# orjson.Fragment appeared in orjson 3.9
+ORJSON_FRAGMENTS = ORJSON_AVAILABLE and hasattr(orjson, 'Fragment')
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+class RawJSON:
+    """Already-encoded JSON value, spliced verbatim into the output"""
+    __slots__ = ('data', 'fragment')
+
+    def __init__(self, data: Union[str, bytes]):
+        self.data = data.decode('utf-8') if isinstance(data, bytes) else data
+        self.fragment = orjson.Fragment(self.data) if ORJSON_FRAGMENTS else None
+
+    def __repr__(self):
+        return f"RawJSON({self.data!r})"
+
+
+def _default(value):
+    if isinstance(value, RawJSON) and value.fragment is not None:
+        return value.fragment
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _dumps_plain(obj: Any) -> str:
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj, default=_default).decode('utf-8')
+    return json.dumps(obj, separators=(',', ':'), default=_default)
+
+
+def _dumps_fragments(obj: Any) -> str:
+    """stdlib fallback: walk containers and splice RawJSON fragments"""
+    if isinstance(obj, RawJSON):
+        return obj.data
+    if isinstance(obj, dict):
+        return '{' + ','.join(
+            _dumps_plain(str(key)) + ':' + _dumps_fragments(value) for key, value in obj.items()
+        ) + '}'
+    if isinstance(obj, (list, tuple)):
+        return '[' + ','.join(_dumps_fragments(value) for value in obj) + ']'
+    return _dumps_plain(obj)
+
+
+def dumps(obj: Any) -> str:
+    """Compact JSON string; RawJSON values are inserted as-is"""
+    if ORJSON_FRAGMENTS:
+        return _dumps_plain(obj)
+    try:
+        return _dumps_plain(obj)
+    except TypeError:
+        # Fragments (or a genuinely unserializable value, which raises again)
+        return _dumps_fragments(obj)
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    """Parse JSON from str or bytes"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def encode_binary(obj: Any) -> bytes:
+    """Binary frame payload (msgpack if available, otherwise JSON bytes)"""
+    if MSGPACK_AVAILABLE:
+        return msgpack.packb(_resolve_fragments(obj), default=_default, use_bin_type=True)
+    return dumps(obj).encode('utf-8')
+
+
+def _resolve_fragments(obj: Any) -> Any:
+    """Decode RawJSON fragments back to Python values (binary encoders need plain data)"""
+    if isinstance(obj, RawJSON):
+        return loads(obj.data)
+    if isinstance(obj, dict):
+        return {key: _resolve_fragments(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_resolve_fragments(value) for value in obj]
+    return obj
+
+
+class SocketIOJSON:
+    """json module replacement for python-socketio packets"""
+
+    @staticmethod
+    def dumps(obj, *args, **kwargs):
+        return dumps(obj)
+
+    @staticmethod
+    def loads(data, *args, **kwargs):
+        return loads(data)
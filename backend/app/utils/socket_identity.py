@@ -0,0 +1,61 @@
+"""
+Socket.IO session identity.
+At connect the authenticated user id and a small profile (active flag,
+role) are stored in the Socket.IO session, which lives in the worker that
+owns the socket. Event handlers read it locally through
+@socket_login_required, which sets request.current_user_id the same way
+login_required does for HTTP routes. The Redis socket:user:{sid} mapping
+is only consulted for sockets without a session identity (cross-node
+lookups).
+"""
+from functools import wraps
+from typing import Any, Dict, Optional
+
+from flask import request, session
+from flask_socketio import emit, disconnect
+
+from .redis_client import redis_client
+
+
+def remember_socket_user(user_id: int, is_active: bool = True, role: Optional[str] = None):
+    """Store the socket's identity in its Socket.IO session (call from connect)"""
+    session['user_id'] = user_id
+    session['user_profile'] = {'is_active': is_active, 'role': role}
+
+
+def get_socket_identity() -> Optional[Dict[str, Any]]:
+    """Identity of the current socket: session first, Redis as fallback"""
+    user_id = session.get('user_id')
+    if user_id is None:
+        user_id = redis_client.get_socket_user(request.sid)
+        if user_id is None:
+            return None
+        session['user_id'] = user_id
+
+    profile = session.get('user_profile') or {}
+    return {
+        'user_id': user_id,
+        'is_active': profile.get('is_active', True),
+        'role': profile.get('role'),
+    }
+
+
+def socket_login_required(f):
+    """Decorator for Socket.IO events: injects request.current_user_id/current_user_role"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        identity = get_socket_identity()
+        if identity is None:
+            emit('error', {'code': 'UNAUTHORIZED', 'message': 'Not authenticated'})
+            return None
+
+        if not identity['is_active']:
+            emit('error', {'code': 'USER_INACTIVE', 'message': 'User is not active'})
+            disconnect()
+            return None
+
+        request.current_user_id = identity['user_id']
+        request.current_user_role = identity['role']
+        return f(*args, **kwargs)
+
+    return decorated_function
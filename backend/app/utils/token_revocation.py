@@ -0,0 +1,212 @@
+"""
+JWT revocation list.
+
+Each revoked jti is its own Redis key (revoked:jti:{jti}) that expires
+together with the token, so the list only holds tokens that could still
+be used. Every worker keeps a Bloom filter of the revoked jtis:
+
+- revoke() writes the key and publishes the jti on tokens:revoked; all
+  workers add it to their filter.
+- is_revoked() answers from the filter. A miss (almost every token) is
+  final and costs no Redis call; a hit is confirmed with EXISTS, which
+  also rules out false positives and expired revocations.
+
+The filter is loaded with SCAN on first use and rebuilt periodically
+(dropping expired jtis); it is also rebuilt after the pub/sub listener
+reconnects, since revocations published meanwhile were missed. The
+listener and the periodic rebuild start even if the first load fails;
+until a load succeeds every jti is checked in Redis directly (retrying
+the load at most every `retry_interval` seconds), so a Redis blip at
+boot never leaves the worker with an empty filter.
+"""
+import math
+import time
+import hashlib
+import logging
+import threading
+from typing import Optional
+
+from . import serialization
+from .background import PeriodicTask
+from .redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+REVOKED_CHANNEL = 'tokens:revoked'
+
+
+def revoked_key(jti: str) -> str:
+    return f"revoked:jti:{jti}"
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter (double hashing over a 128-bit BLAKE2b digest)"""
+
+    def __init__(self, capacity: int = 100000, error_rate: float = 0.001):
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item: str):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class TokenRevocations:
+    """Per-jti revocation keys behind a process-local Bloom filter"""
+
+    def __init__(self, capacity: int = 100000, error_rate: float = 0.001, rebuild_interval: float = 3600,
+                 retry_interval: float = 5):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.rebuild_interval = rebuild_interval
+        self.retry_interval = retry_interval
+        self._filter = BloomFilter(capacity, error_rate)
+        self._next_filter = None  # filter being rebuilt, also receives new jtis
+        self._local = {}  # jti -> exp, only without Redis (single process)
+        self._lock = threading.Lock()
+        self._started = False     # listener and periodic rebuild running
+        self._loaded = False      # filter loaded at least once
+        self._next_load_at = 0.0  # next load attempt while not loaded
+        self._task = None
+        self.stats = {'filter_misses': 0, 'confirmed': 0, 'false_positives': 0, 'revoked': 0, 'rebuilds': 0,
+                      'unfiltered': 0, 'load_failures': 0}
+
+    def revoke(self, jti: str, expires_at: Optional[float] = None, ttl_seconds: int = 86400) -> bool:
+        """Revoke a jti until expires_at (the token's exp) or for ttl_seconds"""
+        ttl = int(math.ceil(expires_at - time.time())) if expires_at else ttl_seconds
+        if ttl <= 0:
+            return True  # Already expired: nothing to revoke
+
+        with self._lock:
+            self._add(jti)
+            self.stats['revoked'] += 1
+
+        if redis_client.redis_client is None:
+            with self._lock:
+                self._local[jti] = time.time() + ttl
+            return True
+
+        pipe = redis_client.write_pipeline()
+        pipe.set(revoked_key(jti), 1, ex=ttl)
+        pipe.publish(REVOKED_CHANNEL, serialization.dumps({'jti': jti}))
+        pipe.execute()
+        return True
+
+    def is_revoked(self, jti: str) -> bool:
+        """Filter first; Redis only to confirm a filter hit (or for every jti until the filter loads)"""
+        self._ensure_loaded()
+        if not self._loaded:
+            self.stats['unfiltered'] += 1
+        elif jti not in self._filter:
+            self.stats['filter_misses'] += 1
+            return False
+
+        if redis_client.redis_client is None:
+            with self._lock:
+                revoked = self._local.get(jti, 0) > time.time()
+        else:
+            revoked = bool(redis_client.redis_client.exists(revoked_key(jti)))
+
+        with self._lock:
+            self.stats['confirmed' if revoked else 'false_positives'] += 1
+        return revoked
+
+    # Filter maintenance
+    def _add(self, jti: str):
+        """Add to the live filter and to the one being rebuilt (lock held)"""
+        self._filter.add(jti)
+        if self._next_filter is not None:
+            self._next_filter.add(jti)
+
+    def rebuild(self):
+        """Reload the filter from the live revocation keys (drops expired jtis)"""
+        bloom = BloomFilter(self.capacity, self.error_rate)
+        with self._lock:
+            self._next_filter = bloom
+        if redis_client.redis_client is None:
+            now = time.time()
+            with self._lock:
+                self._local = {jti: exp for jti, exp in self._local.items() if exp > now}
+                for jti in self._local:
+                    bloom.add(jti)
+        else:
+            prefix = len(revoked_key(''))
+            try:
+                jtis = [key[prefix:] for key in redis_client.redis_client.scan_iter(match=revoked_key('*'), count=1000)]
+            except Exception:
+                with self._lock:
+                    self._next_filter = None
+                raise
+            with self._lock:
+                for jti in jtis:
+                    bloom.add(jti)
+
+        if bloom.count > self.capacity:
+            logger.warning(f"Revocation filter over capacity ({bloom.count} > {self.capacity}): "
+                           f"more tokens will be confirmed in Redis")
+        with self._lock:
+            self._filter = bloom
+            self._next_filter = None
+            self._loaded = True
+            self.stats['rebuilds'] += 1
+
+    def _on_revoked(self, channel: str, data):
+        jti = data.get('jti') if isinstance(data, dict) else None
+        if jti:
+            with self._lock:
+                self._add(jti)
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+
+        now = time.time()
+        with self._lock:
+            if self._loaded or now < self._next_load_at:
+                return
+            self._next_load_at = now + self.retry_interval
+            start = not self._started
+            self._started = True
+
+        # Listener first, so no revocation published during the load is missed
+        if start and redis_client.redis_client is not None:
+            from flask import current_app
+            from app import socketio
+
+            self._task = PeriodicTask('token-revocation-rebuild', self.rebuild_interval, self.rebuild)
+            self._task.ensure_started()
+            socketio.start_background_task(self._listen, current_app._get_current_object(), socketio)
+
+        try:
+            self.rebuild()
+        except Exception as e:
+            with self._lock:
+                self.stats['load_failures'] += 1
+            logger.error(f"Revocation filter load failed, checking Redis directly until it loads: {e}")
+
+    def _listen(self, app, socketio):
+        while True:
+            with app.app_context():
+                redis_client.subscribe_to_events([REVOKED_CHANNEL], self._on_revoked)
+                # Revocations published while disconnected were missed
+                try:
+                    self.rebuild()
+                except Exception as e:
+                    logger.error(f"Revocation filter rebuild failed: {e}")
+            socketio.sleep(1)
+
+
+# Global revocation list
+token_revocations = TokenRevocations()
@@ -0,0 +1,96 @@
+"""
+Typing indicator engine.
+Clients send typing events on every keystroke; the engine keeps a
+per-(conversation, user) state with a TTL and only reports transitions:
+  - start: user was not typing (or the state expired)
+  - stop:  user was typing and stopped explicitly
+  - repeat of start after `repeat_window`, so receivers that time out
+    the indicator keep showing it during long messages
+Everything else is suppressed. States that are not refreshed within the
+TTL are collected by expire() so the caller can emit the stop.
+State is node-local: the typing events of a socket always reach the
+same worker.
+"""
+import time
+import threading
+from collections import defaultdict
+from typing import Dict, List, NamedTuple, Optional
+
+START = 'start'
+STOP = 'stop'
+
+
+class TypingState(NamedTuple):
+    conversation_id: int
+    user_id: int
+    other_user_id: int
+    kind: str            # 'dm' (dm:typing) or 'legacy' (typing)
+    expires_at: float
+    last_emit_at: float
+
+
+class TypingEngine:
+    """Per-(conversation, user) typing state with transition detection"""
+
+    def __init__(self, ttl: float = 6.0, repeat_window: float = 2.5):
+        self.ttl = ttl
+        self.repeat_window = repeat_window
+        self._states: Dict[tuple, TypingState] = {}
+        self._lock = threading.Lock()
+        self._stats = defaultdict(int)
+
+    def update(self, conversation_id: int, user_id: int, other_user_id: int,
+               is_typing: bool, kind: str = 'dm') -> Optional[str]:
+        """
+        Apply a typing event.
+        Returns START or STOP when the receiver must be notified, None otherwise.
+        """
+        key = (conversation_id, user_id)
+        now = time.time()
+
+        with self._lock:
+            self._stats['events'] += 1
+            state = self._states.get(key)
+            if state and state.expires_at <= now:
+                state = None
+
+            if not is_typing:
+                if not state:
+                    self._states.pop(key, None)
+                    self._stats['suppressed'] += 1
+                    return None
+                del self._states[key]
+                self._stats['emitted'] += 1
+                return STOP
+
+            if state and now - state.last_emit_at < self.repeat_window:
+                self._states[key] = state._replace(expires_at=now + self.ttl)
+                self._stats['suppressed'] += 1
+                return None
+
+            self._states[key] = TypingState(
+                conversation_id, user_id, other_user_id, kind, now + self.ttl, now
+            )
+            self._stats['emitted'] += 1
+            return START
+
+    def expire(self) -> List[TypingState]:
+        """Remove and return states whose TTL passed (caller emits the stop)"""
+        now = time.time()
+        with self._lock:
+            expired = [state for state in self._states.values() if state.expires_at <= now]
+            for state in expired:
+                del self._states[(state.conversation_id, state.user_id)]
+            self._stats['expired'] += len(expired)
+        return expired
+
+    def get_stats(self) -> Dict[str, int]:
+        """Event counters and number of active typing states"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['active'] = len(self._states)
+        return stats
+
+
+# Global typing engine
+typing_engine = TypingEngine()
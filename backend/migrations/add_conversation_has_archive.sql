@@ -0,0 +1,5 @@
+-- Migración: Marca de historial archivado por conversación
+-- Descripción: `flask message-retention` la pone en true al mover mensajes al
+-- archivo; la lectura de mensajes solo abre el archivo de esas conversaciones.
+
+ALTER TABLE conversations ADD COLUMN IF NOT EXISTS has_archive BOOLEAN NOT NULL DEFAULT false;
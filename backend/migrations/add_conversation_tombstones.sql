@@ -0,0 +1,15 @@
+-- Migración: Conversaciones borradas por unmatch
+-- Descripción: El unmatch borra la conversación; esta fila queda para que
+-- /api/messages/sync la informe en deleted_conversations.
+
+CREATE TABLE IF NOT EXISTS conversation_tombstones (
+    id SERIAL PRIMARY KEY,
+    conversation_id INTEGER NOT NULL,
+    user1_id INTEGER NOT NULL,
+    user2_id INTEGER NOT NULL,
+    deleted_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS ix_conversation_tombstones_user1_id ON conversation_tombstones(user1_id);
+CREATE INDEX IF NOT EXISTS ix_conversation_tombstones_user2_id ON conversation_tombstones(user2_id);
+CREATE INDEX IF NOT EXISTS ix_conversation_tombstones_deleted_at ON conversation_tombstones(deleted_at);
@@ -0,0 +1,15 @@
+-- Migración: Índice de búsqueda full-text para mensajes
+-- Descripción: Columna tsvector + índice GIN mantenidos por trigger en cada INSERT/UPDATE.
+-- Las filas existentes se indexan con: flask backfill-search-index
+
+-- Columna con el documento de búsqueda
+ALTER TABLE messages ADD COLUMN IF NOT EXISTS search_vector tsvector;
+
+-- Índice invertido para consultas @@
+CREATE INDEX IF NOT EXISTS ix_messages_search_vector ON messages USING GIN (search_vector);
+
+-- Indexar al insertar o editar el texto
+DROP TRIGGER IF EXISTS messages_search_vector_update ON messages;
+CREATE TRIGGER messages_search_vector_update
+BEFORE INSERT OR UPDATE OF text ON messages
+FOR EACH ROW EXECUTE FUNCTION tsvector_update_trigger(search_vector, 'pg_catalog.simple', text);
@@ -0,0 +1,26 @@
+-- Migración: Seguimiento de entregas de notificaciones
+-- Descripción: Una fila por notificación y canal (push/email/sms) con estado,
+-- intentos y próximo reintento. La escribe y actualiza `flask notification-worker`.
+
+CREATE TABLE IF NOT EXISTS notification_deliveries (
+    id SERIAL PRIMARY KEY,
+    notification_id INTEGER NOT NULL REFERENCES notifications(id) ON DELETE CASCADE,
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    channel VARCHAR(20) NOT NULL,
+    provider VARCHAR(20) NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP,
+    last_error VARCHAR(200),
+    created_at TIMESTAMP DEFAULT NOW(),
+    delivered_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS ix_notification_deliveries_notification_id ON notification_deliveries(notification_id);
+
+-- Reintentos vencidos
+CREATE INDEX IF NOT EXISTS ix_notification_deliveries_due ON notification_deliveries(status, next_attempt_at);
+
+-- Entrada del stream que originó cada notificación: un lote reclamado no se duplica
+ALTER TABLE notifications ADD COLUMN IF NOT EXISTS source VARCHAR(64);
+CREATE UNIQUE INDEX IF NOT EXISTS uq_notifications_source ON notifications(source, user_id, type);
@@ -0,0 +1,11 @@
+-- Migración: temp ids de idempotencia únicos por emisor
+-- Descripción: messages.client_temp_id era único global, así que dos usuarios que
+-- generaban el mismo temp id chocaban (IntegrityError -> MESSAGE_FAILED).
+-- La restricción pasa a (sender_id, client_temp_id); su índice también sirve
+-- para buscar el mensaje existente de un reintento.
+
+ALTER TABLE messages DROP CONSTRAINT IF EXISTS messages_client_temp_id_key;
+DROP INDEX IF EXISTS ix_messages_client_temp_id;
+
+ALTER TABLE messages
+    ADD CONSTRAINT uq_messages_sender_temp_id UNIQUE (sender_id, client_temp_id);
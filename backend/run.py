@@ -2,6 +2,7 @@
 Script principal para ejecutar la aplicación en desarrollo
 """
 import os
+import click
 from app import create_app, db, socketio
 from app.models import User, UserRole
 
@@ -46,6 +47,73 @@ def init_db():
     
     print("Base de datos inicializada correctamente")
 
+@app.cli.command()
+@click.option('--batch-size', default=1000, help='Mensajes por lote')
+def backfill_search_index(batch_size):
+    """Indexar mensajes existentes para la búsqueda full-text"""
+    from app.services.message_search import MessageSearchService
+    
+    total = MessageSearchService.backfill(
+        batch_size=batch_size,
+        progress=lambda count: print(f"  {count} mensajes indexados...")
+    )
+    print(f"✓ Índice de búsqueda actualizado ({total} mensajes)")
+
+@app.cli.command()
+@click.option('--grace-days', type=int, default=None, help='Días antes de purgar mensajes borrados')
+@click.option('--archive-after-days', type=int, default=None, help='Antigüedad para archivar mensajes')
+@click.option('--batch-size', type=int, default=None, help='Mensajes por lote')
+def message_retention(grace_days, archive_after_days, batch_size):
+    """Purgar mensajes borrados y archivar historial viejo"""
+    from app.services.message_retention import MessageRetentionService
+    
+    try:
+        result = MessageRetentionService.run(
+            grace_days=grace_days,
+            archive_after_days=archive_after_days,
+            batch_size=batch_size,
+            progress=lambda stage, count: print(f"  {count} mensajes ({stage})...")
+        )
+    except RuntimeError as e:
+        print(f"✗ Retención interrumpida: {e}")
+        raise SystemExit(1)
+    print(f"✓ Retención completada: {result['purged']} purgados, {result['archived']} archivados")
+
+@app.cli.command()
+def realtime_dispatcher():
+    """Consumir el stream realtime y emitir a Socket.IO (REALTIME_DISPATCH_MODE=dispatcher)"""
+    from app.utils.realtime_delivery import RealtimeDelivery
+    from app.utils.realtime_dispatcher import RealtimeDispatcher
+    
+    # Sin sockets propios: deliver() publica a los nodos con miembros vía room_registry
+    dispatcher = RealtimeDispatcher(
+        RealtimeDelivery(),
+        batch_size=app.config['REALTIME_DISPATCH_BATCH_SIZE']
+    )
+    
+    print("✓ Dispatcher realtime consumiendo events:realtime (Ctrl+C para detener)")
+    try:
+        dispatcher.run()
+    except KeyboardInterrupt:
+        dispatcher.stop()
+    print(f"Dispatcher detenido: {dispatcher.get_stats()}")
+
+@app.cli.command()
+def notification_worker():
+    """Consumir events:messages y events:notifications y enviar notificaciones"""
+    from app.services.notification_events import NotificationEvents
+    from app.services.notification_pipeline import get_notification_pipeline
+    
+    consumer = NotificationEvents.consumer()
+    print("✓ Worker de notificaciones consumiendo events:messages y events:notifications (Ctrl+C para detener)")
+    try:
+        # Entre lotes: reenviar entregas con reintento vencido
+        consumer.run(tick=NotificationEvents.retry_due)
+    except KeyboardInterrupt:
+        pass
+    print(f"Worker detenido: {consumer.stats}")
+    print(f"Notificaciones: {get_notification_pipeline().get_stats()}")
+
 if __name__ == '__main__':
     # Obtener puerto del entorno o usar 5000 por defecto
     port = int(os.environ.get('PORT', 5000))
@@ -76,6 +144,11 @@ if __name__ == '__main__':
         except Exception as e:
             print(f"Compatibility check failed: {e}")
     
+    # users.is_online que quedó en true tras un crash (y reconciliación periódica)
+    from app.utils.presence import presence
+    with app.app_context():
+        presence.start_reconciliation()
+    
     # Ejecutar con SocketIO para soporte de WebSocket
     socketio.run(app, 
                  host='0.0.0.0', 
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Prueba de punta a punta del pipeline de notificaciones contra el gateway
+de push falso (scripts/fake_push_server.py), sobre SQLite en memoria.
+
+Verifica:
+  - un lote de eventos -> filas de Notification/NotificationDelivery en un commit
+  - push agrupado: una request al proveedor para todo el lote
+  - token muerto (UNREGISTERED) -> entrega 'failed' y fcm_token borrado
+  - fallo transitorio -> 'retrying' con backoff; retry_due() lo reenvía
+  - gateway caído (503) -> todo el lote queda para reintento
+  - lote reclamado (worker caído tras el commit) -> sin duplicados; las
+    entregas 'pending' abandonadas las retoma retry_due() al vencer
+
+Sale con código 1 si algún chequeo falla.
+
+    python scripts/check_notification_pipeline.py
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datetime import datetime, timedelta
+
+from app import create_app, db
+from app.models import User, UserPreference, Match, Conversation, Message, Notification, NotificationDelivery
+from app.services.notification_events import NotificationEvents, MESSAGES_STREAM, NOTIFICATIONS_STREAM
+from app.services.notification_pipeline import NotificationPipeline
+import app.services.notification_pipeline as notification_pipeline_module
+from fake_push_server import FakePushServer
+
+
+def seed(tokens):
+    """Un emisor y un receptor offline por token"""
+    sender = User(google_id='np-sender', email='np-sender@example.com', name='Emisor',
+                  nickname='emisor', is_active=True, is_online=True)
+    db.session.add(sender)
+    receivers = []
+    for i, token in enumerate(tokens):
+        user = User(google_id=f'np-{i}', email=f'np{i}@example.com', name=f'Receptor {i}',
+                    nickname=f'receptor{i}', is_active=True, is_online=False)
+        user.preferences = UserPreference(fcm_token=token)
+        db.session.add(user)
+        receivers.append(user)
+    db.session.commit()
+
+    messages = []
+    for receiver in receivers:
+        Match.create_match(sender.id, receiver.id)
+        Match.create_match(receiver.id, sender.id)
+        db.session.commit()
+        conversation = Conversation.get_or_create_conversation(sender.id, receiver.id)
+        message = Message(conversation_id=conversation.id, sender_id=sender.id,
+                          receiver_id=receiver.id, text='Hola! Vamos al parque?')
+        db.session.add(message)
+        messages.append(message)
+    db.session.commit()
+    return sender, receivers, messages
+
+
+def statuses():
+    counts = {}
+    for delivery in NotificationDelivery.query.all():
+        counts[delivery.status] = counts.get(delivery.status, 0) + 1
+    return counts
+
+
+def main():
+    server = FakePushServer().start()
+    app = create_app('testing')
+    app.config['PUSH_FCM_URL'] = server.url
+    failures = []
+
+    def check(condition, description):
+        print(f"[{'OK' if condition else 'ERROR'}] {description}")
+        if not condition:
+            failures.append(description)
+
+    with app.app_context():
+        db.create_all()
+        pipeline = NotificationPipeline.from_config(app.config)
+        notification_pipeline_module._pipeline = pipeline
+
+        tokens = ['ok-1', 'ok-2', 'ok-3', 'invalid-1', 'flaky-1', None]
+        sender, receivers, messages = seed(tokens)
+
+        # 1. Lote de mensajes nuevos + un match, como los entrega el consumer
+        NotificationEvents.handle(MESSAGES_STREAM, [(None, {
+            'type': 'message.created',
+            'message_id': message.id,
+            'conversation_id': message.conversation_id,
+            'sender_id': sender.id,
+            'receiver_id': message.receiver_id
+        }) for message in messages])
+        NotificationEvents.handle(NOTIFICATIONS_STREAM, [(None, {
+            'type': 'match.created',
+            'user_ids': [receivers[0].id, receivers[1].id]
+        })])
+
+        check(Notification.query.count() == len(messages) + 2,
+              f"{Notification.query.count()} notificaciones guardadas ({len(messages)} mensajes + 2 del match)")
+        check(server.requests == 2, f"{server.requests} requests al gateway (una por lote)")
+        current = statuses()
+        print(f"[INFO] Entregas: {current}")
+        check(current.get('sent') == 5, "5 push entregados (3 mensajes + 2 del match)")
+        check(current.get('failed') == 1, "token muerto marcado como failed")
+        check(current.get('retrying') == 1, "fallo transitorio queda en retrying")
+        check(current.get('skipped') == 1, "usuario sin token: skipped")
+        check(db.session.get(User, receivers[3].id).preferences.fcm_token is None, "fcm_token muerto borrado")
+
+        # 2. Reintento vencido
+        retrying = NotificationDelivery.query.filter_by(status='retrying').one()
+        check(retrying.next_attempt_at > datetime.utcnow(), "reintento programado con backoff")
+        check(NotificationEvents.retry_due() == 0, "retry_due no toma entregas antes de tiempo")
+        retrying.next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+        check(NotificationEvents.retry_due() == 1, "retry_due reenvía la entrega vencida")
+        delivery = db.session.get(NotificationDelivery, retrying.id)
+        check(delivery.status == 'sent' and delivery.attempts == 2, "entregada en el segundo intento")
+
+        # 3. Gateway caído: todo el lote a reintento (respetando Retry-After)
+        server.fail_requests = server.requests + 1
+        server.retry_after = 120
+        NotificationEvents.handle(NOTIFICATIONS_STREAM, [(None, {
+            'type': 'match.created',
+            'user_ids': [receivers[1].id, receivers[2].id]
+        })])
+        pending = NotificationDelivery.query.filter_by(status='retrying').all()
+        check(len(pending) == 2, f"{len(pending)} entregas en retrying tras el 503")
+        check(all(d.next_attempt_at >= datetime.utcnow() + timedelta(seconds=110) for d in pending),
+              "Retry-After respetado")
+
+        # 4. Worker caído entre el commit y el envío; el lote se reclama
+        server.fail_requests = 0
+        batch = [(f'{1700000000000 + i}-0', {
+            'type': 'message.created',
+            'message_id': message.id,
+            'conversation_id': message.conversation_id,
+            'sender_id': sender.id,
+            'receiver_id': message.receiver_id
+        }) for i, message in enumerate(messages[:3])]
+        deliver = pipeline.deliver
+        pipeline.deliver = lambda *args, **kwargs: None
+        NotificationEvents.handle(MESSAGES_STREAM, batch)
+        pipeline.deliver = deliver
+        saved = Notification.query.count()
+        NotificationEvents.handle(MESSAGES_STREAM, batch)
+        check(Notification.query.count() == saved, "lote reclamado sin notificaciones duplicadas")
+        abandoned = NotificationDelivery.query.filter_by(status='pending').all()
+        check(len(abandoned) == 3, f"{len(abandoned)} entregas pending abandonadas")
+        check(NotificationEvents.retry_due() == 0, "retry_due respeta el plazo de las pending")
+        for delivery in abandoned:
+            delivery.next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+        check(NotificationEvents.retry_due() == 3, "retry_due retoma las pending vencidas")
+        check(statuses().get('pending', 0) == 0, "ninguna entrega queda en pending")
+
+        print(f"[INFO] Pipeline: {pipeline.get_stats()}")
+
+    server.stop()
+    if failures:
+        return 1
+    print("[OK] Pipeline de notificaciones verificado")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Verificación de la lista de revocación de JWT (filtro Bloom + Redis).
+
+Usa el Redis de REDIS_URL si responde; si no, fakeredis (si está instalado).
+
+Verifica:
+  - primera carga fallida (SCAN con error): el jti revocado se confirma
+    igual en Redis, el listener y el rebuild periódico quedan corriendo
+  - la carga se reintenta y el filtro queda cargado
+  - con el filtro cargado, un jti no revocado no consulta Redis
+  - revoke() llega al filtro de otro worker por pub/sub
+
+Sale con código 1 si algún chequeo falla.
+
+    python scripts/check_token_revocation.py
+"""
+import sys
+import os
+import time
+import uuid
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import redis
+
+from app import create_app
+from app.utils.redis_client import redis_client
+from app.utils.token_revocation import TokenRevocations, revoked_key
+
+
+class FlakyScan:
+    """Cliente Redis cuyo primer SCAN falla (blip de Redis al arrancar)"""
+
+    def __init__(self, client):
+        self._client = client
+        self.scan_failures = 1
+
+    def scan_iter(self, *args, **kwargs):
+        if self.scan_failures:
+            self.scan_failures -= 1
+            raise redis.ConnectionError('simulated Redis blip')
+        return self._client.scan_iter(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+class CountingExists:
+    """Cuenta los EXISTS (confirmaciones en Redis)"""
+
+    def __init__(self, client):
+        self._client = client
+        self.exists_calls = 0
+
+    def exists(self, *keys):
+        self.exists_calls += 1
+        return self._client.exists(*keys)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def connect():
+    url = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+    try:
+        client = redis.from_url(url, decode_responses=True)
+        client.ping()
+        return client
+    except redis.RedisError:
+        pass
+    try:
+        import fakeredis
+    except ImportError:
+        return None
+    print("[INFO] Redis no disponible, usando fakeredis")
+    return fakeredis.FakeRedis(decode_responses=True)
+
+
+def main():
+    client = connect()
+    if client is None:
+        print("[ERROR] Se necesita Redis (REDIS_URL) o fakeredis")
+        return 1
+
+    app = create_app('testing')
+    failures = []
+
+    def check(condition, description):
+        print(f"[{'OK' if condition else 'ERROR'}] {description}")
+        if not condition:
+            failures.append(description)
+
+    with app.app_context():
+        revoked_jti = f"check-{uuid.uuid4().hex}"
+        client.set(revoked_key(revoked_jti), 1, ex=300)
+
+        # 1. Primera carga fallida
+        flaky = FlakyScan(client)
+        redis_client.redis_client = flaky
+        revocations = TokenRevocations(rebuild_interval=3600, retry_interval=0.2)
+        check(revocations.is_revoked(revoked_jti), "jti revocado detectado aunque la primera carga falló")
+        check(revocations.stats['load_failures'] == 1, "fallo de carga registrado")
+        check(revocations._started and revocations._task is not None,
+              "listener y rebuild periódico iniciados tras el fallo")
+        check(not revocations.is_revoked(f"other-{uuid.uuid4().hex}"),
+              "jti no revocado aceptado (confirmado en Redis)")
+
+        # 2. Reintento: el filtro queda cargado
+        time.sleep(0.3)
+        check(revocations.is_revoked(revoked_jti), "jti revocado detectado tras el reintento")
+        check(revocations._loaded, "filtro cargado en el reintento")
+
+        # 3. Con el filtro cargado, los jti no revocados no van a Redis
+        counting = CountingExists(client)
+        redis_client.redis_client = counting
+        for _ in range(100):
+            revocations.is_revoked(f"fresh-{uuid.uuid4().hex}")
+        check(counting.exists_calls <= 1, f"{counting.exists_calls} EXISTS para 100 jti no revocados")
+
+        # 4. Revocación publicada desde otro worker
+        other_worker = TokenRevocations()
+        other_worker._loaded = True
+        new_jti = f"new-{uuid.uuid4().hex}"
+        time.sleep(0.5)  # listener suscripto
+        other_worker.revoke(new_jti, ttl_seconds=300)
+        deadline = time.time() + 3
+        while new_jti not in revocations._filter and time.time() < deadline:
+            time.sleep(0.05)
+        check(new_jti in revocations._filter, "revocación recibida por pub/sub")
+        check(revocations.is_revoked(new_jti), "jti revocado por otro worker detectado")
+
+        client.delete(revoked_key(revoked_jti), revoked_key(new_jti))
+        print(f"[INFO] Stats: {revocations.stats}")
+
+    if failures:
+        return 1
+    print("[OK] Lista de revocación verificada")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Gateway de push falso para pruebas locales del worker de notificaciones.
+
+Habla el protocolo de app/utils/push_gateway.py (POST con un lote de
+mensajes, un resultado por mensaje) y simula los casos del proveedor:
+
+  - tokens que empiezan con 'invalid' -> UNREGISTERED (token muerto)
+  - tokens que empiezan con 'flaky'   -> UNAVAILABLE la primera vez, después ok
+  - --fail-requests N                 -> las primeras N requests responden 503
+  - --latency-ms                      -> demora por request
+
+    python scripts/fake_push_server.py --port 8765
+    PUSH_FCM_URL=http://127.0.0.1:8765/send flask notification-worker
+"""
+import sys
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakePushServer:
+    """Servidor en un thread; guarda los lotes recibidos para inspeccionarlos"""
+
+    def __init__(self, host='127.0.0.1', port=0, fail_requests=0, latency_ms=0, retry_after=None):
+        self.fail_requests = fail_requests
+        self.latency_ms = latency_ms
+        self.retry_after = retry_after
+        self.batches = []
+        self.requests = 0
+        self._seen_flaky = set()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/send"
+
+    @property
+    def delivered(self):
+        """Mensajes aceptados (ok) en total"""
+        with self._lock:
+            return sum(1 for batch in self.batches for result in batch['results'] if result.get('ok'))
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def respond(self, payload):
+        """(status, body, headers) para un lote"""
+        with self._lock:
+            self.requests += 1
+            if self.requests <= self.fail_requests:
+                headers = {'Retry-After': str(self.retry_after)} if self.retry_after else {}
+                return 503, {'error': 'unavailable'}, headers
+
+            results = []
+            for message in payload.get('messages', []):
+                token = message.get('token') or ''
+                if token.startswith('invalid'):
+                    results.append({'ok': False, 'error': 'UNREGISTERED'})
+                elif token.startswith('flaky') and token not in self._seen_flaky:
+                    self._seen_flaky.add(token)
+                    results.append({'ok': False, 'error': 'UNAVAILABLE'})
+                else:
+                    results.append({'ok': True})
+            self.batches.append({'provider': payload.get('provider'), 'messages': payload.get('messages', []),
+                                 'results': results})
+            return 200, {'results': results}, {}
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                try:
+                    payload = json.loads(self.rfile.read(length) or b'{}')
+                except ValueError:
+                    self._send(400, {'error': 'invalid json'}, {})
+                    return
+                if server.latency_ms:
+                    time.sleep(server.latency_ms / 1000)
+                self._send(*server.respond(payload))
+
+            def _send(self, status, body, headers):
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Gateway de push falso')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--fail-requests', type=int, default=0, help='Primeras N requests responden 503')
+    parser.add_argument('--retry-after', type=int, default=None, help='Retry-After (s) en las respuestas 503')
+    parser.add_argument('--latency-ms', type=int, default=0, help='Demora por request')
+    args = parser.parse_args()
+
+    server = FakePushServer(args.host, args.port, args.fail_requests, args.latency_ms, args.retry_after).start()
+    print(f"✓ Gateway de push falso en {server.url} (Ctrl+C para detener)")
+    try:
+        while True:
+            time.sleep(5)
+            print(f"  {server.requests} requests, {server.delivered} mensajes entregados")
+    except KeyboardInterrupt:
+        server.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+Prueba de carga del chat en tiempo real (Socket.IO).
+
+Crea usuarios de prueba en bloque (pares con match mutuo y conversación),
+genera sus realtime tokens con generate_tokens y conecta un cliente
+python-socketio por usuario. Cada cliente entra a su conversación y envía
+dm:send / dm:read / dm:typing a las tasas configuradas.
+
+Mide:
+  - latencia envío -> dm:ack (emisor)
+  - latencia envío -> dm:new (receptor)
+  - errores (connect_error, eventos 'error', acks perdidos)
+  - RSS del servidor (--server-pid; psutil si está instalado, si no /proc)
+
+Todo corre en local. El servidor usa el fallback en memoria si no hay
+REDIS_URL, o un Redis local. El control de admisión limita los connects
+por IP, así que el servidor tiene que arrancar con límites altos:
+
+    WS_CONNECT_IP_LIMIT=100000/60 WS_CONNECT_USER_LIMIT=1000/60 \\
+    WS_MAX_SOCKETS_PER_WORKER=20000 python run.py
+
+    python scripts/load_test_chat.py --users 1000 --duration 60 \\
+        --send-rate 0.2 --server-pid <pid del servidor>
+
+El script usa la misma DATABASE_URL que el servidor para crear los datos.
+Con transporte websocket hace falta websocket-client (pip install
+websocket-client); sin él usar --transport polling.
+"""
+import sys
+import os
+import time
+import uuid
+import random
+import argparse
+import threading
+from collections import defaultdict
+from datetime import datetime
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import socketio
+
+from app import create_app, db
+from app.models.user import User
+from app.models.match import Match
+from app.models.message import Conversation
+from app.utils.auth import generate_tokens
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Prueba de carga del chat Socket.IO')
+    parser.add_argument('--url', default=os.environ.get('LOAD_TEST_URL', 'http://localhost:5000'))
+    parser.add_argument('--users', type=int, default=100, help='usuarios simulados (se usan de a pares)')
+    parser.add_argument('--duration', type=float, default=30, help='segundos de carga tras conectar')
+    parser.add_argument('--ramp', type=float, default=50, help='conexiones nuevas por segundo')
+    parser.add_argument('--send-rate', type=float, default=0.2, help='dm:send por segundo y usuario')
+    parser.add_argument('--read-rate', type=float, default=0.1, help='dm:read por segundo y usuario')
+    parser.add_argument('--typing-rate', type=float, default=0.3, help='dm:typing por segundo y usuario')
+    parser.add_argument('--ack-timeout', type=float, default=10, help='segundos hasta dar un ack por perdido')
+    parser.add_argument('--transport', choices=['websocket', 'polling'], default='websocket')
+    parser.add_argument('--prefix', default='loadtest', help='prefijo de los usuarios de prueba')
+    parser.add_argument('--server-pid', type=int, help='PID del servidor para medir su RSS')
+    parser.add_argument('--setup-only', action='store_true', help='solo crear usuarios/matches/conversaciones')
+    return parser.parse_args()
+
+
+def setup_users(app, count, prefix):
+    """Crear (o reutilizar) usuarios, matches mutuos y conversaciones en bloque"""
+    count -= count % 2
+    with app.app_context():
+        emails = [f"{prefix}-{i}@loadtest.local" for i in range(count)]
+        existing = {user.email: user for user in User.query.filter(User.email.in_(emails)).all()}
+
+        new_users = [
+            User(
+                google_id=f"{prefix}-{i}",
+                email=email,
+                name=f"Load {i}",
+                nickname=f"{prefix}{i}",
+                is_active=True,
+                onboarded=True
+            )
+            for i, email in enumerate(emails) if email not in existing
+        ]
+        db.session.add_all(new_users)
+        db.session.flush()
+        for user in new_users:
+            existing[user.email] = user
+        user_ids = [existing[email].id for email in emails]
+
+        pairs = [(user_ids[i], user_ids[i + 1]) for i in range(0, count, 2)]
+        now = datetime.utcnow()
+
+        # Matches en ambas direcciones, ya mutuos
+        matched = {
+            (row.user_id, row.matched_user_id)
+            for row in db.session.query(Match.user_id, Match.matched_user_id)
+            .filter(Match.user_id.in_(user_ids)).all()
+        }
+        db.session.add_all([
+            Match(user_id=a, matched_user_id=b, match_type='manual', is_mutual=True, mutual_at=now)
+            for x, y in pairs for a, b in ((x, y), (y, x)) if (a, b) not in matched
+        ])
+
+        # Conversaciones 1:1 (user1_id < user2_id)
+        conversations = {
+            (row.user1_id, row.user2_id): row.id
+            for row in db.session.query(Conversation.id, Conversation.user1_id, Conversation.user2_id)
+            .filter(Conversation.user1_id.in_(user_ids), Conversation.is_deleted == False).all()
+        }
+        new_conversations = [
+            Conversation(user1_id=min(x, y), user2_id=max(x, y), current_key_version=1)
+            for x, y in pairs if (min(x, y), max(x, y)) not in conversations
+        ]
+        db.session.add_all(new_conversations)
+        db.session.flush()
+        for conversation in new_conversations:
+            conversations[(conversation.user1_id, conversation.user2_id)] = conversation.id
+        db.session.commit()
+
+        users = []
+        for index, user_id in enumerate(user_ids):
+            peer_id = user_ids[index ^ 1]
+            users.append({
+                'user_id': user_id,
+                'peer_id': peer_id,
+                'conversation_id': conversations[(min(user_id, peer_id), max(user_id, peer_id))],
+                'token': generate_tokens(user_id)['realtime_token']
+            })
+
+    print(f"[OK] {len(users)} usuarios, {len(pairs)} conversaciones ({len(new_users)} usuarios nuevos)")
+    return users
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(pct / 100.0 * len(values))) - 1))
+    return values[index]
+
+
+class LoadStats:
+    """Contadores y latencias compartidos por todos los clientes"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = defaultdict(int)
+        self.errors = defaultdict(int)
+        self.ack_latency = []
+        self.delivery_latency = []
+        self.pending_ack = {}       # tempId -> instante de envío
+        self.pending_delivery = {}  # tempId -> instante de envío
+
+    def count(self, key, amount=1):
+        with self.lock:
+            self.counters[key] += amount
+
+    def error(self, code):
+        with self.lock:
+            self.errors[code] += 1
+
+    def sent(self, temp_id):
+        with self.lock:
+            self.pending_ack[temp_id] = self.pending_delivery[temp_id] = time.perf_counter()
+            self.counters['sent'] += 1
+
+    def acked(self, temp_id):
+        now = time.perf_counter()
+        with self.lock:
+            started = self.pending_ack.pop(temp_id, None)
+            if started is None:
+                return
+            self.ack_latency.append((now - started) * 1000)
+            self.counters['acked'] += 1
+
+    def delivered(self, temp_id):
+        now = time.perf_counter()
+        with self.lock:
+            started = self.pending_delivery.pop(temp_id, None)
+            if started is None:
+                return
+            self.delivery_latency.append((now - started) * 1000)
+            self.counters['delivered'] += 1
+
+    def expire(self, timeout):
+        """Descartar envíos sin dm:ack / dm:new después de `timeout` segundos"""
+        cutoff = time.perf_counter() - timeout
+        with self.lock:
+            for key, pending in (('ack_lost', self.pending_ack), ('lost', self.pending_delivery)):
+                expired = [temp_id for temp_id, started in pending.items() if started < cutoff]
+                for temp_id in expired:
+                    del pending[temp_id]
+                self.counters[key] += len(expired)
+
+
+class RssSampler(threading.Thread):
+    """Muestreo periódico del RSS de un proceso (MB)"""
+
+    def __init__(self, pid, interval=1.0):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+
+    def read_rss(self):
+        if psutil is not None:
+            return psutil.Process(self.pid).memory_info().rss / (1024 * 1024)
+        with open(f"/proc/{self.pid}/status") as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+        return None
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                rss = self.read_rss()
+            except (OSError, ValueError) as e:
+                print(f"[WARN] No se puede leer el RSS de {self.pid}: {e}")
+                return
+            if rss is not None:
+                self.samples.append(rss)
+            self._stop.wait(self.interval)
+
+    def stop(self):
+        self._stop.set()
+
+
+class SimulatedUser:
+    """Un usuario del chat: un cliente Socket.IO y su hilo de tráfico"""
+
+    def __init__(self, profile, args, stats):
+        self.profile = profile
+        self.args = args
+        self.stats = stats
+        self.conversation_id = profile['conversation_id']
+        self.last_message_id = None
+        self.joined = threading.Event()
+        self.client = socketio.Client(reconnection=False)
+        self._register_handlers()
+
+    def _register_handlers(self):
+        client = self.client
+
+        @client.event
+        def connect_error(data):
+            code = data.get('code') if isinstance(data, dict) else str(data)
+            self.stats.error(f"connect:{code}")
+
+        @client.event
+        def disconnect():
+            self.stats.count('disconnected')
+
+        @client.on('dm:joined')
+        def on_joined(data):
+            self.joined.set()
+
+        @client.on('dm:ack')
+        def on_ack(data):
+            self.stats.acked(data.get('tempId'))
+            self.last_message_id = data.get('serverId') or self.last_message_id
+
+        @client.on('dm:new')
+        def on_new(data):
+            message = data.get('message') or {}
+            if message.get('sender_id') == self.profile['user_id']:
+                return
+            text = message.get('text') or ''
+            if text.startswith('lt:'):
+                self.stats.delivered(text[3:])
+            self.last_message_id = message.get('id') or self.last_message_id
+
+        @client.on('error')
+        def on_error(data):
+            self.stats.error(data.get('code', 'UNKNOWN') if isinstance(data, dict) else 'UNKNOWN')
+
+    def connect(self):
+        try:
+            self.client.connect(
+                self.args.url,
+                auth={'token': self.profile['token']},
+                transports=[self.args.transport],
+                wait_timeout=10
+            )
+        except socketio.exceptions.ConnectionError:
+            self.stats.count('connect_failed')
+            return False
+        self.stats.count('connected')
+        self.client.emit('dm:join', {'conversationId': self.conversation_id})
+        return True
+
+    def run(self, deadline):
+        """Tráfico con llegadas de Poisson para cada tipo de evento"""
+        if not self.joined.wait(10):
+            self.stats.error('JOIN_TIMEOUT')
+            return
+
+        rates = {
+            'send': self.args.send_rate,
+            'read': self.args.read_rate,
+            'typing': self.args.typing_rate,
+        }
+        rates = {kind: rate for kind, rate in rates.items() if rate > 0}
+        total = sum(rates.values())
+        if not total:
+            return
+        kinds, weights = list(rates), list(rates.values())
+
+        while self.client.connected:
+            wait = random.expovariate(total)
+            if time.time() + wait >= deadline:
+                return
+            time.sleep(wait)
+            try:
+                self.emit(random.choices(kinds, weights)[0])
+            except socketio.exceptions.BadNamespaceError:
+                return
+
+    def emit(self, kind):
+        if kind == 'send':
+            temp_id = uuid.uuid4().hex
+            self.stats.sent(temp_id)
+            self.client.emit('dm:send', {
+                'conversationId': self.conversation_id,
+                'tempId': temp_id,
+                'text': f"lt:{temp_id}"
+            })
+        elif kind == 'read':
+            if self.last_message_id:
+                self.client.emit('dm:read', {
+                    'conversationId': self.conversation_id,
+                    'upToMessageId': self.last_message_id
+                })
+                self.stats.count('reads')
+        else:
+            self.client.emit('dm:typing', {'conversationId': self.conversation_id, 'isTyping': True})
+            self.stats.count('typing')
+
+    def close(self):
+        if self.client.connected:
+            self.client.disconnect()
+
+
+def format_latency(values):
+    if not values:
+        return 'sin datos'
+    parts = [f"p{pct}={percentile(values, pct):.1f}ms" for pct in (50, 90, 95, 99)]
+    return ' '.join(parts) + f" max={max(values):.1f}ms (n={len(values)})"
+
+
+def report(stats, rss, elapsed):
+    counters, errors = stats.counters, stats.errors
+    attempts = counters['sent'] + counters['connected'] + counters['connect_failed']
+    total_errors = sum(errors.values()) + counters['connect_failed'] + counters['ack_lost'] + counters['lost']
+
+    print("\n===== Resultados =====")
+    print(f"Duración: {elapsed:.1f}s")
+    print(f"Conexiones: {counters['connected']} ok, {counters['connect_failed']} fallidas, "
+          f"{counters['disconnected']} desconexiones")
+    print(f"dm:send: {counters['sent']} enviados, {counters['acked']} ack "
+          f"({counters['ack_lost']} sin ack), {counters['delivered']} entregados "
+          f"({counters['lost']} perdidos) "
+          f"({counters['sent'] / elapsed:.1f} msg/s)")
+    print(f"dm:read: {counters['reads']}  dm:typing: {counters['typing']}")
+    print(f"Latencia envío -> dm:ack: {format_latency(stats.ack_latency)}")
+    print(f"Latencia envío -> dm:new: {format_latency(stats.delivery_latency)}")
+    rate = total_errors / attempts * 100 if attempts else 0
+    print(f"Errores: {total_errors} ({rate:.2f}%)")
+    for code, amount in sorted(errors.items(), key=lambda item: -item[1]):
+        print(f"  {code}: {amount}")
+    if rss is not None and rss.samples:
+        print(f"RSS servidor: inicio={rss.samples[0]:.1f}MB max={max(rss.samples):.1f}MB "
+              f"fin={rss.samples[-1]:.1f}MB")
+
+
+def run_load_test(args, profiles):
+    """Conectar los clientes con rampa, generar tráfico y reportar"""
+    stats = LoadStats()
+    rss = None
+    if args.server_pid:
+        rss = RssSampler(args.server_pid)
+        rss.start()
+
+    users = []
+    print(f"[...] Conectando {len(profiles)} clientes a {args.url} ({args.ramp}/s)")
+    for profile in profiles:
+        user = SimulatedUser(profile, args, stats)
+        if user.connect():
+            users.append(user)
+        time.sleep(1.0 / args.ramp)
+    print(f"[OK] {len(users)} clientes conectados, generando tráfico {args.duration}s")
+
+    started = time.time()
+    deadline = started + args.duration
+    threads = [threading.Thread(target=user.run, args=(deadline,), daemon=True) for user in users]
+    for thread in threads:
+        thread.start()
+
+    while time.time() < deadline:
+        time.sleep(1)
+        stats.expire(args.ack_timeout)
+
+    # Esperar los mensajes en vuelo antes de contar pérdidas
+    for thread in threads:
+        thread.join(timeout=1)
+    time.sleep(min(args.ack_timeout, 2))
+    stats.expire(0)
+    elapsed = time.time() - started
+
+    for user in users:
+        user.close()
+    if rss is not None:
+        rss.stop()
+
+    report(stats, rss, elapsed)
+
+
+def main():
+    args = parse_args()
+    app = create_app()
+    profiles = setup_users(app, args.users, args.prefix)
+    if args.setup_only:
+        return
+    run_load_test(args, profiles)
+
+
+if __name__ == '__main__':
+    main()
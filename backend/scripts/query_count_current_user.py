@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Conteo de queries SQL al cargar el usuario actual.
+
+Compara, sobre una base SQLite en memoria (config 'testing'):
+  - el acceso "ingenuo": User.query.get + UserPreference.query + carga
+    lazy de user.dog, repetido por cada capa que necesita el usuario
+  - load_current_user() / load_user(): una sola query por request con
+    dog y preferences cargados juntos
+  - las rutas que usan el cargador (/api/users/me, /api/auth/me,
+    /api/matches/suggestions)
+
+Sale con código 1 si el cargador hace más queries de las esperadas.
+
+    python scripts/query_count_current_user.py
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from contextlib import contextmanager
+from sqlalchemy import event
+
+from app import create_app, db
+from app.models import User, Dog, UserPreference
+from app.utils.auth import generate_tokens
+from app.utils.current_user import load_current_user, load_user
+
+
+@contextmanager
+def count_queries(engine):
+    """Cuenta las sentencias SQL ejecutadas dentro del bloque"""
+    counter = {'queries': 0}
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        counter['queries'] += 1
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def seed_users(count=3):
+    """Usuarios activos con perro y preferencias"""
+    users = []
+    for i in range(count):
+        user = User(
+            google_id=f'qc-{i}', email=f'qc{i}@example.com', name=f'Usuario {i}',
+            nickname=f'qc{i}', age=30, is_active=True, allow_matching=True, onboarded=True
+        )
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(Dog(user_id=user.id, name=f'Perro {i}', breed='Mestizo', size='medium'))
+        db.session.add(UserPreference(user_id=user.id, interests=['paseos', 'juegos']))
+        users.append(user)
+    db.session.commit()
+    return users
+
+
+def naive_request(user_id, layers):
+    """Patrón anterior: cada capa vuelve a consultar usuario, preferencias y perro"""
+    for _ in range(layers):
+        user = User.query.get(user_id)
+        UserPreference.query.filter_by(user_id=user.id).first()
+        user.dog
+        db.session.expire_all()  # Cada capa veía filas recién leídas
+
+
+def loader_request(app, user_id, layers):
+    """Mismo acceso con el cargador por request"""
+    from flask import request
+
+    with app.test_request_context('/'):
+        request.current_user_id = user_id
+        for _ in range(layers):
+            user = load_current_user()
+            load_user(user_id)
+            user.preferences
+            user.dog
+
+
+def main():
+    app = create_app('testing')
+    failures = []
+
+    # Sin app context abierto: cada request tiene su propio g y su sesión
+    with app.app_context():
+        db.create_all()
+        user_id = seed_users()[0].id
+        engine = db.engine
+    layers = 3  # decorador + ruta + servicio
+
+    with app.app_context(), count_queries(engine) as naive:
+        naive_request(user_id, layers)
+
+    with count_queries(engine) as loader:
+        loader_request(app, user_id, layers)
+
+    print(f"[INFO] Acceso ingenuo ({layers} capas): {naive['queries']} queries")
+    print(f"[INFO] load_current_user ({layers} capas): {loader['queries']} queries")
+    if loader['queries'] != 1:
+        failures.append(f"load_current_user hizo {loader['queries']} queries (esperado 1)")
+
+    client = app.test_client()
+    with app.app_context():
+        headers = {'Authorization': f"Bearer {generate_tokens(user_id)['access_token']}"}
+    expected = {
+        '/api/users/me': 1,
+        '/api/auth/me': 1,
+    }
+    for path in ('/api/users/me', '/api/auth/me', '/api/matches/suggestions'):
+        client.get(path, headers=headers)  # Calienta cachés de token y estado
+        with count_queries(engine) as endpoint:
+            response = client.get(path, headers=headers)
+        print(f"[INFO] GET {path}: {response.status_code}, {endpoint['queries']} queries")
+        if response.status_code != 200:
+            failures.append(f"GET {path} respondió {response.status_code}")
+        if path in expected and endpoint['queries'] > expected[path]:
+            failures.append(f"GET {path} hizo {endpoint['queries']} queries (esperado {expected[path]})")
+
+    if failures:
+        for failure in failures:
+            print(f"[ERROR] {failure}")
+        return 1
+
+    print("[OK] El usuario actual se carga una sola vez por request")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -31,6 +31,14 @@ with app.app_context():
             print("⚠ Las tablas no existen aún")
     except Exception as e:
         print(f"Error verificando/creando datos: {e}")
+    
+    # users.is_online que quedó en true tras un crash (y reconciliación periódica)
+    try:
+        from app.utils.presence import presence
+        cleared = presence.start_reconciliation()
+        print(f"✓ Presencia reconciliada ({cleared} usuarios marcados offline)")
+    except Exception as e:
+        print(f"Error reconciliando presencia: {e}")
 
 if __name__ == "__main__":
     socketio.run(app)
\ No newline at end of file